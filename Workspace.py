@@ -1,9 +1,28 @@
 import streamlit as st
 import pandas as pd
+import time
+from processing import cubes
+from processing import documents
+from processing import groupings
+from processing import ingest
+from processing import resources
 from processing import processor
+from processing import similarity
+from storage import jobs
+from storage import runs
 from summary import summary
 from visuals import visualize
 
+# Uploads larger than this are parsed in chunks to bound parser memory
+CHUNKED_READ_BYTES = 50 * 1024 * 1024
+CHUNK_ROWS = 100_000
+
+# Seconds between checks on a running analysis
+JOB_POLL_SECONDS = 2.0
+
+# Several clusters are summarized per request, cutting the number of model calls
+SUMMARY_MODE = 'batched'
+
 def reset_session_state():
     """Resets the session state variables."""
     st.session_state.update({
@@ -19,9 +38,147 @@ def reset_session_state():
         'topic': None
     })
 
+    # Drop the results of the previous analysis; saved runs can still be reopened from the home page
+    for key in ['processed_dfs', 'summaries', 'group_results', 'run_id', 'job_id']:
+        st.session_state.pop(key, None)
+    st.query_params.pop('job', None)
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def load_columns(file_id, _uploaded_file, columns, categorical=()):
+    """Reads the selected columns of an upload once per file and column selection."""
+    # The responses column is free text, so it is never converted to a categorical
+    categorical = [column for column in categorical if column != columns[0]]
+    chunksize = CHUNK_ROWS if _uploaded_file.size > CHUNKED_READ_BYTES else None
+    return ingest.read_columns(_uploaded_file, list(columns), categorical=categorical, chunksize=chunksize)
+
+
+@st.cache_resource(show_spinner=False)
+def start_workers():
+    """Starts the analysis workers once when the app boots, so they are warmed up by the first analysis."""
+    # Searches embedded and indexed in the app share the host's threads with the running analyses
+    resources.set_job_counter(lambda: max(1, jobs.running_jobs()))
+    return jobs.start_workers()
+
+
+def show_server_status():
+    """Lists the analysis workers in the sidebar with their warm-up time."""
+    with st.sidebar.expander("Server status"):
+        workers = jobs.list_workers()
+        if not workers:
+            st.caption("No analysis workers are running.")
+        for worker in workers:
+            warm_up = worker['timings'].get('warm_up')
+            warm_up_text = f", warmed up in {warm_up['last']:.1f} s" if warm_up else ""
+            threads = worker.get('gauges', {}).get('threads')
+            threads_text = f", using {threads['threads']} of {threads['budget']} threads" if threads and threads['threads'] else ""
+            st.caption(f"Worker {worker['slot'] + 1}: {worker['state']}{warm_up_text}{threads_text}, {worker['jobs_run']} analyses run")
+
+
+@st.cache_resource(show_spinner="Loading the search index...", max_entries=2)
+def load_search_index(run_id, _raw_embeddings):
+    """Loads a run's search index once per process, building and saving it for runs saved without one."""
+    index = runs.load_index(run_id)
+    if index is None:
+        index = similarity.build_index(_raw_embeddings)
+        # A run deleted from the store meanwhile cannot keep the index, so only this process uses it
+        runs.save_index(run_id, index)
+    similarity.warm_up(index)
+    return index
+
+
+def show_similar_responses(run_id, processed_dfs, summaries):
+    """Searches the run's responses by meaning, from a typed phrase or from a selected response."""
+    st.markdown("### Find similar responses")
+    query = st.text_input("Type a phrase to find the responses closest in meaning:", key='similarity_query')
+    if not query:
+        return
+
+    index = load_search_index(run_id, processed_dfs['embeddings'])
+    labels_df = processed_dfs['labels_df']
+    titles = summaries['cluster_summary'].set_index('cluster')['Title']
+
+    def show(results, key):
+        table = results.assign(topic=results['cluster'].map(titles).fillna("Unclustered"))
+        return st.dataframe(
+            table[['responses', 'topic', 'similarity']], key=key, on_select='rerun', selection_mode='single-row',
+            column_config={'similarity': st.column_config.ProgressColumn("similarity", min_value=0.0, max_value=1.0, format="%.2f")}
+        )
+
+    with st.spinner("Searching..."):
+        results = similarity.similar_responses(index, labels_df, similarity.embed_query(query))
+    st.caption("Select a response to see the responses most similar to it.")
+    selection = show(results, 'similarity_results')
+
+    if selection.selection.rows:
+        position = results.index[selection.selection.rows[0]]
+        st.markdown(f"**Responses similar to:** {labels_df.at[position, 'responses']}")
+        show(similarity.similar_responses(index, labels_df, processed_dfs['embeddings'][position], exclude=position), 'similar_to_selection')
+
+
+def show_demographic_breakdown(processed_dfs, summaries):
+    """Shows the size and sentiment of every topic among the respondents matching demographic filters."""
+    cube = processed_dfs.get('cube')
+    if cube is None or not cubes.cube_demographics(cube):
+        return
+
+    st.markdown("### Topics by demographics")
+    demographics = cubes.cube_demographics(cube)
+    filters = {}
+    for column, demographic in zip(st.columns(len(demographics)), demographics):
+        filters[demographic] = column.multiselect(
+            demographic.capitalize(), cubes.cube_values(cube, demographic), key=f'demographic_filter_{demographic}', placeholder="All"
+        )
+
+    # Filtering the precomputed cube is instant, however many responses the survey has
+    topics = cubes.slice_cube(cube, filters)
+    if topics.empty:
+        st.info("No clustered responses match these filters.")
+        return
+
+    titles = summaries['cluster_summary'].set_index('cluster')['Title']
+    topics = topics.assign(
+        topic=topics['cluster'].map(titles).fillna("Untitled"), share=topics['count'] / topics['count'].sum()
+    ).sort_values('count', ascending=False)
+
+    st.caption(f"{int(topics['count'].sum()):,} clustered responses match.")
+    shares = ['share', 'positive', 'neutral', 'negative']
+    st.dataframe(
+        topics[['topic', 'count', *shares]], hide_index=True,
+        column_config={column: st.column_config.ProgressColumn(column, min_value=0.0, max_value=1.0, format="%.2f") for column in shares}
+    )
+
+
+def show_throughput(throughput):
+    """Reports how fast documents were chunked, embedded and clustered."""
+    st.caption(
+        f"Split {throughput['documents']:,} documents ({throughput['pages']:,.0f} pages) into {throughput['chunks']:,} passages "
+        f"and clustered them in {throughput['seconds']:.1f}s ({throughput['pages_per_sec']:,.1f} pages/sec)."
+    )
+
+
+def show_documents(processed_dfs, summaries):
+    """Lists analyzed documents with the topic most of their passages belong to."""
+    labels_df = processed_dfs['labels_df']
+    if 'document' not in labels_df.columns:
+        return
+
+    st.markdown("### Documents")
+    titles = summaries['cluster_summary'].set_index('cluster')['Title']
+    table = documents.aggregate_documents(labels_df)
+    table['main_topic'] = table['main_cluster'].map(titles).fillna("Unclustered")
+    st.dataframe(
+        table[['document', 'main_topic', 'main_share', 'topics', 'chunks', 'polarity']], hide_index=True,
+        column_config={
+            'main_share': st.column_config.ProgressColumn("share of passages", min_value=0.0, max_value=1.0, format="%.2f"),
+            'chunks': "passages",
+        }
+    )
+
 
 def main():
     """Main function to run the Streamlit app."""
+    start_workers()
 
     # Feedback Form in Sidebar
     st.sidebar.markdown("")
@@ -44,10 +201,19 @@ def main():
         else:
             st.sidebar.error("Please fill in all fields before submitting.")
 
+    show_server_status()
+
     # Initialize session state variables if not present
     if 'stage' not in st.session_state:
+        job_id = st.query_params.get('job')
         reset_session_state()
 
+        # A refreshed page picks up the analysis it had started
+        if jobs.exists(job_id):
+            st.session_state.job_id = job_id
+            st.session_state.stage = 'analyze_data'
+            st.query_params['job'] = job_id
+
     if st.session_state.stage == 'home':
 
         if "selected_button" not in st.session_state:
@@ -106,7 +272,67 @@ def main():
                 st.rerun()
             else:
                 st.warning("Please select an option before continuing.")
+
+        # Reopen a saved analysis without re-running it
+        saved_runs = runs.list_runs()
+        if saved_runs:
+            st.markdown('''
+            ### Previous Analyses
+            ''')
+            run_labels = {
+                f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(run['created']))} · "
+                f"{run['parameters'].get('topic') or 'No topic'} · {run['rows']} responses": run['run_id']
+                for run in saved_runs
+            }
+            selected_run = st.selectbox("Reopen a saved analysis", list(run_labels))
+            if st.button("Open"):
+                processed_dfs, summaries, manifest = runs.load_run(run_labels[selected_run])
+                st.session_state.processed_dfs = processed_dfs
+                st.session_state.summaries = summaries
+                st.session_state.topic = manifest['parameters'].get('topic')
+                st.session_state.run_id = manifest['run_id']
+                st.session_state.stage = 'dashboard'
+                st.rerun()
         
+    # **Documents Stage**
+    elif st.session_state.stage == 'Documents':
+
+        st.subheader("Document Topic Modeler")
+
+        st.markdown('''
+            The Document Topic Modeler finds the topics of long documents such as reports, transcripts or articles. Each document is
+            split into overlapping passages of a few sentences, the passages are clustered into topics and summarized, and each
+            document is described by the topics of its passages.
+            ''')
+
+        document_topic = st.text_input("In 1-5 words, describe what the documents are about:", key='documents_topic')
+        uploaded_files = st.file_uploader("Choose text files", type=['txt', 'md'], accept_multiple_files=True)
+
+        col1, col2 = st.columns([.13, 1.15])
+
+        with col1:
+            if st.button("Back"):
+                st.session_state.stage = 'home'
+                st.rerun()
+
+        with col2:
+            if st.button("Analyze"):
+                if not document_topic or len(document_topic.split()) > 5:
+                    st.warning("Describe the topic of the documents in 1-5 words.")
+                elif not uploaded_files:
+                    st.warning("Upload at least one document.")
+                else:
+                    st.session_state.topic = f"These documents are focused on '{document_topic.strip()}'."
+                    df = pd.DataFrame({
+                        'document': [file.name for file in uploaded_files],
+                        'text': [file.getvalue().decode('utf-8', errors='replace') for file in uploaded_files],
+                    })
+                    job_id = jobs.submit(df, st.session_state.topic, 'default', parameters={'summary_mode': SUMMARY_MODE, 'documents': True})
+                    st.session_state.job_id = job_id
+                    st.query_params['job'] = job_id
+                    st.session_state.stage = 'analyze_data'
+                    st.rerun()
+
     # **Upload Stage**
     elif st.session_state.stage == 'survey':
 
@@ -184,15 +410,8 @@ def main():
         
         if uploaded_file is not None:
             try:
-                df = pd.read_csv(uploaded_file)
-                if len(df) > 500:
-                    st.error(
-                        "This CSV has more than 500 rows of data"
-                    )
-                    return False
-                st.session_state.df = df
-                st.session_state.columns = df.columns.tolist()
-                st.success("Data uploaded successfully!")
+                # Only the header is parsed here; columns are read once they are selected
+                st.session_state.columns = ingest.sniff_columns(uploaded_file)
 
                 # Select Response Column
                 responses_column = st.selectbox(
@@ -206,12 +425,27 @@ def main():
                 if responses_column is None:
                     st.error("Please select a column for survey responses.")
                     return False
-                if responses_column not in df.columns :
+                if responses_column not in st.session_state.columns:
                     st.error(f"The selected column '{responses_column}' does not exist in the DataFrame.")
                     return False
-                if df[responses_column].dtype != 'object':
+
+                df, ingest_stats = load_columns(uploaded_file.file_id, uploaded_file, (responses_column,))
+                if len(df) > 500:
+                    st.error(
+                        "This CSV has more than 500 rows of data"
+                    )
+                    return False
+                if not ingest.is_text_column(df[responses_column]):
                     st.error(f"The column '{responses_column}' does not contain text data.")
                     return False
+                st.session_state.df = df
+                st.session_state.upload_id = uploaded_file.file_id
+                st.success("Data uploaded successfully!")
+                st.caption(
+                    f"Read {ingest_stats['rows']:,} rows in {ingest_stats['seconds']:.2f}s "
+                    f"({ingest_stats['rows_per_sec']:,.0f} rows/sec), {ingest_stats['memory_bytes'] / 1e6:.2f} MB in memory"
+                )
+
                 if responses_column is not None: 
                     st.session_state.responses_column = responses_column
                     st.success(f"Responses column selected: **{responses_column}**")
@@ -227,7 +461,9 @@ def main():
                         ''')
                 broad_grouping = st.selectbox("Select main grouping criterion", ['']+  st.session_state.columns)
                 if broad_grouping:
-                    unique_values = st.session_state.df[broad_grouping].nunique()
+                    df, _ = load_columns(uploaded_file.file_id, uploaded_file, (responses_column, broad_grouping), (broad_grouping,))
+                    st.session_state.df = df
+                    unique_values = df[broad_grouping].nunique()
                     if unique_values > 5:
                         st.error(f"The selected column '{broad_grouping}' has more than 5 unique values, which may be too computationally expensive for this prototype.")
                         return False  # Prevent proceeding if too many unique values
@@ -247,11 +483,41 @@ def main():
                         st.error('this is the same as your broader grouping')
                         return False
                     elif subgroup_by1:
+                        st.session_state.df, _ = load_columns(
+                            uploaded_file.file_id, uploaded_file,
+                            (responses_column, broad_grouping, subgroup_by1), (broad_grouping, subgroup_by1)
+                        )
                         st.session_state.survey_flow['sub'] = {'include': True, 'column': subgroup_by1}
+
+                st.markdown('''
+                    ##### Demographics
+                    Optionally select the columns holding the respondents' age, sex and ethnicity to filter the topics by them on the dashboard.
+                    ''')
+                demographic_options = [''] + [column for column in st.session_state.columns if column != responses_column]
+                for demographic in cubes.DEMOGRAPHICS:
+                    column = st.selectbox(f"Select the {demographic} column (optional)", demographic_options, key=f'demographic_{demographic}')
+                    st.session_state.demographics[demographic] = {'include': bool(column), 'column': column or None}
+
+                # Read every selected column at once; ages stay numeric so they can be banded
+                selected = [responses_column] + [
+                    flow['column'] for flow in [*st.session_state.survey_flow.values(), *st.session_state.demographics.values()] if flow['include']
+                ]
+                selected = tuple(dict.fromkeys(selected))
+                age_column = st.session_state.demographics['age']['column']
+                st.session_state.df, _ = load_columns(
+                    uploaded_file.file_id, uploaded_file, selected, tuple(column for column in selected[1:] if column != age_column)
+                )
                 
             except Exception as e:
                 st.error(f"Error processing file: {e}")
 
+        # Surveys exported again with more responses only need their new responses analyzed
+        st.session_state.incremental = st.checkbox(
+            "This is a new export of a survey analyzed before: only analyze the new responses",
+            value=st.session_state.get('incremental', False),
+            help="Responses already analyzed keep their clusters and summaries. The survey is analyzed from scratch now and then, or when it has grown a lot."
+        )
+
         # Adjust column widths to reduce the gap
         col1, col2 = st.columns([.13, 1.15])  # You can tweak these values for more precise spacing
 
@@ -289,6 +555,10 @@ def main():
         if sub['include'] and sub['column']:
             columns.append(sub['column'])
 
+        for demographic in st.session_state.demographics.values():
+            if demographic['include'] and demographic['column'] not in columns:
+                columns.append(demographic['column'])
+
         st.markdown( '''
                 ##### Overall Dataset
         ''')
@@ -301,35 +571,29 @@ def main():
                 ##### Grouped data
         ''')
 
-        if 'groupings' not in st.session_state:
+        if broad_grouping['include'] and broad_grouping['column']:
+            sub_column = sub['column'] if sub['include'] else None
+
+            # Group row positions are computed in one groupby and reused across reruns of the same upload
+            groupings_key = (st.session_state.get('upload_id'), broad_grouping['column'], sub_column)
+            if st.session_state.get('groupings_key') != groupings_key:
+                st.session_state.groupings = groupings.group_indices(df, broad_grouping['column'], sub_column)
+                st.session_state.groupings_key = groupings_key
+
+            for group, subsets in groupings.materialize(df, st.session_state.groupings).items():
+                if not sub_column:
+                    st.write(f"Group: {group}")
+                    st.write(subsets['broad_grouping'])
+                    continue
+
+                for subgroup, subgroups in subsets.items():
+                    if subgroup == 'broad_grouping':
+                        continue
+                    st.write(f"Group: {group}, Subgroup: {subgroup}")
+                    st.write(subgroups)
+        else:
             st.session_state.groupings = {}
-
-        unique_broad_grouping = df[broad_grouping['column']].unique()
-        # Iterate over the unique broad groupings
-        for group in unique_broad_grouping:
-            # Create a subset of the DataFrame for the current broad grouping
-            grouping = df[df[broad_grouping['column']] == group]
-            
-            # Save this subset to session state
-            st.session_state.groupings[group] = {'broad_grouping': grouping}
-
-            # Extract the unique values of the subgrouping column
-            unique_sub_grouping = df[sub['column']].unique()
-            
-            # Iterate over the unique subgrouping values
-            for subgroup in unique_sub_grouping:
-                # Create a subset for the current subgroup
-                subgroups = grouping[grouping[sub['column']] == subgroup]
-                
-                # Save the subgroup to session state
-                if group not in st.session_state.groupings:
-                    st.session_state.groupings[group] = {}
-
-                st.session_state.groupings[group][subgroup] = subgroups
-                
-                # Optionally, display the subgroups
-                st.write(f"Group: {group}, Subgroup: {subgroup}")
-                st.write(subgroups)
+            st.info("No grouping selected; the whole dataset will be analyzed together.")
 
 
         col1, col2 = st.columns([.13, 1.15])
@@ -391,37 +655,95 @@ def main():
             columns.append(ethnicity_column)
             rename_mapping[ethnicity_column] = 'ethnicity'
 
-        df = st.session_state.df[columns].rename(columns=rename_mapping)
+        # The analysis runs in a background worker; this page submits it and then polls its status
+        if 'processed_dfs' not in st.session_state or 'summaries' not in st.session_state:
+            job_id = st.session_state.get('job_id')
+            if job_id is None:
+                df = st.session_state.df[columns].rename(columns=rename_mapping)
+                group_positions = {
+                    str(group): subsets['broad_grouping'] for group, subsets in st.session_state.get('groupings', {}).items()
+                }
+                job_id = jobs.submit(
+                    df, st.session_state.get('topic', 'No topic specified'), 'default',
+                    parameters={'summary_mode': SUMMARY_MODE, **({'incremental': True} if st.session_state.get('incremental') else {})},
+                    groups=group_positions
+                )
+                st.session_state.job_id = job_id
+
+                # Keeping the job in the URL lets a refreshed page reattach to it
+                st.query_params['job'] = job_id
+
+            status = jobs.read_status(job_id)
+
+            if status['state'] in ['queued', 'running']:
+                step = max(status['step'], 1)
+                completed = step - 1
+                if step == 2 and status.get('clusters_total'):
+                    completed += status['clusters_done'] / status['clusters_total']
+                    st.caption(f"Summarized {status['clusters_done']} of {status['clusters_total']} clusters.")
+                st.progress(completed / status['steps'])
+                st.text(f"Step {step} of {status['steps']}: {status['message']}")
+                if status.get('throughput'):
+                    show_throughput(status['throughput'])
+                if status['state'] == 'queued':
+                    workers = jobs.list_workers()
+                    if not workers:
+                        st.error("No analysis workers are running, so the analysis cannot start. Check the worker log in the job store.")
+                    elif all(worker['state'] == 'warming' for worker in workers):
+                        st.caption("The analysis server is warming up; this only happens after a restart.")
+
+                if st.button("Cancel analysis"):
+                    jobs.cancel(job_id)
+                    st.rerun()
 
-        # Initialize progress bar and steps
-        progress_bar = st.progress(0)
-        progress_text = st.empty()  # Placeholder for progress updates
-        total_steps = 2
-        step = 0
+                # Draw the clusters as soon as they exist, with keyword labels until their summaries arrive
+                points, results = jobs.load_progress(job_id)
+                if points is not None:
+                    views = processor.build_views(points)
+                    visualize.VISUALIZE(summary.assemble_summaries(views, results, placeholder="Summarizing..."), views)
 
-        # Check if processing is already done
-        if 'processed_dfs' not in st.session_state or 'summaries' not in st.session_state:
-            try:
-                # Step 1: Data Processing
-                step += 1
-                progress_text.text(f"Step {step} of {total_steps}: Processing and clustering data...")
-                processed_dfs = processor.feature_engineering(df, detail='default')
-                st.session_state.processed_dfs = processed_dfs
-                progress_bar.progress(step / total_steps)
-                st.success("Data processed successfully!")
-
-                # Step 2: Cluster Summarization
-                step += 1
-                progress_text.text(f"Step {step} of {total_steps}: Summarizing clusters... This may take a few minutes please do not close the browser.")
-                topic = st.session_state.get('topic', 'No topic specified')
-                summaries = summary.SUMMARIZER(processed_dfs, topic=topic)
-                st.session_state.summaries = summaries
-                progress_bar.progress(step / total_steps)
-                st.success("Clusters summarized successfully!")
-            except Exception as e:
-                st.error(f"An error occurred: {e}")
-                progress_bar.empty()
+                time.sleep(JOB_POLL_SECONDS)
+                st.rerun()
+
+            # The job has finished, so it no longer needs to be tracked
+            st.session_state.pop('job_id', None)
+            st.query_params.pop('job', None)
+
+            if status['state'] == 'cancelled':
+                st.info("The analysis was cancelled.")
+                if st.button("Start Over"):
+                    reset_session_state()
+                    st.rerun()
                 return
+
+            if status['state'] == 'failed':
+                st.error(f"An error occurred: {status.get('error')}")
+
+                # Continue with the clusters that were summarized before the error, if any
+                points, results = jobs.load_progress(job_id, with_preview=False)
+                if points is None or not results:
+                    return
+                processed_dfs = processor.build_views(points)
+                processed_dfs['labels_df'] = points
+                processed_dfs['cube'] = cubes.build_cube(points)
+                summaries = summary.assemble_summaries(processed_dfs, results)
+                st.warning("Showing the clusters that were summarized before the error.")
+            else:
+                processed_dfs, summaries, group_results = jobs.load_result(job_id)
+                st.session_state.run_id = status['run_id']
+                st.session_state.group_results = group_results
+                if status.get('cached'):
+                    st.success("Loaded the results of an identical earlier analysis.")
+                else:
+                    st.success("Data processed and clusters summarized successfully!")
+                if status.get('throughput'):
+                    show_throughput(status['throughput'])
+                for label, group in group_results.items():
+                    if 'error' in group:
+                        st.warning(f"Group '{label}' could not be analyzed: {group['error']}")
+
+            st.session_state.processed_dfs = processed_dfs
+            st.session_state.summaries = summaries
         else:
             # If already processed, retrieve from session state
             processed_dfs = st.session_state.processed_dfs
@@ -435,10 +757,6 @@ def main():
         with st.expander("Show cluster summaries"):
             st.write(summaries['cluster_summary'])
 
-        # Finalize progress bar
-        progress_text.text("All steps completed!")
-        progress_bar.empty()
-
         # Transition to the dashboard
         if st.button("Go to Scatterplot"):
             with st.spinner("Loading visuals..."):
@@ -454,6 +772,20 @@ def main():
         processed_dfs = st.session_state.processed_dfs
         summaries = st.session_state.summaries
 
+        # Switch between the overall analysis and the per-group analyses
+        group_results = st.session_state.get('group_results', {})
+        run_key = st.session_state.get('run_id')
+        if group_results:
+            view = st.selectbox("Show topics for", ['All responses'] + list(group_results))
+            if view != 'All responses':
+                if 'error' in group_results[view]:
+                    st.warning(f"Group '{view}' could not be analyzed, showing all responses instead: {group_results[view]['error']}")
+                else:
+                    processed_dfs = group_results[view]['processed_dfs']
+                    summaries = group_results[view]['summaries']
+                    # Each group has its own figure
+                    run_key = run_key and f"{run_key}/{view}"
+
         # # Display the processed data
         # with st.expander("Show processed data"):
         #     st.write(st.session_state.processed_dfs['processed_df'])
@@ -479,12 +811,23 @@ def main():
 
         # Display the topic
         
+        # Large surveys are drawn from a sample or as hexagons unless every response is asked for
+        lod_labels = {'auto': "Automatic", 'full': "Every response", 'sample': "Sample of responses", 'hexbin': "Hexagon density"}
+        lod_mode = st.selectbox("Point detail", visualize.LOD_MODES, format_func=lod_labels.get, key='lod_mode')
+
         # Call the visualization function
         try:
-            visualize.VISUALIZE(summaries, processed_dfs)  # This renders the plot using st.plotly_chart inside VISUALIZE
+            visualize.VISUALIZE(summaries, processed_dfs, lod_mode, run_key=run_key)  # This renders the plot using st.plotly_chart inside VISUALIZE
         except Exception as e:
             st.error(f"An error occurred during visualization: {e}")
 
+        show_demographic_breakdown(processed_dfs, summaries)
+        show_documents(processed_dfs, summaries)
+
+        # Searches the whole survey, whichever group is shown above; partial results have no saved run to search
+        if st.session_state.get('run_id'):
+            show_similar_responses(st.session_state.run_id, st.session_state.processed_dfs, st.session_state.summaries)
+
         # Reset session state
         if st.button("Start Over"):
             reset_session_state()
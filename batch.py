@@ -0,0 +1,234 @@
+"""
+Headless batch runner for survey topic modeling.
+
+Runs the same clustering and summarization as the Streamlit workspace over one or
+many CSV files, e.g.
+
+    python batch.py exports/*.csv --responses-column Q12 --topic "Customer feedback" --output results/
+
+Each input gets its own folder of Parquet and JSON results, and progress is recorded
+in a manifest so an interrupted run can be resumed by rerunning the same command.
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from processing import embeddings
+from processing import ingest
+from processing import pipeline
+from summary import backends
+
+MANIFEST_NAME = 'manifest.json'
+
+SUMMARY_KEYS = ['cluster_summary', 'positive_cluster_summary', 'negative_cluster_summary']
+
+
+class RowBudget:
+    """
+    Limits how many response rows are being processed at once across all workers.
+    A single file larger than the budget is still allowed to run on its own.
+    """
+
+    def __init__(self, max_rows):
+        self.max_rows = max_rows
+        self.in_use = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, rows):
+        with self._condition:
+            self._condition.wait_for(lambda: self.in_use == 0 or self.in_use + rows <= self.max_rows)
+            self.in_use += rows
+
+    def release(self, rows):
+        with self._condition:
+            self.in_use -= rows
+            self._condition.notify_all()
+
+
+class Manifest:
+    """
+    Job manifest stored as JSON in the output folder, rewritten atomically after every update.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as file:
+                self.entries = json.load(file)['files']
+        else:
+            self.entries = {}
+
+    def is_done(self, source, fingerprint):
+        entry = self.entries.get(source)
+        if not entry or entry['status'] != 'done' or entry['fingerprint'] != fingerprint:
+            return False
+        return all(os.path.exists(path) for path in entry['outputs'].values())
+
+    def update(self, source, **fields):
+        with self._lock:
+            self.entries.setdefault(source, {}).update(fields)
+            temporary_path = self.path + '.tmp'
+            with open(temporary_path, 'w') as file:
+                json.dump({'files': self.entries}, file, indent=2)
+            os.replace(temporary_path, self.path)
+
+
+def file_fingerprint(path, options):
+    """
+    Hashes the file contents together with the options that affect its results.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def write_results(output_dir, processed_dfs, summaries):
+    """
+    Writes the processed responses and the cluster summaries as Parquet, plus a JSON copy of the summaries.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    outputs = {'processed': os.path.join(output_dir, 'processed.parquet')}
+    processed_dfs['processed_df'].to_parquet(outputs['processed'], index=False)
+
+    summaries_json = {}
+    for key in SUMMARY_KEYS:
+        outputs[key] = os.path.join(output_dir, f'{key}.parquet')
+        summaries[key].to_parquet(outputs[key], index=False)
+        summaries_json[key] = summaries[key].to_dict(orient='records')
+
+    outputs['summaries'] = os.path.join(output_dir, 'summaries.json')
+    with open(outputs['summaries'], 'w') as file:
+        json.dump(summaries_json, file, indent=2, default=str)
+
+    return outputs
+
+
+def process_file(source, args, output_dir, budget):
+    """
+    Reads one CSV, runs the pipeline on it and writes its results.
+
+    Returns:
+        tuple: (outputs, rows, seconds) where seconds is the time spent on the file from when
+               this call started, excluding any time it waited behind other files. A raised
+               exception carries the seconds spent before it as its `seconds` attribute.
+    """
+    started = time.perf_counter()
+    try:
+        demographics = {'age': args.age_column, 'sex': args.sex_column, 'ethnicity': args.ethnicity_column}
+        columns = [args.responses_column] + [column for column in demographics.values() if column]
+
+        df, stats = ingest.read_columns(source, columns, chunksize=args.chunksize)
+        print(f"Read {source}: {stats['rows']:,} rows at {stats['rows_per_sec']:,.0f} rows/sec, "
+              f"{stats['memory_bytes'] / 1e6:.2f} MB in memory")
+        df = pipeline.prepare_dataframe(df, args.responses_column, demographics)
+
+        rows = len(df)
+        budget.acquire(rows)
+        try:
+            processed_dfs, summaries = pipeline.run_pipeline(
+                df, topic=args.topic, detail=args.detail, summary_mode=args.summary_mode,
+                summary_backend=args.summary_backend
+            )
+        finally:
+            budget.release(rows)
+
+        outputs = write_results(output_dir, processed_dfs, summaries)
+    except Exception as e:
+        e.seconds = round(time.perf_counter() - started, 2)
+        raise
+
+    return outputs, rows, round(time.perf_counter() - started, 2)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run survey topic modeling over one or many CSV files.")
+    parser.add_argument('inputs', nargs='+', help="CSV files to process.")
+    parser.add_argument('--responses-column', required=True, help="Column containing the open-ended responses.")
+    parser.add_argument('--age-column', help="Column containing respondent age.")
+    parser.add_argument('--sex-column', help="Column containing respondent sex.")
+    parser.add_argument('--ethnicity-column', help="Column containing respondent ethnicity.")
+    parser.add_argument('--topic', required=True, help="Short description of the survey used to guide summarization.")
+    parser.add_argument('--detail', choices=['default', 'broad'], default='default', help="Clustering granularity.")
+    parser.add_argument('--summary-mode', choices=['sequential', 'parallel', 'batched', 'facets'], default='batched',
+                        help="Summarize clusters one at a time, all at once followed by a title deduplication pass, "
+                             "several clusters per request, or each cluster's overall, positive and negative "
+                             "responses in one request.")
+    parser.add_argument('--summary-backend', choices=list(backends.BACKENDS), default=backends.DEFAULT_BACKEND,
+                        help="Summarize clusters with the Gemini API, or label them offline with c-TF-IDF keywords.")
+    parser.add_argument('--output', default='results', help="Folder for results and the job manifest.")
+    parser.add_argument('--workers', type=int, default=2, help="Number of files processed concurrently.")
+    parser.add_argument('--max-rows', type=int, default=20000,
+                        help="Maximum number of responses processed at once across all workers.")
+    parser.add_argument('--chunksize', type=int, help="Read each CSV in chunks of this many rows.")
+    parser.add_argument('--force', action='store_true', help="Reprocess files already completed in the manifest.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    os.makedirs(args.output, exist_ok=True)
+    manifest = Manifest(os.path.join(args.output, MANIFEST_NAME))
+    budget = RowBudget(args.max_rows)
+
+    options = {
+        'responses_column': args.responses_column,
+        'age_column': args.age_column,
+        'sex_column': args.sex_column,
+        'ethnicity_column': args.ethnicity_column,
+        'topic': args.topic,
+        'detail': args.detail,
+        'summary_mode': args.summary_mode,
+        'summary_backend': args.summary_backend,
+    }
+
+    pending = {}
+    for source in args.inputs:
+        source = os.path.abspath(source)
+        fingerprint = file_fingerprint(source, options)
+        if not args.force and manifest.is_done(source, fingerprint):
+            print(f"Skipping {source} (already processed)")
+            continue
+        stem = os.path.splitext(os.path.basename(source))[0]
+        pending[source] = (fingerprint, os.path.join(args.output, f"{stem}-{fingerprint[:8]}"))
+
+    if not pending:
+        print("Nothing to do.")
+        return 0
+
+    # Load the embedding model once up front so every worker reuses it
+    embeddings.load_embedding_model()
+
+    failures = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {}
+        for source, (fingerprint, output_dir) in pending.items():
+            manifest.update(source, fingerprint=fingerprint, status='running', output_dir=output_dir, outputs={}, error=None)
+            futures[executor.submit(process_file, source, args, output_dir, budget)] = source
+
+        for future in as_completed(futures):
+            source = futures[future]
+            try:
+                outputs, rows, seconds = future.result()
+            except Exception as e:
+                failures += 1
+                manifest.update(source, status='failed', error=str(e), seconds=getattr(e, 'seconds', None))
+                print(f"Failed {source}: {e}")
+                continue
+            manifest.update(source, status='done', outputs=outputs, rows=rows, seconds=seconds)
+            print(f"Finished {source} ({rows} responses in {seconds}s)")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,91 @@
+"""
+Throughput of the document pipeline in pages per second.
+
+Generates synthetic documents on a few themes and times chunking alone, then chunking,
+embedding and clustering together, as a Documents analysis does before its summaries. For example
+
+    python benchmarks/document_profile.py --documents 200 --pages 5
+
+A page is WORDS_PER_PAGE words. The first run includes loading the embedding model.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processing import documents  # noqa: E402
+
+THEMES = [
+    "budget revenue spending deficit taxes forecast growth inflation".split(),
+    "students teachers classes exams curriculum attendance grades school".split(),
+    "patients doctors hospital treatment waiting nurses clinic care".split(),
+    "roads transit buses traffic cycling parking commute trains".split(),
+]
+FILLER = "the a of and to in that is was for on with as by it this".split()
+
+
+def synthetic_documents(count, pages, seed=0):
+    """
+    Returns `count` documents of about `pages` pages, each mostly about one theme.
+    """
+    rng = np.random.default_rng(seed)
+    words_per_sentence = 18
+    sentences = pages * documents.WORDS_PER_PAGE // words_per_sentence
+
+    texts = []
+    for number in range(count):
+        theme = THEMES[number % len(THEMES)]
+        words = np.where(
+            rng.random((sentences, words_per_sentence)) < 0.4,
+            rng.choice(theme, (sentences, words_per_sentence)),
+            rng.choice(FILLER, (sentences, words_per_sentence)),
+        )
+        texts.append(' '.join(' '.join(sentence).capitalize() + '.' for sentence in words))
+
+    return pd.DataFrame({'document': [f"document-{number}.txt" for number in range(count)], 'text': texts})
+
+
+def profile(count, pages):
+    """
+    Returns chunking and end-to-end throughput for synthetic documents.
+    """
+    df = synthetic_documents(count, pages)
+    total_pages = df['text'].str.split().str.len().sum() / documents.WORDS_PER_PAGE
+
+    start = time.perf_counter()
+    chunks = sum(1 for _ in documents.iter_chunks(zip(df['document'], df['text'])))
+    chunk_seconds = time.perf_counter() - start
+
+    throughput = documents.process_documents(df, detail='default')['throughput']
+    return {
+        'documents': count,
+        'pages': total_pages,
+        'chunks': chunks,
+        'chunk_pages_per_sec': total_pages / chunk_seconds,
+        'seconds': throughput['seconds'],
+        'pages_per_sec': throughput['pages_per_sec'],
+    }
+
+
+def report(result):
+    print(f"{result['documents']:,} documents, {result['pages']:,.0f} pages, {result['chunks']:,} chunks")
+    print(f"  chunking                   {result['chunk_pages_per_sec']:10,.0f} pages/sec")
+    print(f"  chunk, embed and cluster   {result['pages_per_sec']:10,.1f} pages/sec ({result['seconds']:.1f} s)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profile the throughput of the document pipeline.")
+    parser.add_argument('--documents', type=int, default=200, help="Number of documents.")
+    parser.add_argument('--pages', type=int, default=5, help="Pages per document.")
+    args = parser.parse_args(argv)
+
+    report(profile(args.documents, args.pages))
+
+
+if __name__ == '__main__':
+    main()
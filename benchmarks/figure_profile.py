@@ -0,0 +1,137 @@
+"""
+Size and build time of the cluster scatterplot.
+
+Builds the dashboard figure from synthetic clusters of several sizes with each level of detail,
+and reports the number of points sent to the browser, the size of the serialized figure, and
+the time to build and serialize it. The serialized size is what the browser has to download and
+parse; with WebGL the drawing itself is no longer the bottleneck, and it cannot be timed without
+a browser. Compare against an earlier revision with --baseline, e.g.
+
+    python benchmarks/figure_profile.py --baseline HEAD~1
+
+The baseline is checked out into a temporary git worktree, so the working tree is untouched.
+Figures are serialized with Plotly's standard JSON encoder even where orjson is installed, as
+the app does not require it.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the tree being profiled; st.plotly_chart is replaced to capture the figure
+PROFILE_SCRIPT = """
+import inspect, json, sys, time
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+import streamlit as st
+
+# orjson is not one of the app's requirements, so sizes are measured with Plotly's own encoder
+pio.json.config.default_engine = 'json'
+
+figures = []
+st.plotly_chart = lambda figure, **kwargs: figures.append(figure)
+st.caption = lambda *args, **kwargs: None
+
+from visuals import visualize
+
+def make_view(n_points, n_clusters, rng, sign):
+    centres = rng.normal(scale=10, size=(n_clusters, 2))
+    labels = rng.integers(0, n_clusters, n_points)
+    points = centres[labels] + rng.normal(size=(n_points, 2))
+    processed = pd.DataFrame({
+        'Umap_1': points[:, 0], 'Umap_2': points[:, 1], 'cluster': labels,
+        'polarity': sign * rng.random(n_points),
+        'responses': [f"Synthetic response number {i} about topic {label}" for i, label in enumerate(labels)],
+    })
+    summary = processed.groupby('cluster').agg(
+        Umap_1=('Umap_1', 'mean'), Umap_2=('Umap_2', 'mean'), count=('cluster', 'size'), Polarity=('polarity', 'mean')
+    ).reset_index()
+    summary['Title'] = "Cluster " + summary['cluster'].astype(str)
+    return processed, summary
+
+results = []
+for n_points in %(sizes)r:
+    rng = np.random.default_rng(0)
+    positive, positive_summary = make_view(n_points // 2, 20, rng, 1)
+    negative, negative_summary = make_view(n_points // 2, 20, rng, -1)
+    overall = pd.concat([positive, negative], ignore_index=True)
+    overall_summary = pd.concat([positive_summary, negative_summary], ignore_index=True)
+
+    modes = %(modes)r if 'lod_mode' in inspect.signature(visualize.VISUALIZE).parameters else [None]
+    for mode in modes:
+        summaries = {'positive_cluster_summary': positive_summary.copy(), 'negative_cluster_summary': negative_summary.copy(), 'cluster_summary': overall_summary.copy()}
+        dfs = {'positive_processed_df': positive.copy(), 'negative_processed_df': negative.copy(), 'processed_df': overall.copy()}
+
+        start = time.perf_counter()
+        visualize.VISUALIZE(summaries, dfs, *([mode] if mode else []))
+        build_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        serialized = figures[-1].to_json()
+        serialize_seconds = time.perf_counter() - start
+
+        results.append({
+            'points': n_points, 'mode': mode or 'original',
+            'drawn': sum(len(trace.x) for trace in figures[-1].data),
+            'trace_types': sorted({trace.type for trace in figures[-1].data}),
+            'megabytes': len(serialized) / 1e6, 'build_seconds': build_seconds, 'serialize_seconds': serialize_seconds,
+        })
+print(json.dumps(results))
+"""
+
+SIZES = [5_000, 20_000, 100_000]
+MODES = ['full', 'sample', 'hexbin']
+
+
+def profile(tree, sizes=SIZES, modes=MODES):
+    """
+    Returns one measurement per figure size and level of detail for the app in the given folder.
+    """
+    output = subprocess.run(
+        [sys.executable, '-c', PROFILE_SCRIPT % {'sizes': list(sizes), 'modes': list(modes)}],
+        cwd=tree, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def profile_revision(revision, sizes=SIZES, modes=MODES):
+    """
+    Profiles a git revision of the repository in a temporary worktree.
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        tree = os.path.join(folder, 'tree')
+        subprocess.run(['git', 'worktree', 'add', '--detach', tree, revision], cwd=ROOT_DIR, check=True, capture_output=True)
+        try:
+            return profile(tree, sizes, modes)
+        finally:
+            subprocess.run(['git', 'worktree', 'remove', '--force', tree], cwd=ROOT_DIR, check=True, capture_output=True)
+
+
+def report(label, results):
+    print(label)
+    print(f"  {'responses':>10} {'mode':>9} {'drawn':>8} {'traces':>18} {'size MB':>8} {'build s':>8} {'to_json s':>9}")
+    for result in results:
+        print(
+            f"  {result['points']:>10,} {result['mode']:>9} {result['drawn']:>8,} {'+'.join(result['trace_types']):>18}"
+            f" {result['megabytes']:>8.2f} {result['build_seconds']:>8.2f} {result['serialize_seconds']:>9.2f}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profile the size and build time of the cluster scatterplot.")
+    parser.add_argument('--baseline', help="Git revision to compare against, e.g. HEAD~1.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help="Numbers of responses to plot.")
+    args = parser.parse_args(argv)
+
+    if args.baseline:
+        report(f"Baseline ({args.baseline})", profile_revision(args.baseline, args.sizes))
+    report("Working tree", profile(ROOT_DIR, args.sizes))
+
+
+if __name__ == '__main__':
+    main()
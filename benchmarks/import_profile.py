@@ -0,0 +1,102 @@
+"""
+Import-time profile of the Streamlit app.
+
+Measures, each in a fresh interpreter, how long `import Workspace` takes, which heavy
+libraries it loads, and the time to first render of the home page (one script run through
+Streamlit's AppTest, which includes executing Workspace.py). Compare against an earlier
+revision with --baseline, e.g.
+
+    python benchmarks/import_profile.py --baseline HEAD~1
+
+The baseline is checked out into a temporary git worktree, so the working tree is untouched.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ['torch', 'sentence_transformers', 'umap', 'numba', 'hdbscan', 'sklearn', 'textblob', 'google.generativeai']
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import Workspace
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'loaded': [name for name in %r if name in sys.modules]}))
+""" % HEAVY_MODULES
+
+RENDER_SCRIPT = """
+import json, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file('Workspace.py', default_timeout=600)
+app.run()
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'exceptions': [str(exception.value) for exception in app.exception]}))
+"""
+
+
+def _run(script, tree):
+    # Older revisions read the API key at import time, so a placeholder keeps them importable
+    env = {**os.environ, 'GEMINI_API_KEY': os.environ.get('GEMINI_API_KEY') or 'benchmark'}
+    output = subprocess.run(
+        [sys.executable, '-c', script], cwd=tree, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def profile(tree, repeat=3):
+    """
+    Returns the median import time, the heavy modules loaded by the import, and the median
+    time to first render of the home page for the app in the given folder.
+    """
+    imports = [_run(IMPORT_SCRIPT, tree) for _ in range(repeat)]
+    renders = [_run(RENDER_SCRIPT, tree) for _ in range(repeat)]
+    return {
+        'import_seconds': statistics.median(result['seconds'] for result in imports),
+        'heavy_modules': imports[0]['loaded'],
+        'first_render_seconds': statistics.median(result['seconds'] for result in renders),
+        'render_exceptions': renders[0]['exceptions'],
+    }
+
+
+def profile_revision(revision, repeat=3):
+    """
+    Profiles a git revision of the repository in a temporary worktree.
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        tree = os.path.join(folder, 'tree')
+        subprocess.run(['git', 'worktree', 'add', '--detach', tree, revision], cwd=ROOT_DIR, check=True, capture_output=True)
+        try:
+            return profile(tree, repeat)
+        finally:
+            subprocess.run(['git', 'worktree', 'remove', '--force', tree], cwd=ROOT_DIR, check=True, capture_output=True)
+
+
+def report(label, result):
+    print(f"{label}")
+    print(f"  import Workspace      {result['import_seconds']:8.2f} s")
+    print(f"  first render (home)   {result['first_render_seconds']:8.2f} s")
+    print(f"  heavy modules loaded  {', '.join(result['heavy_modules']) or 'none'}")
+    if result['render_exceptions']:
+        print(f"  render exceptions     {result['render_exceptions']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profile the import time and first render of the Streamlit app.")
+    parser.add_argument('--baseline', help="Git revision to compare against, e.g. HEAD~1.")
+    parser.add_argument('--repeat', type=int, default=3, help="Fresh interpreters per measurement; the median is reported.")
+    args = parser.parse_args(argv)
+
+    if args.baseline:
+        report(f"Baseline ({args.baseline})", profile_revision(args.baseline, args.repeat))
+    report("Working tree", profile(ROOT_DIR, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,357 @@
+"""
+Load test of one app instance with concurrent analysts.
+
+Simulates N analysts at once, each going from upload to analysis to dashboard the way
+Workspace.py does:
+
+1. upload: a CSV is parsed with the app's ingest code;
+2. analyze: the analysis is submitted to the job store and its status polled until it
+   finishes, so it is queued, clustered and summarized by the warm workers;
+3. dashboard: the result is loaded, the scatterplot built and serialized, the demographic
+   cube filtered and the responses searched.
+
+Streamlit serves every session from a thread of one server process, so the sessions run as
+threads of this process, which stands in for the app, while the analyses run in the usual
+worker processes. For example
+
+    python benchmarks/load_test.py --sessions 1 2 4 8 --rows 500
+
+The embedding model and Gemini are replaced by local stand-ins so the test needs no network or
+API key. The stand-in model hashes words to fixed random vectors, so the timings leave out
+the model's forward pass and the memory leaves out its weights. The stand-in Gemini answers
+every prompt after --llm-latency seconds. The workers warm up and one session runs before
+the measured levels, so they do not include the start-up of a freshly restarted instance.
+Stores, caches and workers live in a temporary folder and are removed afterwards.
+"""
+import argparse
+import io
+import json
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Shadows sentence_transformers in this process and the workers; a word maps to a fixed random vector
+STAND_IN_MODEL = '''
+import zlib
+
+import numpy as np
+
+DIMENSIONS = 384
+BUCKETS = 4096
+
+
+class SentenceTransformer:
+    def __init__(self, *args, **kwargs):
+        self.table = np.random.default_rng(0).standard_normal((BUCKETS, DIMENSIONS)).astype(np.float32)
+        self.max_seq_length = 256
+
+    def encode(self, sentences, *args, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        vectors = np.zeros((len(texts), DIMENSIONS), dtype=np.float32)
+        for row, text in enumerate(texts):
+            buckets = [zlib.crc32(word.encode()) % BUCKETS for word in str(text).split()]
+            if buckets:
+                vectors[row] = self.table[buckets].sum(axis=0)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-9
+        return vectors[0] if single else vectors
+'''
+
+THEMES = [
+    "price cost expensive cheap value discount".split(),
+    "staff friendly rude helpful service manager".split(),
+    "delivery late fast shipping courier tracking".split(),
+    "quality broken durable material design sturdy".split(),
+    "app website login checkout account password".split(),
+]
+SENTIMENT = "good bad terrible excellent love hate great awful".split()
+
+TOPIC = "This questionnaire is a customer feedback survey focused on 'online orders'."
+SUMMARY_MODE = 'batched'
+
+
+class StandInGemini(BaseHTTPRequestHandler):
+    """
+    Answers Gemini REST calls with well-formed summaries after a fixed latency.
+    """
+    latency = 0.2
+    calls = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        import re
+
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        prompt = body['contents'][0]['parts'][0]['text']
+        with StandInGemini.lock:
+            StandInGemini.calls += 1
+        time.sleep(self.latency)
+
+        if 'valid JSON array' in prompt:
+            labels = re.findall(r'Cluster (\S+?):\n', prompt)
+            answer = [{'cluster': label, 'title': f"Topic {label}", 'summary': "Stand-in summary."} for label in labels]
+        elif 'Rewrite the titles' in prompt:
+            answer = {label: f"Distinct topic {label}" for label in re.findall(r'Cluster (\S+?):', prompt)}
+        else:
+            answer = {'title': "Stand-in topic", 'summary': "Stand-in summary."}
+            if 'Positive responses:' in prompt:
+                answer['positive'] = {'title': "Positive side", 'summary': "Stand-in summary."}
+            if 'Negative responses:' in prompt:
+                answer['negative'] = {'title': "Negative side", 'summary': "Stand-in summary."}
+
+        response = {'candidates': [{'content': {'parts': [{'text': json.dumps(answer)}], 'role': 'model'}, 'finishReason': 'STOP', 'index': 0}]}
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(response).encode())
+
+
+def synthetic_csv(rows, seed):
+    """
+    Returns a survey export with themed responses and demographics, as CSV bytes.
+    """
+    rng = np.random.default_rng(seed)
+    themes = rng.integers(0, len(THEMES), rows)
+    responses = [
+        ' '.join(rng.choice(THEMES[theme], 6)) + ' ' + rng.choice(SENTIMENT) + '.' for theme in themes
+    ]
+    df = pd.DataFrame({
+        'respondent': np.arange(rows),
+        'feedback': responses,
+        'age': rng.integers(16, 90, rows),
+        'gender': rng.choice(['female', 'male', 'other'], rows),
+    })
+    return df.to_csv(index=False).encode()
+
+
+def memory_mb(pid='self'):
+    """
+    Returns the resident memory of a process in MB, or None where /proc is not available.
+    """
+    try:
+        with open(f'/proc/{pid}/status') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+class MemoryMonitor:
+    """
+    Samples the memory of this process and the workers until stopped, keeping the peaks.
+    """
+
+    def __init__(self, worker_pids, interval=0.2):
+        self.worker_pids = worker_pids
+        self.interval = interval
+        self.app_peak = self.app_start = memory_mb() or 0.0
+        self.worker_peaks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.app_peak = max(self.app_peak, memory_mb() or 0.0)
+            for pid in self.worker_pids:
+                self.worker_peaks[pid] = max(self.worker_peaks.get(pid, 0.0), memory_mb(pid) or 0.0)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_session(number, rows, poll_seconds, results):
+    """
+    Runs one analyst's session from upload to dashboard, recording the latency of each phase.
+    """
+    from processing import cubes
+    from processing import ingest
+    from processing import similarity
+    from storage import jobs
+    from storage import runs
+    from visuals import visualize
+
+    timings = {'session': number}
+    try:
+        started = time.perf_counter()
+
+        data = synthetic_csv(rows, seed=number)
+        df, _ = ingest.read_columns(io.BytesIO(data), ['feedback', 'age', 'gender'], categorical=['gender'])
+        df = df.rename(columns={'feedback': 'responses', 'gender': 'sex'})
+        timings['upload'] = time.perf_counter() - started
+
+        submitted = time.perf_counter()
+        job_id = jobs.submit(df, TOPIC, 'default', parameters={'summary_mode': SUMMARY_MODE})
+        while True:
+            status = jobs.read_status(job_id)
+            if status['state'] in jobs.FINISHED_STATES:
+                break
+            time.sleep(poll_seconds)
+        timings['analyze'] = time.perf_counter() - submitted
+        if status['state'] != 'done':
+            raise RuntimeError(f"analysis {status['state']}: {status.get('error')}")
+        timings['queued'] = status['started'] - status['created']
+        timings['compute'] = status['finished'] - status['started']
+
+        rendered = time.perf_counter()
+        processed_dfs, summaries, _ = jobs.load_result(job_id)
+        visualize.build_figure(summaries, processed_dfs).to_json()
+        cubes.slice_cube(processed_dfs['cube'], {'sex': ['female']})
+        index = runs.load_index(status['run_id'])
+        similarity.similar_responses(index, processed_dfs['labels_df'], similarity.embed_query("delivery was late"))
+        timings['dashboard'] = time.perf_counter() - rendered
+
+        timings['total'] = time.perf_counter() - started
+    except Exception as e:
+        timings['error'] = str(e)
+
+    results.append(timings)
+
+
+def percentiles(values):
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None}
+    return {f'p{q}': float(np.percentile(values, q)) for q in (50, 95, 99)}
+
+
+def run_level(sessions, rows, poll_seconds, first_session=0):
+    """
+    Runs `sessions` sessions at once and returns their latencies, throughput and memory.
+    """
+    from storage import jobs
+
+    results = []
+    threads = [
+        threading.Thread(target=run_session, args=(first_session + number, rows, poll_seconds, results))
+        for number in range(sessions)
+    ]
+
+    with MemoryMonitor([worker['pid'] for worker in jobs.list_workers()]) as memory:
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - start
+
+    completed = [result for result in results if 'error' not in result]
+    return {
+        'sessions': sessions,
+        'completed': len(completed),
+        'errors': [result['error'] for result in results if 'error' in result],
+        'seconds': seconds,
+        'sessions_per_min': len(completed) / seconds * 60,
+        'responses_per_sec': len(completed) * rows / seconds,
+        'latency': {
+            phase: percentiles([result[phase] for result in completed])
+            for phase in ['upload', 'queued', 'compute', 'analyze', 'dashboard', 'total']
+        },
+        'app_mb_per_session': (memory.app_peak - memory.app_start) / sessions,
+        'app_peak_mb': memory.app_peak,
+        'worker_peak_mb': sorted(memory.worker_peaks.values()),
+    }
+
+
+def report(level):
+    print(f"{level['sessions']} concurrent sessions: {level['completed']} completed in {level['seconds']:.1f} s, "
+          f"{level['sessions_per_min']:.1f} sessions/min, {level['responses_per_sec']:,.0f} responses/sec")
+    print(f"  {'latency s':<10} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for phase, values in level['latency'].items():
+        if values['p50'] is not None:
+            print(f"  {phase:<10} {values['p50']:>8.2f} {values['p95']:>8.2f} {values['p99']:>8.2f}")
+    workers = ', '.join(f"{peak:.0f}" for peak in level['worker_peak_mb'])
+    print(f"  memory: app +{level['app_mb_per_session']:.1f} MB per session (peak {level['app_peak_mb']:.0f} MB), workers peak {workers} MB")
+    for error in level['errors'][:3]:
+        print(f"  error: {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the app with concurrent synthetic sessions.")
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 2, 4], help="Concurrent sessions per level.")
+    parser.add_argument('--rows', type=int, default=500, help="Responses per uploaded survey.")
+    parser.add_argument('--workers', type=int, default=2, help="Analysis workers, as SURVEY_MAX_JOBS.")
+    parser.add_argument('--llm-latency', type=float, default=0.2, help="Seconds the stand-in Gemini takes per call.")
+    parser.add_argument('--poll', type=float, default=2.0, help="Seconds between status polls, as in the app.")
+    parser.add_argument('--json', help="Also write the results to this file.")
+    args = parser.parse_args(argv)
+
+    folder = tempfile.mkdtemp(prefix='survey-load-test-')
+    stand_ins = os.path.join(folder, 'stand_ins')
+    os.makedirs(os.path.join(stand_ins, 'sentence_transformers'))
+    with open(os.path.join(stand_ins, 'sentence_transformers', '__init__.py'), 'w') as file:
+        file.write(STAND_IN_MODEL)
+
+    StandInGemini.latency = args.llm_latency
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInGemini)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # Read when the app's modules are imported, and inherited by the workers they start
+    os.environ.update({
+        'PYTHONPATH': os.pathsep.join([stand_ins, ROOT_DIR, os.environ.get('PYTHONPATH', '')]),
+        'SURVEY_JOBS_DIR': os.path.join(folder, 'jobs'),
+        'SURVEY_RUN_STORE': os.path.join(folder, 'runs'),
+        'SURVEY_LLM_CACHE': os.path.join(folder, 'llm_cache.sqlite3'),
+        'SURVEY_MAX_JOBS': str(args.workers),
+        'GEMINI_API_ENDPOINT': f'http://127.0.0.1:{server.server_port}',
+        'GEMINI_API_KEY': 'load-test',
+        'GEMINI_REQUESTS_PER_MINUTE': '100000',
+    })
+    sys.path[:0] = [stand_ins, ROOT_DIR]
+
+    from storage import jobs
+
+    levels = []
+    try:
+        start = time.perf_counter()
+        jobs.start_workers()
+        while len(jobs.list_workers()) < args.workers or any(worker['state'] == 'warming' for worker in jobs.list_workers()):
+            time.sleep(0.5)
+        print(f"{args.workers} workers warmed up in {time.perf_counter() - start:.1f} s")
+
+        # The app process imports plotting and compiles the search on its first dashboard, as after a restart
+        warm_up = []
+        run_session(0, args.rows, args.poll, warm_up)
+        if 'error' in warm_up[0]:
+            raise RuntimeError(f"The warm-up session failed: {warm_up[0]['error']}")
+        print(f"The app process warmed up with one session in {warm_up[0]['total']:.1f} s")
+
+        first_session = 1
+        for sessions in args.sessions:
+            level = run_level(sessions, args.rows, args.poll, first_session)
+            first_session += sessions
+            report(level)
+            levels.append(level)
+        print(f"Stand-in Gemini answered {StandInGemini.calls} calls")
+    finally:
+        for worker in jobs.list_workers():
+            os.kill(worker['pid'], signal.SIGTERM)
+        server.shutdown()
+        shutil.rmtree(folder, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(levels, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Save and reload time of analysis runs in the run store.
+
+Saves a synthetic run of each size with storage.runs and reopens it, as the app does when a
+cached or saved analysis is opened. For example
+
+    python benchmarks/run_store_profile.py --rows 100000 1000000
+
+Reloading maps the embeddings without reading them, so their size does not count towards the
+memory of the reopened run. The Parquet tables are read through a memory map but converted to
+pandas, which copies them; their size in pandas is reported as the memory of the reopened run.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processing import cubes  # noqa: E402
+from processing import processor  # noqa: E402
+from storage import runs  # noqa: E402
+
+WORDS = "price staff delivery quality app service late friendly broken login cheap fast".split()
+
+
+def synthetic_run(rows, n_clusters=50, dimensions=384, seed=0):
+    """
+    Returns (processed_dfs, summaries) shaped like a completed analysis of `rows` responses.
+    """
+    rng = np.random.default_rng(seed)
+    polarity = rng.uniform(-1, 1, rows)
+    labels_df = pd.DataFrame({
+        'responses': [' '.join(words) for words in rng.choice(WORDS, (rows, 8))],
+        'polarity': polarity,
+        'polarity_categorical': np.select([polarity > 0.05, polarity < -0.05], ['positive', 'negative'], 'neutral'),
+        'age': rng.integers(16, 90, rows),
+        'sex': rng.choice(['female', 'male'], rows),
+        'Umap_1': rng.normal(size=rows),
+        'Umap_2': rng.normal(size=rows),
+        'cluster': rng.integers(-1, n_clusters, rows),
+    })
+
+    processed_dfs = processor.build_views(labels_df)
+    processed_dfs['labels_df'] = labels_df
+    processed_dfs['embeddings'] = rng.normal(size=(rows, dimensions)).astype(np.float32)
+    processed_dfs['cube'] = cubes.build_cube(labels_df)
+
+    summaries = {}
+    for key, centroids_key in [('cluster_summary', 'centroids'), ('positive_cluster_summary', 'positive_centroids'),
+                               ('negative_cluster_summary', 'negative_centroids')]:
+        summary = processed_dfs[centroids_key].copy()
+        summary['Title'] = "Cluster " + summary['cluster'].astype(str)
+        summary['Summary'] = "A synthetic summary of the cluster."
+        summary['Polarity'] = 0.0
+        summaries[key] = summary
+    return processed_dfs, summaries
+
+
+def table_mb(processed_dfs, summaries):
+    """
+    Returns the pandas memory of a reopened run's tables in MB, i.e. what reloading copied.
+    """
+    tables = [processed_dfs['labels_df'], processed_dfs['cube'], *summaries.values()]
+    return sum(table.memory_usage(deep=True).sum() for table in tables) / 1e6
+
+
+def profile(rows, repeats=3):
+    """
+    Returns save and reload measurements for a run of `rows` responses.
+    """
+    processed_dfs, summaries = synthetic_run(rows)
+
+    with tempfile.TemporaryDirectory() as root:
+        start = time.perf_counter()
+        run_id = runs.save_run(processed_dfs, summaries, fingerprint='profile', parameters={}, root=root)
+        save_seconds = time.perf_counter() - start
+        size_mb = runs.run_size(run_id, root) / 1e6
+        embeddings_mb = processed_dfs['embeddings'].nbytes / 1e6
+        del processed_dfs, summaries
+
+        reload_seconds = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            reloaded, reloaded_summaries, _ = runs.load_run(run_id, root)
+            reload_seconds.append(time.perf_counter() - start)
+        reload_mb = table_mb(reloaded, reloaded_summaries)
+
+    return {
+        'rows': rows,
+        'save_seconds': save_seconds,
+        'size_mb': size_mb,
+        'embeddings_mb': embeddings_mb,
+        'reload_seconds': statistics.median(reload_seconds),
+        'reload_mb': reload_mb,
+    }
+
+
+def report(result):
+    print(f"{result['rows']:,} responses")
+    print(f"  save                 {result['save_seconds']:8.2f} s")
+    print(f"  saved size           {result['size_mb']:8.1f} MB ({result['embeddings_mb']:.1f} MB of embeddings)")
+    print(f"  reload               {result['reload_seconds']:8.2f} s")
+    print(f"  tables in memory     {result['reload_mb']:8.1f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profile saving and reloading runs in the run store.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000], help="Numbers of responses per run.")
+    parser.add_argument('--repeats', type=int, default=3, help="Reloads timed per run; the median is reported.")
+    args = parser.parse_args(argv)
+
+    for rows in args.rows:
+        report(profile(rows, args.repeats))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Build time, size and query latency of the similar-responses search index.
+
+Builds the index from synthetic clustered embeddings of the size of all-MiniLM-L6-v2's and
+reports the build time, the size of the saved index, the latency of single queries (the
+dashboard's case) and the recall of the 10 nearest responses against an exact brute-force
+search, whose latency is reported too. For example
+
+    python benchmarks/similarity_profile.py --rows 500000
+
+Embedding the typed phrase is not included; it takes a few milliseconds once the model is loaded.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processing import similarity  # noqa: E402
+
+
+def synthetic_embeddings(rows, dimensions=384, n_clusters=50, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(n_clusters, dimensions)).astype(np.float32)
+    points = centres[rng.integers(0, n_clusters, rows)]
+    points += rng.normal(scale=0.7, size=(rows, dimensions)).astype(np.float32)
+    return points
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) * 1000
+
+
+def profile(rows, queries=200, k=10):
+    """
+    Returns build, size, latency and recall measurements for an index over `rows` embeddings.
+    """
+    import joblib
+
+    data = synthetic_embeddings(rows)
+    rng = np.random.default_rng(1)
+    query_vectors = data[rng.integers(0, rows, queries)] + rng.normal(scale=0.1, size=(queries, data.shape[1])).astype(np.float32)
+
+    start = time.perf_counter()
+    index = similarity.build_index(data)
+    build_seconds = time.perf_counter() - start
+    similarity.warm_up(index)
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'index.joblib')
+        joblib.dump(index, path)
+        size_mb = os.path.getsize(path) / 1e6
+        start = time.perf_counter()
+        joblib.load(path)
+        load_seconds = time.perf_counter() - start
+
+    latencies, found = [], []
+    for vector in query_vectors:
+        start = time.perf_counter()
+        positions, _ = similarity.search(index, vector, k)
+        latencies.append(time.perf_counter() - start)
+        found.append(positions[0])
+
+    # Exact cosine search over normalized vectors, on a subset of the queries as it is slow
+    normalized = data / np.linalg.norm(data, axis=1, keepdims=True)
+    exact_latencies, recalls = [], []
+    for vector, approximate in list(zip(query_vectors, found))[:50]:
+        start = time.perf_counter()
+        scores = normalized @ (vector / np.linalg.norm(vector))
+        exact = np.argpartition(-scores, k)[:k]
+        exact_latencies.append(time.perf_counter() - start)
+        recalls.append(len(set(exact) & set(approximate)) / k)
+
+    return {
+        'rows': rows,
+        'build_seconds': build_seconds,
+        'size_mb': size_mb,
+        'load_seconds': load_seconds,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'exact_p50_ms': percentile(exact_latencies, 50),
+        'recall': statistics.mean(recalls),
+    }
+
+
+def report(result):
+    print(f"{result['rows']:,} responses")
+    print(f"  build and prepare    {result['build_seconds']:8.1f} s")
+    print(f"  saved size           {result['size_mb']:8.1f} MB (loads in {result['load_seconds']:.2f} s)")
+    print(f"  query p50 / p95 / p99 {result['p50_ms']:7.2f} / {result['p95_ms']:.2f} / {result['p99_ms']:.2f} ms")
+    print(f"  exact search p50     {result['exact_p50_ms']:8.2f} ms")
+    print(f"  recall@10            {result['recall']:8.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profile the similar-responses search index.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[500_000], help="Numbers of responses to index.")
+    parser.add_argument('--queries', type=int, default=200, help="Single queries timed per index.")
+    args = parser.parse_args(argv)
+
+    for rows in args.rows:
+        report(profile(rows, args.queries))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,16 @@
-from hdbscan import HDBSCAN
-from sklearn.metrics.pairwise import pairwise_distances
-from sklearn.metrics import silhouette_score
 from itertools import product
 import pandas as pd
 import numpy as np
 
+from processing import resources
+
 def optimize_hdbscan_parameters(distance_matrix, param_grid):
     """
     Optimizes HDBSCAN parameters to maximize silhouette score.
     """
+    from hdbscan import HDBSCAN
+    from sklearn.metrics import silhouette_score
+
     best_score = -1
     best_params = None
 
@@ -50,10 +52,15 @@ def create_clusters(df_with_embeddings, granularity='default'):
     if df_with_embeddings.empty:
         raise ValueError("The DataFrame is empty. Clustering cannot be performed.")
 
+    # hdbscan and scikit-learn are slow to import, so they are loaded on first use
+    from hdbscan import HDBSCAN
+    from sklearn.metrics.pairwise import pairwise_distances
+
     num_rows = len(df_with_embeddings)
 
     # Compute distance matrix
-    distance_matrix = pairwise_distances(df_with_embeddings[['Umap_1', 'Umap_2']], metric='cosine').astype('float64')
+    with resources.limited('distances'):
+        distance_matrix = pairwise_distances(df_with_embeddings[['Umap_1', 'Umap_2']], metric='cosine').astype('float64')
     np.fill_diagonal(distance_matrix, 0)
 
     # Define parameter grids for each granularity
@@ -99,7 +106,8 @@ def create_clusters(df_with_embeddings, granularity='default'):
     param_grid = default_param_grid if granularity == 'default' else broad_param_grid
 
     # Optimize parameters
-    best_params = optimize_hdbscan_parameters(distance_matrix, param_grid)
+    with resources.limited('hdbscan'):
+        best_params = optimize_hdbscan_parameters(distance_matrix, param_grid)
     if best_params:
         min_cluster_size = best_params['min_cluster_size']
         min_samples = best_params['min_samples']
@@ -115,6 +123,7 @@ def create_clusters(df_with_embeddings, granularity='default'):
         metric='precomputed',
         cluster_selection_method='eom'
     )
-    labels = hdbscan_model.fit_predict(distance_matrix)
+    with resources.limited('hdbscan'):
+        labels = hdbscan_model.fit_predict(distance_matrix)
 
     return labels
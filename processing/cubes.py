@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+
+# Demographic columns the analysis knows about, as renamed by the app
+DEMOGRAPHICS = ('age', 'sex', 'ethnicity')
+
+AGE_BINS = [0, 18, 25, 35, 45, 55, 65, 75, 85, 100]
+AGE_LABELS = ['0-18', '19-25', '26-35', '36-45', '46-55', '56-65', '66-75', '76-85', '86-100']
+
+# Label of missing or out-of-range demographic values, so every response is counted
+UNKNOWN = 'Unknown'
+
+SENTIMENTS = ['positive', 'neutral', 'negative']
+
+
+def age_bands(ages):
+    """
+    Groups ages into the bands of AGE_LABELS. Columns that are not numeric, e.g. ages already
+    exported as bands like '18-24', are kept as they are.
+    """
+    numeric = pd.to_numeric(ages, errors='coerce')
+    if numeric.notna().sum() < ages.notna().sum():
+        return _labels(ages)
+    bands = pd.cut(numeric, bins=AGE_BINS, labels=AGE_LABELS)
+    return bands.cat.add_categories([UNKNOWN]).fillna(UNKNOWN)
+
+
+def _labels(values):
+    return values.astype(str).where(values.notna(), UNKNOWN).astype('category')
+
+
+def build_cube(labels_df, demographics=None):
+    """
+    Aggregates the labelled responses by cluster, sentiment and demographics.
+
+    Each row of the cube is one combination of cluster, sentiment category and demographic
+    values that occurs in the data, with its number of responses and the sums of their UMAP
+    coordinates and polarity. Any filter on the demographics can then be answered from the
+    cube alone (see slice_cube), which has at most a few thousand rows whatever the size of
+    the survey.
+
+    Parameters:
+        labels_df (pd.DataFrame): Responses with 'cluster', 'polarity', 'polarity_categorical',
+                                  'Umap_1' and 'Umap_2' columns, as in feature_engineering.
+        demographics (list, optional): Demographic columns to break down by; defaults to the
+                                       columns of DEMOGRAPHICS that labels_df has.
+
+    Returns:
+        pd.DataFrame: One row per occurring combination, with the dimension columns 'cluster',
+                      'sentiment' and each demographic, and 'count', 'Umap_1_sum', 'Umap_2_sum'
+                      and 'polarity_sum'.
+    """
+    if demographics is None:
+        demographics = [column for column in DEMOGRAPHICS if column in labels_df.columns]
+
+    dimensions = pd.DataFrame({
+        'cluster': labels_df['cluster'].to_numpy(),
+        'sentiment': pd.Categorical(labels_df['polarity_categorical'], categories=SENTIMENTS),
+    })
+    for demographic in demographics:
+        values = labels_df[demographic].reset_index(drop=True)
+        dimensions[demographic] = age_bands(values) if demographic == 'age' else _labels(values)
+
+    measures = pd.DataFrame({
+        'count': np.ones(len(labels_df), dtype=np.int64),
+        'Umap_1_sum': labels_df['Umap_1'].to_numpy(dtype=float),
+        'Umap_2_sum': labels_df['Umap_2'].to_numpy(dtype=float),
+        'polarity_sum': labels_df['polarity'].to_numpy(dtype=float),
+    })
+
+    return measures.groupby([dimensions[column] for column in dimensions.columns], observed=True).sum().reset_index()
+
+
+def cube_demographics(cube):
+    """
+    Returns the demographic columns of a cube.
+    """
+    return [column for column in DEMOGRAPHICS if column in cube.columns]
+
+
+def cube_values(cube, demographic):
+    """
+    Returns the values of a demographic that occur in a cube, in the order of its categories.
+    """
+    values = cube[demographic]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return [value for value in values.cat.categories if value in set(values)]
+    return sorted(values.unique(), key=str)
+
+def slice_cube(cube, filters=None):
+    """
+    Returns the size, centroid and sentiment of every cluster among the responses matching
+    the filters, computed from the cube without the responses themselves.
+
+    Parameters:
+        cube (pd.DataFrame): Output of build_cube.
+        filters (dict, optional): Maps demographic columns to the values to keep; columns
+                                  left out or mapped to an empty list are not filtered.
+
+    Returns:
+        pd.DataFrame: One row per cluster with matching responses, noise excluded, with
+                      'cluster', 'count', 'Umap_1', 'Umap_2', 'Polarity' and the share of
+                      each sentiment category ('positive', 'neutral', 'negative').
+    """
+    mask = np.ones(len(cube), dtype=bool)
+    for column, values in (filters or {}).items():
+        if values:
+            mask &= cube[column].isin(values).to_numpy()
+    selected = cube[mask & (cube['cluster'] != -1).to_numpy()]
+
+    totals = selected.groupby('cluster')[['count', 'Umap_1_sum', 'Umap_2_sum', 'polarity_sum']].sum()
+    shares = selected.pivot_table(index='cluster', columns='sentiment', values='count', aggfunc='sum', observed=False)
+    shares = shares.reindex(index=totals.index, columns=SENTIMENTS).fillna(0)
+
+    return pd.DataFrame({
+        'count': totals['count'],
+        'Umap_1': totals['Umap_1_sum'] / totals['count'],
+        'Umap_2': totals['Umap_2_sum'] / totals['count'],
+        'Polarity': totals['polarity_sum'] / totals['count'],
+        **{sentiment: shares[sentiment] / totals['count'] for sentiment in SENTIMENTS},
+    }).reset_index()
+
@@ -0,0 +1,182 @@
+"""
+Topic analysis of long documents.
+
+The embedding model reads at most 256 word pieces, so a whole document would be cut off after
+its first paragraphs. Documents are instead split into overlapping chunks of whole sentences
+that fit the model, the chunks are embedded in batches and clustered like survey responses,
+and the chunk clusters are aggregated back to the documents they came from.
+"""
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from processing import embeddings
+from processing import instrumentation
+from processing import processor
+
+# Words per chunk, leaving room for the ~1.3 word pieces per word of all-MiniLM-L6-v2's 256
+CHUNK_WORDS = 150
+
+# Words of trailing sentences repeated at the start of the next chunk, so no passage is split
+# between two chunks without either seeing it whole
+OVERLAP_WORDS = 30
+
+# Chunks embedded per call to the model
+EMBED_BATCH_SIZE = 512
+
+# Words on a typical printed page, used to report throughput in pages per second
+WORDS_PER_PAGE = 500
+
+# Ends of sentences: space after terminal punctuation, optionally closed by a quote or bracket, or a blank line
+SENTENCE_END = re.compile(r'(?:(?<=[.!?])|(?<=[.!?]["\')\]]))\s+|\n\s*\n')
+
+
+def split_sentences(text):
+    """
+    Splits text into sentences at terminal punctuation and paragraph breaks.
+    """
+    return [sentence.strip() for sentence in SENTENCE_END.split(text) if sentence and sentence.strip()]
+
+
+def iter_chunks(documents, chunk_words=CHUNK_WORDS, overlap_words=OVERLAP_WORDS):
+    """
+    Streams the chunks of each document without holding all of them in memory.
+
+    Chunks are made of whole sentences up to chunk_words words. Each chunk after the first
+    starts with the last sentences of the previous one, up to overlap_words words. Sentences
+    longer than a chunk are split into pieces of chunk_words words.
+
+    Parameters:
+        documents (iterable): (name, text) pairs.
+        chunk_words (int): Maximum words per chunk.
+        overlap_words (int): Maximum words repeated from the previous chunk.
+
+    Yields:
+        tuple: (name, chunk number within the document, chunk text, words in the chunk).
+    """
+    if overlap_words >= chunk_words:
+        raise ValueError("overlap_words must be smaller than chunk_words.")
+
+    for name, text in documents:
+        sentences = []
+        for sentence in split_sentences(text):
+            words = sentence.split()
+            sentences.extend(words[start:start + chunk_words] for start in range(0, len(words), chunk_words))
+
+        number = 0
+        current, current_words = [], 0
+        for words in sentences:
+            if current and current_words + len(words) > chunk_words:
+                yield name, number, ' '.join(word for sentence in current for word in sentence), current_words
+                number += 1
+
+                # Carry the trailing sentences that fit in the overlap over to the next chunk
+                overlap, overlap_count = [], 0
+                for sentence in reversed(current):
+                    if overlap_count + len(sentence) > overlap_words or overlap_count + len(sentence) + len(words) > chunk_words:
+                        break
+                    overlap.insert(0, sentence)
+                    overlap_count += len(sentence)
+                current, current_words = overlap, overlap_count
+
+            current.append(words)
+            current_words += len(words)
+
+        if current:
+            yield name, number, ' '.join(word for sentence in current for word in sentence), current_words
+
+
+def batched(iterable, size):
+    """
+    Yields lists of up to size consecutive items.
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def embed_chunks(chunks, batch_size=EMBED_BATCH_SIZE):
+    """
+    Embeds streamed chunks (see iter_chunks) batch by batch through the response embedding path.
+
+    Returns:
+        tuple: (chunks_df, raw_embeddings) where chunks_df has one row per chunk with 'document',
+               'chunk', 'words' and the chunk text as 'responses', so it can be clustered like a survey.
+    """
+    frames, vectors = [], []
+    for batch in batched(chunks, batch_size):
+        frame = pd.DataFrame(batch, columns=['document', 'chunk', 'responses', 'words'])
+        vectors.append(embeddings.embed_text(frame['responses']))
+        frames.append(frame)
+
+    if not frames:
+        raise ValueError("The documents contain no text.")
+
+    return pd.concat(frames, ignore_index=True), np.vstack(vectors)
+
+
+def process_documents(df, detail, chunk_words=CHUNK_WORDS, overlap_words=OVERLAP_WORDS, batch_size=EMBED_BATCH_SIZE):
+    """
+    Chunks, embeds and clusters documents.
+
+    Parameters:
+        df (pd.DataFrame): One row per document with its 'document' name and 'text'.
+        detail (str): Clustering granularity.
+
+    Returns:
+        dict: Output of processor.feature_engineering over the chunks, whose labels_df keeps each
+              chunk's 'document' and 'chunk' number, plus 'throughput' with the number of
+              'documents', 'chunks' and 'pages', the 'seconds' taken and 'pages_per_sec'.
+    """
+    if not {'document', 'text'} <= set(df.columns):
+        raise ValueError("Input DataFrame must contain 'document' and 'text' columns.")
+
+    start = time.perf_counter()
+    with instrumentation.timed('documents.embedding'):
+        chunks_df, raw_embeddings = embed_chunks(
+            iter_chunks(zip(df['document'], df['text'].fillna('').astype(str)), chunk_words, overlap_words), batch_size
+        )
+
+    with instrumentation.timed('documents.clustering'):
+        processed_dfs = processor.feature_engineering(chunks_df.drop(columns=['words']), detail, raw_embeddings=raw_embeddings)
+
+    seconds = time.perf_counter() - start
+    pages = df['text'].fillna('').astype(str).str.split().str.len().sum() / WORDS_PER_PAGE
+    processed_dfs['throughput'] = {
+        'documents': len(df),
+        'chunks': len(chunks_df),
+        'pages': float(pages),
+        'seconds': seconds,
+        'pages_per_sec': float(pages / seconds) if seconds else 0.0,
+    }
+    return processed_dfs
+
+
+def aggregate_documents(labels_df):
+    """
+    Summarizes the chunk clusters of each document.
+
+    Returns:
+        pd.DataFrame: One row per document with its number of 'chunks', the number of distinct
+                      'topics' among them, its 'main_cluster' (the cluster most of its chunks
+                      belong to, or -1 if they are all noise) and the share of chunks in it
+                      ('main_share'), and the mean 'polarity' of its chunks.
+    """
+    documents = labels_df.groupby('document', sort=False).agg(chunks=('chunk', 'size'), polarity=('polarity', 'mean'))
+
+    clustered = labels_df[labels_df['cluster'] != -1]
+    counts = clustered.groupby(['document', 'cluster']).size().rename('count').reset_index()
+    main = counts.sort_values(['document', 'count'], ascending=[True, False]).drop_duplicates('document').set_index('document')
+
+    documents['topics'] = counts.groupby('document').size().reindex(documents.index, fill_value=0)
+    documents['main_cluster'] = main['cluster'].reindex(documents.index, fill_value=-1)
+    documents['main_share'] = main['count'].reindex(documents.index, fill_value=0) / documents['chunks']
+
+    return documents.reset_index()[['document', 'chunks', 'topics', 'main_cluster', 'main_share', 'polarity']]
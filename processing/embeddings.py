@@ -1,7 +1,22 @@
-from sentence_transformers import SentenceTransformer
+import os
 import pandas as pd 
-from sklearn.decomposition import PCA
-from umap import UMAP
+import threading
+
+from processing import resources
+
+# sentence_transformers (torch), scikit-learn and umap (numba) take seconds to import, so they
+# are imported inside the functions that use them rather than when the app starts
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# numba reads its cache folder when it is first imported, which happens lazily through umap, so
+# setting it here makes compiled UMAP and pynndescent kernels persist across processes
+NUMBA_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache', 'numba')
+os.environ.setdefault('NUMBA_CACHE_DIR', NUMBA_CACHE_DIR)
+
+# Loaded models are kept per process so concurrent jobs share one copy
+_embedding_models = {}
+_embedding_models_lock = threading.Lock()
 
 def clean_text(text_column):
     # Lowercase the text (case-insensitive model)
@@ -16,16 +31,29 @@ def clean_text(text_column):
     return cleaned_text
 
 
+def load_embedding_model(model_name=EMBEDDING_MODEL_NAME):
+    """
+    Loads the SentenceTransformer model once and returns the shared instance on later calls.
+
+    """
+    with _embedding_models_lock:
+        if model_name not in _embedding_models:
+            from sentence_transformers import SentenceTransformer
+            _embedding_models[model_name] = SentenceTransformer(model_name)
+        return _embedding_models[model_name]
+
+
 def get_embeddings(cleaned_text):
     """
     Generates embeddings for a given text using the SentenceTransformer model.
 
     """
     # Load the pre-trained SentenceTransformer model
-    embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+    embedding_model = load_embedding_model()
 
     # Generate embeddings for the input text
-    embeddings = embedding_model.encode(cleaned_text)
+    with resources.limited('embedding'):
+        embeddings = embedding_model.encode(cleaned_text)
     
     # Convert the embeddings into a DataFrame for structured use
     embeddings_df = pd.DataFrame(embeddings)
@@ -33,56 +61,104 @@ def get_embeddings(cleaned_text):
     return embeddings_df
 
 
-def optimal_pca_components(raw_embeddings, variance_threshold=0.80):
+def optimal_pca_components(raw_embeddings, variance_threshold=0.80, return_model=False):
     """
     Determines the minimum number of PCA components required to capture the specified variance.
     Fits the PCA model and transforms the data accordingly.
 
+    With return_model, the fitted PCA model is returned as well, to project new responses later.
+
     """
-    # Initialize PCA without specifying the number of components
-    pca = PCA()
-    pca.fit(raw_embeddings)
-    
-    # Compute cumulative explained variance ratio
-    cumulative_variance = pca.explained_variance_ratio_.cumsum()
-    
-    # Find the number of components that meet or exceed the threshold
-    n_components = (cumulative_variance >= variance_threshold).argmax() + 1
-    
-    # Fit a new PCA model with the optimal number of components
-    pca_model = PCA(n_components=n_components)
-    pca_transformed = pca_model.fit_transform(raw_embeddings)
+    from sklearn.decomposition import PCA
+
+    with resources.limited('pca'):
+        # Initialize PCA without specifying the number of components
+        pca = PCA()
+        pca.fit(raw_embeddings)
+
+        # Compute cumulative explained variance ratio
+        cumulative_variance = pca.explained_variance_ratio_.cumsum()
+
+        # Find the number of components that meet or exceed the threshold
+        n_components = (cumulative_variance >= variance_threshold).argmax() + 1
+
+        # Fit a new PCA model with the optimal number of components
+        pca_model = PCA(n_components=n_components)
+        pca_transformed = pca_model.fit_transform(raw_embeddings)
 
     pca_df = pd.DataFrame(pca_transformed, columns=[f"PC{i+1}" for i in range(pca_model.n_components_)])
     
+    if return_model:
+        return pca_df, pca_model
     return pca_df
 
 
-def umap_transformation(pca_embeddings):
+def umap_transformation(pca_embeddings, return_model=False):
     """
     Applies UMAP dimensionality reduction to transform PCA embeddings into 3D space.
+
+    With return_model, the fitted UMAP model is returned as well, to project new responses later.
     
     """
+    from umap import UMAP
+
     # Perform UMAP transformation
-    embedding_2d = UMAP(random_state=211).fit_transform(pca_embeddings)
+    umap_model = UMAP(random_state=211)
+    with resources.limited('umap'):
+        embedding_2d = umap_model.fit_transform(pca_embeddings)
     embedding_df_2d = pd.DataFrame(embedding_2d, columns=['Umap_1', 'Umap_2'])
+
+    if return_model:
+        return embedding_df_2d, umap_model
     return embedding_df_2d
 
 
 
-def reduced_embeddings(text_column):
+def embed_text(text_column):
     """
-    Generates reduced embeddings from a DataFrame based on the specified data type (either 'paper' or 'abstract').
+    Cleans a text column and returns its full-dimensional embeddings as a NumPy array.
     """
-
     cleaned_text = clean_text(text_column)
-    embeddings = get_embeddings(cleaned_text)
-    pca_reduced_embeddings = optimal_pca_components(embeddings)
-    embedding_df_2d = umap_transformation(pca_reduced_embeddings)
+    return get_embeddings(cleaned_text).to_numpy()
+
+
+def reduce_embeddings(raw_embeddings):
+    """
+    Reduces precomputed embeddings to 2D coordinates with PCA followed by UMAP.
+    """
+    embedding_df_2d, _ = fit_reducers(raw_embeddings)
 
     return embedding_df_2d
 
 
+def fit_reducers(raw_embeddings):
+    """
+    Reduces precomputed embeddings to 2D coordinates like reduce_embeddings, and also returns
+    the fitted models as {'pca', 'umap'} so responses added later can be projected with them.
+    """
+    pca_reduced_embeddings, pca_model = optimal_pca_components(raw_embeddings, return_model=True)
+    embedding_df_2d, umap_model = umap_transformation(pca_reduced_embeddings, return_model=True)
 
+    return embedding_df_2d, {'pca': pca_model, 'umap': umap_model}
 
 
+def project_embeddings(raw_embeddings, reducers):
+    """
+    Maps new embeddings to 2D coordinates with models returned by fit_reducers, without refitting.
+    """
+    with resources.limited('umap_transform'):
+        pca_reduced_embeddings = reducers['pca'].transform(raw_embeddings)
+        embedding_2d = reducers['umap'].transform(pca_reduced_embeddings)
+
+    return pd.DataFrame(embedding_2d, columns=['Umap_1', 'Umap_2'])
+
+
+def reduced_embeddings(text_column):
+    """
+    Generates reduced embeddings from a DataFrame based on the specified data type (either 'paper' or 'abstract').
+    """
+
+    raw_embeddings = embed_text(text_column)
+    embedding_df_2d = reduce_embeddings(raw_embeddings)
+
+    return embedding_df_2d
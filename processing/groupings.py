@@ -0,0 +1,34 @@
+def group_indices(df, broad_column, sub_column=None):
+    """
+    Computes the row positions of every broad group and (group, subgroup) pair with a single groupby.
+
+    Parameters:
+        df (pd.DataFrame): Survey data.
+        broad_column (str): Column used for the broad grouping.
+        sub_column (str, optional): Column used for the subgrouping within each broad group.
+
+    Returns:
+        dict: {group: {'broad_grouping': positions, subgroup: positions, ...}} where positions are
+              NumPy arrays of row positions in df.
+    """
+    groupings = {}
+
+    # observed=True skips category combinations that never occur in the data
+    for group, positions in df.groupby(broad_column, observed=True, sort=False).indices.items():
+        groupings[group] = {'broad_grouping': positions}
+
+    if sub_column:
+        for (group, subgroup), positions in df.groupby([broad_column, sub_column], observed=True, sort=False).indices.items():
+            groupings[group][subgroup] = positions
+
+    return groupings
+
+
+def materialize(df, groupings):
+    """
+    Turns the row positions from group_indices into DataFrame subsets with the same nesting.
+    """
+    return {
+        group: {key: df.iloc[positions] for key, positions in subsets.items()}
+        for group, subsets in groupings.items()
+    }
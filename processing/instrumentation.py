@@ -0,0 +1,86 @@
+"""
+Timings of the expensive steps of an analysis, kept per process.
+
+Steps are timed with `timed`, e.g.
+
+    with instrumentation.timed('warm_up.umap'):
+        ...
+
+and `snapshot` returns the count, total, last and slowest duration of every step, which job
+workers publish to the job store so the app can show them. Gauges hold the current value of a
+resource, such as the threads allocated by processing.resources, and listeners are told when
+one changes so a worker can publish it in the middle of a job.
+"""
+import contextlib
+import threading
+import time
+
+_timings = {}
+_gauges = {}
+_listeners = []
+_timings_lock = threading.Lock()
+
+
+def record(name, seconds):
+    """
+    Adds one duration of the named step.
+    """
+    with _timings_lock:
+        timing = _timings.setdefault(name, {'count': 0, 'total': 0.0, 'last': 0.0, 'max': 0.0})
+        timing['count'] += 1
+        timing['total'] += seconds
+        timing['last'] = seconds
+        timing['max'] = max(timing['max'], seconds)
+
+
+@contextlib.contextmanager
+def timed(name):
+    """
+    Records how long the body of the with statement takes, including when it raises.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def snapshot():
+    """
+    Returns a copy of the timings recorded so far, as {name: {'count', 'total', 'last', 'max'}}.
+    """
+    with _timings_lock:
+        return {name: dict(timing) for name, timing in _timings.items()}
+
+
+def set_gauge(name, value):
+    """
+    Sets the current value of a gauge and tells the listeners.
+    """
+    with _timings_lock:
+        _gauges[name] = value
+        listeners = list(_listeners)
+    for listener in listeners:
+        listener(name, value)
+
+
+def gauges():
+    """
+    Returns a copy of the current value of every gauge.
+    """
+    with _timings_lock:
+        return dict(_gauges)
+
+
+def add_listener(listener):
+    """
+    Calls listener(name, value) whenever a gauge is set.
+    """
+    with _timings_lock:
+        _listeners.append(listener)
+
+
+def reset():
+    with _timings_lock:
+        _timings.clear()
+        _gauges.clear()
@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor
+from processing import embeddings
+from processing import processor
+from summary import backends
+
+DEMOGRAPHICS = ['age', 'sex', 'ethnicity']
+
+# Groups smaller than this cannot form more than one cluster with the HDBSCAN parameter grids
+MIN_GROUP_ROWS = 50
+
+
+def prepare_dataframe(df, responses_column, demographics=None):
+    """
+    Selects the responses column and any mapped demographic columns and renames them
+    to the names expected by the processing functions.
+
+    Parameters:
+        df (pd.DataFrame): Raw survey data.
+        responses_column (str): Column containing the open-ended responses.
+        demographics (dict, optional): Maps 'age', 'sex' and 'ethnicity' to column names in df.
+
+    Returns:
+        pd.DataFrame: DataFrame with a 'responses' column and renamed demographic columns.
+    """
+    demographics = demographics or {}
+
+    columns = [responses_column]
+    rename_mapping = {responses_column: 'responses'}
+
+    for name in DEMOGRAPHICS:
+        column = demographics.get(name)
+        if column:
+            columns.append(column)
+            rename_mapping[column] = name
+
+    missing = [column for column in columns if column not in df.columns]
+    if missing:
+        raise ValueError(f"Input DataFrame is missing the columns: {', '.join(missing)}")
+
+    return df[columns].rename(columns=rename_mapping).reset_index(drop=True)
+
+
+def run_pipeline(df, topic, detail='default', summary_mode='sequential', summary_backend=backends.DEFAULT_BACKEND):
+    """
+    Runs clustering and summarization end to end without any Streamlit interaction.
+
+    Returns:
+        tuple: (processed_dfs, summaries) as produced by feature_engineering and SUMMARIZER.
+    """
+    processed_dfs = processor.feature_engineering(df, detail=detail)
+    summaries = backends.SUMMARIZER(processed_dfs, topic=topic, backend=summary_backend, mode=summary_mode)
+
+    return processed_dfs, summaries
+
+
+def _run_group(df, positions, raw_embeddings, topic, detail, summary_mode, summary_backend):
+    """
+    Clusters and summarizes one group using its slice of the shared embeddings.
+    """
+    if len(positions) < MIN_GROUP_ROWS:
+        return {'error': f"Only {len(positions)} responses; at least {MIN_GROUP_ROWS} are needed for topic analysis."}
+
+    group_df = df.iloc[positions].reset_index(drop=True)
+    try:
+        processed_dfs = processor.feature_engineering(group_df, detail=detail, raw_embeddings=raw_embeddings[positions])
+        summaries = backends.SUMMARIZER(processed_dfs, topic=topic, backend=summary_backend, mode=summary_mode)
+    except Exception as e:
+        return {'error': str(e)}
+
+    return {'processed_dfs': processed_dfs, 'summaries': summaries}
+
+
+def run_group_pipeline(df, groups, topic, detail='default', raw_embeddings=None, max_workers=4, summary_mode='sequential',
+                       summary_backend=backends.DEFAULT_BACKEND):
+    """
+    Runs topic analysis separately for each group of responses.
+
+    Every response is embedded once (or the embeddings of an earlier overall run are reused),
+    and the groups are then clustered and summarized in parallel from slices of those embeddings.
+
+    Parameters:
+        df (pd.DataFrame): Prepared DataFrame with a 'responses' column.
+        groups (dict): Maps a group label to the row positions of its responses in df.
+        topic (str): The overarching topic to guide summarization.
+        detail (str): Clustering granularity.
+        raw_embeddings (np.ndarray, optional): Embeddings for every row of df.
+        max_workers (int): Number of groups analyzed at once.
+        summary_mode (str): Summarization mode passed to SUMMARIZER.
+        summary_backend (str): Name of the summarizer backend (see summary.backends).
+
+    Returns:
+        dict: Maps each group label to {'processed_dfs', 'summaries'} or {'error'} if it could not be analyzed.
+    """
+    if raw_embeddings is None:
+        raw_embeddings = embeddings.embed_text(df['responses'])
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            label: executor.submit(_run_group, df, positions, raw_embeddings, topic, detail, summary_mode, summary_backend)
+            for label, positions in groups.items()
+        }
+        return {label: future.result() for label, future in futures.items()}
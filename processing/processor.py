@@ -1,28 +1,65 @@
 from processing import clusters
+from processing import cubes
 from processing import sentiment
 from processing import embeddings
 import pandas as pd
 
-def feature_engineering(df, detail):
+def feature_engineering(df, detail, raw_embeddings=None, demographics=None):
     """
     Process the input DataFrame through sentiment analysis, embedding reduction, and clustering.
 
+    Embeddings computed earlier for the same rows (e.g. for the whole survey before splitting
+    it into groups) can be passed as raw_embeddings to skip re-encoding the responses.
+
+    The labelled responses are also aggregated by cluster, sentiment and the given demographic
+    columns (by default whichever of age, sex and ethnicity df has) into 'cube', from which
+    the dashboard filters topics by demographics.
+
     """
 
     if 'responses' not in df.columns:
         raise ValueError("Input DataFrame must contain a 'responses' column.")
 
+    if raw_embeddings is not None and len(raw_embeddings) != len(df):
+        raise ValueError("raw_embeddings must have one row per response.")
+
     # Perform sentiment analysis
     sentiment_analysis_df = sentiment.sentiment_analysis(df)
 
     # Generate embeddings and reduce dimensionality
-    reduced_embeddings = embeddings.reduced_embeddings(df['responses'])
+    if raw_embeddings is None:
+        raw_embeddings = embeddings.embed_text(df['responses'])
+    reduced_embeddings, reducers = embeddings.fit_reducers(raw_embeddings)
     reduced_embeddings_df = pd.concat([df, reduced_embeddings], axis=1)
 
     # Create clusters using reduced embeddings
     labels = pd.DataFrame(clusters.create_clusters(reduced_embeddings_df, granularity=detail), columns=['cluster'])
     labels_df = pd.concat([sentiment_analysis_df, reduced_embeddings, labels], axis=1)
 
+    # Build the noise-free, sentiment and centroid views of the labelled data
+    views = build_views(labels_df)
+
+    # Aggregate once by demographics so filtered views never go back to the responses
+    cube = cubes.build_cube(labels_df, demographics)
+
+    # Return results as a dictionary for better access
+    return {
+        'embeddings': raw_embeddings,
+        'reducers': reducers,
+        'sentiment_analysis_df': sentiment_analysis_df,
+        'reduced_embeddings_df': reduced_embeddings_df,
+        'labels_df': labels_df,
+        'cube': cube,
+        **views
+    }
+
+def build_views(labels_df):
+    """
+    Derives the processed, positive and negative response sets and their cluster centroids
+    from a DataFrame with sentiment, UMAP coordinates and a 'cluster' label for every response.
+
+    """
+
     # Filter out noise points (where cluster = -1)
     processed_df = labels_df[labels_df['cluster'] != -1]
 
@@ -52,10 +89,7 @@ def feature_engineering(df, detail):
     positive_centroids = positive_centroids.merge(positive_cluster_counts, on='cluster')
     negative_centroids = negative_centroids.merge(negative_cluster_counts, on='cluster')
 
-    # Return results as a dictionary for better access
     return {
-        'sentiment_analysis_df': sentiment_analysis_df,
-        'reduced_embeddings_df': reduced_embeddings_df,
         'processed_df': processed_df,
         'positive_processed_df': positive_processed_df,
         'negative_processed_df': negative_processed_df,
@@ -71,11 +105,12 @@ def PROCESSOR(df, detail, demographics=None):
     Parameters:
         df (pd.DataFrame): Input DataFrame with a 'responses' column and optional demographic columns.
         detail (int): Granularity for clustering.
-        demographic (list, optional): List of column names containing demographic data to include in the final processed DataFrame.
+        demographics (list, optional): Demographic columns to break the clusters down by. Ages are
+                                       grouped into bands (see cubes.age_bands).
 
     Returns:
-        pd.DataFrame: Final processed DataFrame with sentiment, embeddings, clusters, and demographics (excluding noise).
-
+        dict: Output of feature_engineering, whose 'cube' holds the counts, centroid sums and
+              sentiment of every cluster per combination of the demographics.
 
     """
 
@@ -89,30 +124,4 @@ def PROCESSOR(df, detail, demographics=None):
             if demographic not in columns:
                 raise ValueError(f"Input DataFrame must contain the '{demographic}' column.")
     
-    dataframes = feature_engineering(df, detail, demographics)
-            
-    columns = df.columns
-
-    
-            
-    # process age by grouping into age groups
-    if 'age' in df.columns:
-        age_groups = pd.cut(df['age'], bins=[0, 18, 25, 35, 45, 55, 65, 75, 85, 100], labels=['0-18', '19-25', '26-35', '36-45', '46-55', '56-65', '66-75', '76-85', '86-100'])
-        df['age'] = age_groups
-        age_group_counts = age_groups.value_counts().sort_index()
-
-
-        
-        
-
-    
-
-        
-
-    
-    
-    
-    
-
-
-   
\ No newline at end of file
+    return feature_engineering(df, detail, demographics=list(demographics or []))
@@ -0,0 +1,137 @@
+"""
+Shares the CPU threads of the host between the analyses running on it.
+
+torch, the BLAS and OpenMP libraries behind numpy, scikit-learn and hdbscan, and numba (UMAP,
+pynndescent) each start one thread per core by default, so two analyses running at once use
+twice as many threads as there are cores and slow each other down. Expensive steps run inside
+`limited`, e.g.
+
+    with resources.limited('umap'):
+        ...
+
+which caps those libraries at THREAD_BUDGET divided by the number of analyses running on the
+host. The job store tells the governor how many are running (see set_job_counter), and the
+allocation in force is published as the 'threads' gauge of the instrumentation.
+"""
+import contextlib
+import os
+import sys
+import threading
+
+from processing import instrumentation
+
+# Threads all analyses on the host may use together; defaults to the number of cores
+THREAD_BUDGET = int(os.environ.get('SURVEY_THREAD_BUDGET', 0)) or os.cpu_count() or 1
+
+# Returns the number of analyses running on the host; one unless the job store sets it
+_job_counter = lambda: 1
+
+# Steps running in this process, e.g. indexing in a thread while another step runs
+_active_steps = []
+_original_limits = None
+_original_torch_threads = None
+_lock = threading.Lock()
+
+
+def set_job_counter(counter):
+    """
+    Sets the function that returns the number of analyses running on the host.
+    """
+    global _job_counter
+    _job_counter = counter
+
+
+def allocate(running_jobs, concurrent_steps=1, budget=THREAD_BUDGET):
+    """
+    Returns the threads one step may use when `running_jobs` analyses share the budget and
+    `concurrent_steps` steps of this one run at the same time. Every step gets at least one.
+    """
+    return max(1, budget // max(1, running_jobs) // max(1, concurrent_steps))
+
+
+def _apply(threads):
+    from threadpoolctl import threadpool_limits
+
+    global _original_limits, _original_torch_threads
+
+    # torch and numba are only limited once loaded, which the steps using them have done. torch
+    # reports OpenMP's thread count, so it is read before OpenMP is limited
+    torch = sys.modules.get('torch')
+    if torch is not None and _original_torch_threads is None:
+        _original_torch_threads = torch.get_num_threads()
+
+    # The limits of the BLAS and OpenMP libraries apply to the whole process
+    limits = threadpool_limits(limits=threads)
+    if _original_limits is None:
+        _original_limits = limits
+
+    if torch is not None:
+        torch.set_num_threads(threads)
+
+
+def _restore():
+    global _original_limits, _original_torch_threads
+
+    if _original_limits is not None:
+        _original_limits.restore_original_limits()
+        _original_limits = None
+    if _original_torch_threads is not None:
+        import torch
+        torch.set_num_threads(_original_torch_threads)
+        _original_torch_threads = None
+
+
+def _limit_numba(threads):
+    # numba's thread count is per calling thread and cannot exceed the pool it started with
+    if 'numba' not in sys.modules:
+        return None
+    import numba
+    previous = numba.get_num_threads()
+    numba.set_num_threads(min(threads, numba.config.NUMBA_NUM_THREADS))
+    return previous
+
+
+def _publish(threads, running_jobs):
+    instrumentation.set_gauge('threads', {
+        'budget': THREAD_BUDGET,
+        'running_jobs': running_jobs,
+        'threads': threads,
+        'steps': list(_active_steps),
+    })
+
+
+@contextlib.contextmanager
+def limited(step):
+    """
+    Caps the threads of torch, BLAS, OpenMP and numba while the body of the with statement runs.
+
+    The allocation is worked out when the step starts, from the analyses running on the host
+    at that moment and the steps already running in this process, and the original limits are
+    restored once the last step ends.
+
+    Yields:
+        int: The number of threads the step may use, e.g. for an n_jobs argument.
+    """
+    running_jobs = _job_counter()
+    with _lock:
+        _active_steps.append(step)
+        threads = allocate(running_jobs, len(_active_steps))
+        _apply(threads)
+        _publish(threads, running_jobs)
+    previous_numba_threads = _limit_numba(threads)
+
+    try:
+        yield threads
+    finally:
+        if previous_numba_threads is not None:
+            import numba
+            numba.set_num_threads(previous_numba_threads)
+        with _lock:
+            _active_steps.remove(step)
+            if _active_steps:
+                threads = allocate(running_jobs, len(_active_steps))
+                _apply(threads)
+            else:
+                _restore()
+                threads = 0
+            _publish(threads, running_jobs)
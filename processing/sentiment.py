@@ -1,5 +1,3 @@
-from textblob import TextBlob
-
 def sentiment_analysis(df):
     """
     This function performs sentiment analysis on the 'responses' column of the given DataFrame.
@@ -7,6 +5,9 @@ def sentiment_analysis(df):
     the polarity and subjectivity into descriptive labels.
 
     """
+    # TextBlob pulls in nltk, which takes a couple of seconds to import
+    from textblob import TextBlob
+
     # Replace NaN values with empty strings
     df['responses'] = df['responses'].fillna('').astype(str)
     
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+from processing import clusters
+from processing import embeddings
+from processing import instrumentation
+from processing import similarity
+
+# Enough rows for UMAP's nearest neighbour search and HDBSCAN's parameter grid to run their
+# usual code paths, while taking well under a second once compiled
+WARM_UP_ROWS = 300
+WARM_UP_DIMENSIONS = 384
+
+
+def synthetic_embeddings(rows=WARM_UP_ROWS, dimensions=WARM_UP_DIMENSIONS, n_blobs=4, seed=0):
+    """
+    Returns random embeddings gathered around a few centres, so clustering them finds clusters.
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(scale=5.0, size=(n_blobs, dimensions))
+    points = centres[rng.integers(0, n_blobs, rows)] + rng.normal(size=(rows, dimensions))
+    return points.astype(np.float32)
+
+
+def warm_up(rows=WARM_UP_ROWS, load_model=True):
+    """
+    Runs tiny synthetic embeddings through PCA, UMAP and HDBSCAN and the search index so numba
+    compiles the kernels of UMAP and pynndescent, and loads the embedding model, before the
+    first real analysis.
+
+    Compiled kernels are also written to the numba cache on disk, but UMAP builds part of them when
+    it is first called, so every new process needs this run to avoid paying the compilation itself.
+    A model that cannot be loaded, e.g. offline, is reported and skipped.
+
+    Returns:
+        dict: Seconds taken by each step and in total, also recorded in instrumentation.
+    """
+    seconds = {}
+
+    def step(name, function):
+        with instrumentation.timed(f'warm_up.{name}'):
+            result = function()
+        seconds[name] = instrumentation.snapshot()[f'warm_up.{name}']['last']
+        return result
+
+    with instrumentation.timed('warm_up'):
+        if load_model:
+            try:
+                step('model', embeddings.load_embedding_model)
+            except Exception as e:
+                print(f"Warm-up could not load the embedding model: {e}")
+
+        reduced, reducers = step('umap', lambda: embeddings.fit_reducers(synthetic_embeddings(rows)))
+        # Incremental updates project new responses with a stored model, which has kernels of its own
+        step('umap_transform', lambda: embeddings.project_embeddings(synthetic_embeddings(20, seed=1), reducers))
+        step('hdbscan', lambda: clusters.create_clusters(pd.DataFrame(reduced, columns=['Umap_1', 'Umap_2'])))
+        step('ann_index', lambda: similarity.warm_up(similarity.build_index(synthetic_embeddings(rows))))
+
+    seconds['total'] = instrumentation.snapshot()['warm_up']['last']
+    return seconds
@@ -0,0 +1,212 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from processing import embeddings
+from storage import runs
+from summary import summary
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cached results are evicted once the run store grows past this size or age
+CACHE_MAX_BYTES = int(os.environ.get('SURVEY_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+CACHE_MAX_AGE_DAYS = float(os.environ.get('SURVEY_CACHE_MAX_AGE_DAYS', 30))
+CACHE_MAX_RUNS = int(os.environ.get('SURVEY_CACHE_MAX_RUNS', 100))
+
+# Analyses currently being computed in this process, keyed by cache key
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+# Returns the IDs of runs still in use, which eviction keeps; none unless the job store sets it
+_runs_in_use = lambda: set()
+
+# Lock files claiming the analyses being computed by any process on the host, one per cache key
+CLAIMS_DIR_NAME = '.claims'
+
+
+def set_runs_in_use(function):
+    """
+    Sets the function that returns the IDs of runs still in use, e.g. by sessions attached to jobs.
+    """
+    global _runs_in_use
+    _runs_in_use = function
+
+
+def _code_version():
+    """
+    Hashes the source of the processing and summary packages so cached results
+    are not reused after the pipeline code changes.
+    """
+    digest = hashlib.sha256()
+    for package in ['processing', 'summary']:
+        folder = os.path.join(ROOT_DIR, package)
+        for name in sorted(os.listdir(folder)):
+            if name.endswith('.py'):
+                with open(os.path.join(folder, name), 'rb') as file:
+                    digest.update(file.read())
+    return digest.hexdigest()[:12]
+
+
+CODE_VERSION = _code_version()
+
+
+def pipeline_key(fingerprint, topic, detail, parameters=None):
+    """
+    Builds the cache key for an analysis from the fingerprint of the selected columns, the
+    topic and granularity, any other settings that change the results, the embedding and
+    language models, and the pipeline code version.
+
+    """
+    parameters = {
+        **(parameters or {}),
+        'data': fingerprint,
+        'topic': topic,
+        'detail': detail,
+        'embedding_model': embeddings.EMBEDDING_MODEL_NAME,
+        'llm_model': summary.MODEL_NAME,
+        'code_version': CODE_VERSION,
+    }
+    return hashlib.sha256(json.dumps(parameters, sort_keys=True).encode()).hexdigest()
+
+
+@contextlib.contextmanager
+def _claim(key):
+    """
+    Holds an exclusive lock on a cache key shared by every process on the host, waiting while
+    another process holds it. The operating system releases the lock if the process dies.
+    """
+    folder = os.path.join(runs.RUN_STORE_DIR, CLAIMS_DIR_NAME)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f'{key}.lock')
+    while True:
+        file = open(path, 'a')
+        fcntl.flock(file, fcntl.LOCK_EX)
+        # sweep_claims may have removed the file while this process waited for it, in which
+        # case the lock is on a file nobody else will see and is taken again on a new one
+        try:
+            current = os.stat(path)
+        except FileNotFoundError:
+            current = None
+        if current is not None and os.path.samestat(current, os.fstat(file.fileno())):
+            break
+        file.close()
+
+    try:
+        yield
+    finally:
+        fcntl.flock(file, fcntl.LOCK_UN)
+        file.close()
+
+
+def sweep_claims(max_age_days=CACHE_MAX_AGE_DAYS):
+    """
+    Removes the claim files of cache keys older than `max_age_days` that no process holds.
+    """
+    folder = os.path.join(runs.RUN_STORE_DIR, CLAIMS_DIR_NAME)
+    if not os.path.isdir(folder):
+        return
+
+    cutoff = time.time() - max_age_days * 24 * 60 * 60
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        try:
+            if os.path.getmtime(path) >= cutoff:
+                continue
+            file = open(path, 'a')
+        except FileNotFoundError:
+            continue
+        with file:
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            # Removed while locked, so a process waiting on it notices and takes a new one
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+
+
+def find_cached(df, topic, detail, parameters=None):
+    """
+    Returns the ID of the saved run of an identical completed analysis, or None.
+    """
+    return runs.find_run(pipeline_key(runs.fingerprint_dataframe(df), topic, detail, parameters))
+
+
+def _load(run_id):
+    processed_dfs, summaries, _ = runs.load_run(run_id)
+    return {'processed_dfs': processed_dfs, 'summaries': summaries, 'run_id': run_id, 'cached': True}
+
+
+def cached_pipeline(df, topic, detail, compute, parameters=None):
+    """
+    Returns the results of an analysis, computing them only if no identical analysis has
+    been completed before.
+
+    Completed results are looked up in the run store, so they are shared across sessions and
+    server restarts. If an identical analysis is already running in another session or in
+    another worker process, this call waits for it and reads its results instead of starting a
+    second one.
+
+    Parameters:
+        df (pd.DataFrame): Prepared DataFrame with a 'responses' column.
+        topic (str): The overarching topic used for summarization.
+        detail (str): Clustering granularity.
+        compute (callable): Called as compute(df) on a cache miss; must return (processed_dfs, summaries).
+        parameters (dict, optional): Extra JSON-serializable settings that affect the results
+                                     (e.g. the summarization mode); part of the key and recorded with the run.
+
+    Returns:
+        dict: {'processed_dfs', 'summaries', 'run_id', 'cached'} where cached tells whether
+              the results were reused.
+    """
+    # The key is computed first because processing adds columns to df
+    fingerprint = runs.fingerprint_dataframe(df)
+    key = pipeline_key(fingerprint, topic, detail, parameters)
+
+    run_id = runs.find_run(key)
+    if run_id:
+        return _load(run_id)
+
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        owner = future is None
+        if owner:
+            future = Future()
+            _in_flight[key] = future
+
+    if not owner:
+        # Reload from the store so each session gets its own copy of the results
+        return _load(future.result()['run_id'])
+
+    try:
+        with _claim(key):
+            # Another session or process may have finished the same analysis between the lookup
+            # and taking the claim
+            run_id = runs.find_run(key)
+            if run_id:
+                result = _load(run_id)
+            else:
+                processed_dfs, summaries = compute(df)
+                run_id = runs.save_run(
+                    processed_dfs, summaries, fingerprint=fingerprint, cache_key=key,
+                    parameters={'topic': topic, 'detail': detail, **(parameters or {})}
+                )
+                runs.gc_runs(
+                    keep=CACHE_MAX_RUNS, max_age_days=CACHE_MAX_AGE_DAYS, max_bytes=CACHE_MAX_BYTES,
+                    in_use=_runs_in_use() | {run_id}
+                )
+                sweep_claims()
+                result = {'processed_dfs': processed_dfs, 'summaries': summaries, 'run_id': run_id, 'cached': False}
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(key, None)
@@ -0,0 +1,225 @@
+"""
+Incremental re-analysis of surveys that are re-exported with more responses over time.
+
+When an upload still holds most of the responses of an earlier run with the same settings,
+only the responses that are new are embedded. They are projected with the earlier run's
+PCA and UMAP models and assigned to its clusters. Clusters whose membership changed by more
+than RESUMMARIZE_THRESHOLD are summarized again, and the others keep their summaries. The
+survey is analyzed from scratch instead after REFIT_EVERY updates in a row, or once it has
+grown by more than REFIT_GROWTH since it was last clustered, so the clusters keep up with
+the data.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from processing import cubes
+from processing import embeddings
+from processing import processor
+from processing import sentiment
+from storage import runs
+from summary import backends
+from summary import summary
+
+# Share of an earlier run's responses that must still be in the upload for it to be updated
+MIN_OVERLAP = float(os.environ.get('SURVEY_INCREMENTAL_MIN_OVERLAP', 0.9))
+
+# Share of a cluster's responses that must be added or removed before it is summarized again
+RESUMMARIZE_THRESHOLD = float(os.environ.get('SURVEY_RESUMMARIZE_THRESHOLD', 0.2))
+
+# Incremental updates in a row, and growth since the last full analysis, that trigger a full refit
+REFIT_EVERY = int(os.environ.get('SURVEY_REFIT_EVERY', 7))
+REFIT_GROWTH = float(os.environ.get('SURVEY_REFIT_GROWTH', 0.5))
+
+# Labelled neighbours that vote on the cluster of a new response
+NEIGHBOURS = 15
+
+# Settings that do not change how a run was clustered and summarized
+IGNORED_PARAMETERS = ('incremental', 'group')
+
+
+def _settings(parameters):
+    return {key: value for key, value in parameters.items() if key not in IGNORED_PARAMETERS}
+
+
+def row_keys(df, columns):
+    """
+    Returns one key per row identifying its values in the given columns. Repeated rows are
+    numbered, so identical responses in two uploads are matched one to one.
+    """
+    hashes = pd.util.hash_pandas_object(df[columns].astype(str), index=False).to_numpy()
+    occurrences = pd.Series(hashes).groupby(hashes).cumcount().to_numpy()
+    return pd.MultiIndex.from_arrays([hashes, occurrences])
+
+
+def find_base_run(df, topic, detail, parameters=None, root=runs.RUN_STORE_DIR):
+    """
+    Returns the manifest of the newest run with the same settings whose responses are mostly
+    still in df and that can be updated, or None.
+    """
+    settings = _settings({'topic': topic, 'detail': detail, **(parameters or {})})
+    columns = list(df.columns)
+    keys = row_keys(df, columns)
+
+    for manifest in runs.list_runs(root):
+        run_dir = os.path.join(root, manifest['run_id'])
+        if _settings(manifest['parameters']) != settings or not os.path.exists(os.path.join(run_dir, runs.REDUCERS_NAME)):
+            continue
+        try:
+            points = pd.read_parquet(os.path.join(run_dir, 'points.parquet'), columns=columns)
+        except Exception:
+            # Saved with other columns, e.g. without the same demographics
+            continue
+        if len(points) and row_keys(points, columns).isin(keys).mean() >= MIN_OVERLAP:
+            return manifest
+
+    return None
+
+
+def refit_reason(manifest, rows):
+    """
+    Tells why a survey of `rows` responses should be analyzed from scratch rather than by
+    updating the run of the given manifest, or returns None if it can be updated.
+    """
+    lineage = manifest.get('incremental') or {}
+    generation = lineage.get('generation', 0)
+    fitted_rows = lineage.get('fitted_rows', manifest['rows'])
+
+    if generation >= REFIT_EVERY:
+        return f"the clusters have been updated {generation} times since they were computed"
+    if rows - fitted_rows > REFIT_GROWTH * fitted_rows:
+        return f"the survey has grown from {fitted_rows} to {rows} responses since it was clustered"
+    return None
+
+
+def assign_clusters(coordinates, labels, new_coordinates, n_neighbors=NEIGHBOURS):
+    """
+    Assigns each new point the most common label among its nearest labelled points.
+
+    The clusters were found by HDBSCAN on precomputed cosine distances between UMAP
+    coordinates, which its approximate_predict does not support, so the vote uses the
+    same cosine distance. Points whose neighbours are mostly noise are labelled noise (-1).
+    """
+    from scipy import stats
+    from sklearn.neighbors import NearestNeighbors
+
+    model = NearestNeighbors(n_neighbors=min(n_neighbors, len(coordinates)), metric='cosine').fit(coordinates)
+    _, neighbours = model.kneighbors(new_coordinates)
+    return stats.mode(labels[neighbours], axis=1, keepdims=False).mode
+
+
+def _changed_clusters(centroids, base_view, view, kept, added, threshold):
+    """
+    Returns the labels of the view's clusters whose added and removed responses exceed
+    `threshold` times their previous size, including clusters that are new to the view.
+    """
+    previous = base_view['cluster'].value_counts()
+    removed = base_view.loc[~kept[base_view.index.to_numpy()], 'cluster'].value_counts()
+    added = view.loc[added[view.index.to_numpy()], 'cluster'].value_counts()
+
+    change = removed.add(added, fill_value=0).reindex(centroids['cluster'], fill_value=0)
+    share = change / previous.reindex(centroids['cluster']).to_numpy()
+    return centroids['cluster'][~(share.to_numpy() <= threshold)].tolist()
+
+
+def update_run(df, manifest, topic, detail, summary_mode='sequential', summary_backend=backends.DEFAULT_BACKEND,
+               resummarize_threshold=RESUMMARIZE_THRESHOLD, root=runs.RUN_STORE_DIR):
+    """
+    Analyzes df by updating an earlier run (see find_base_run) with the responses added since.
+
+    Returns:
+        tuple: (processed_dfs, summaries) as produced by a full analysis. processed_dfs also holds
+               'incremental', which records the base run and what changed, and is saved with the run.
+    """
+    run_id = manifest['run_id']
+    base_dfs, base_summaries, _ = runs.load_run(run_id, root)
+    reducers = runs.load_reducers(run_id, root)
+    base_points = base_dfs['labels_df']
+
+    df = df.reset_index(drop=True)
+    columns = list(df.columns)
+
+    # Position of every response of df in the base run, or -1 for new responses
+    base_positions = row_keys(base_points, columns).get_indexer(row_keys(df, columns))
+    kept_rows = np.flatnonzero(base_positions >= 0)
+    new_rows = np.flatnonzero(base_positions < 0)
+
+    kept = np.zeros(len(base_points), dtype=bool)
+    kept[base_positions[kept_rows]] = True
+    added = np.zeros(len(df), dtype=bool)
+    added[new_rows] = True
+
+    raw_embeddings = np.empty((len(df), base_dfs['embeddings'].shape[1]), dtype=base_dfs['embeddings'].dtype)
+    raw_embeddings[kept_rows] = base_dfs['embeddings'][base_positions[kept_rows]]
+    parts = [base_points.iloc[base_positions[kept_rows]].set_axis(kept_rows)]
+
+    if len(new_rows):
+        new_df = df.iloc[new_rows].reset_index(drop=True)
+        new_embeddings = embeddings.embed_text(new_df['responses'])
+        new_coordinates = embeddings.project_embeddings(new_embeddings, reducers)
+        new_labels = assign_clusters(
+            base_points[['Umap_1', 'Umap_2']].to_numpy(), base_points['cluster'].to_numpy(), new_coordinates.to_numpy()
+        )
+        new_points = pd.concat(
+            [sentiment.sentiment_analysis(new_df), new_coordinates, pd.DataFrame({'cluster': new_labels})], axis=1
+        )
+        raw_embeddings[new_rows] = new_embeddings
+        parts.append(new_points[base_points.columns].set_axis(new_rows))
+
+    labels_df = pd.concat(parts).sort_index().reset_index(drop=True)
+    views = processor.build_views(labels_df)
+
+    # Index labels of the base run's responses in the updated run, to carry representatives over
+    new_position_of = pd.Series(kept_rows, index=base_positions[kept_rows])
+
+    # Facets summarize the three views together, which does not apply to a subset of clusters
+    mode = 'batched' if summary_mode == 'facets' else summary_mode
+
+    summaries = {}
+    resummarized = {}
+    for view, (centroids_key, processed_key) in summary.VIEWS.items():
+        centroids, processed_df = views[centroids_key], views[processed_key]
+        base_summary = base_summaries[view]
+
+        changed = _changed_clusters(centroids, base_dfs[processed_key], processed_df, kept, added, resummarize_threshold)
+        # Clusters that could not be summarized last time are tried again
+        changed += [label for label in centroids['cluster'] if label not in set(base_summary['cluster']) and label not in changed]
+        resummarized[view] = [int(label) for label in changed]
+
+        reused = centroids[~centroids['cluster'].isin(changed)].merge(
+            base_summary.drop(columns=['Umap_1', 'Umap_2', 'count', 'Polarity']), on='cluster'
+        )
+        reused['Polarity'] = reused['cluster'].map(processed_df.groupby('cluster')['polarity'].mean())
+        reused['Representatives'] = reused['Representatives'].map(
+            lambda labels: [int(new_position_of[label]) for label in labels if label in new_position_of.index]
+        )
+
+        frames = [reused]
+        if changed:
+            frames.append(backends.summarize_clusters(
+                centroids[centroids['cluster'].isin(changed)], processed_df, topic,
+                backend=summary_backend, mode=mode, embeddings=raw_embeddings
+            ))
+        summaries[view] = pd.concat(frames, ignore_index=True).sort_values('cluster').reset_index(drop=True)
+
+    lineage = manifest.get('incremental') or {}
+    processed_dfs = {
+        'embeddings': raw_embeddings,
+        'reducers': reducers,
+        'sentiment_analysis_df': labels_df.drop(columns=['Umap_1', 'Umap_2', 'cluster']),
+        'reduced_embeddings_df': labels_df.drop(columns=['cluster']),
+        'labels_df': labels_df,
+        'cube': cubes.build_cube(labels_df),
+        **views,
+        'incremental': {
+            'base_run': run_id,
+            'generation': lineage.get('generation', 0) + 1,
+            'fitted_rows': lineage.get('fitted_rows', manifest['rows']),
+            'new_rows': int(len(new_rows)),
+            'removed_rows': int((~kept).sum()),
+            'resummarized': resummarized,
+        },
+    }
+
+    return processed_dfs, summaries
@@ -0,0 +1,709 @@
+"""
+Runs analyses in background worker processes so the Streamlit script thread never blocks.
+
+Each job gets a folder in the job store holding its input, its status (rewritten atomically
+after every update), and the partial results streamed while it runs. The final results are
+saved to the run store through the result cache.
+
+Jobs are run by long-lived worker processes, one per host-wide lock file slot, so concurrent
+sessions queue instead of competing for the same CPUs. A worker loads the embedding model and
+compiles the numba kernels of UMAP and HDBSCAN once when it starts, before it takes any job,
+so analyses never pay that start-up time themselves. Workers are started when the app boots
+and restarted on the next submission if they die.
+
+Start a worker by hand with: python -m storage.jobs --worker
+Run a single job in the current process with: python -m storage.jobs JOB_ID
+"""
+import argparse
+import fcntl
+import json
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from processing import documents
+from processing import instrumentation
+from processing import pipeline
+from processing import processor
+from processing import resources
+from processing import similarity
+from processing import warmup
+from storage import cache
+from storage import incremental
+from storage import runs
+from summary import summary
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Jobs are stored next to the app unless SURVEY_JOBS_DIR points elsewhere
+JOBS_DIR = os.environ.get('SURVEY_JOBS_DIR', os.path.join(ROOT_DIR, '.jobs'))
+
+# Number of analyses allowed to run at once on this host; further jobs wait for a free slot
+MAX_CONCURRENT_JOBS = int(os.environ.get('SURVEY_MAX_JOBS', 2))
+
+# Seconds an idle worker waits between looks for queued jobs
+WORKER_POLL_SECONDS = 0.5
+
+STATUS_NAME = 'status.json'
+FINISHED_STATES = ('done', 'failed', 'cancelled')
+
+# Sent to a worker to stop the job it is running; the worker itself carries on
+CANCEL_SIGNAL = signal.SIGUSR1
+
+# Worker processes started by this process by PID, so exited ones can be reaped and detected
+_workers = {}
+
+# Set when a cancellation signal arrives; the running job stops at its next checkpoint
+_cancel_signalled = threading.Event()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def job_dir(job_id, root=JOBS_DIR):
+    return os.path.join(root, job_id)
+
+
+def exists(job_id, root=JOBS_DIR):
+    """
+    Tells whether a job with this ID is in the job store. IDs coming from URLs are untrusted,
+    so anything that is not a plain folder name is rejected.
+    """
+    return bool(re.fullmatch(r'[\w-]+', job_id or '')) and os.path.exists(os.path.join(job_dir(job_id, root), STATUS_NAME))
+
+
+def _write_json(path, data):
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w') as file:
+        json.dump(data, file, indent=2, default=int)
+    os.replace(temporary_path, path)
+
+
+def _update_status(job_id, root=JOBS_DIR, **fields):
+    path = os.path.join(job_dir(job_id, root), STATUS_NAME)
+    with open(path) as file:
+        status = json.load(file)
+    status.update(fields, updated=time.time())
+    _write_json(path, status)
+    return status
+
+
+def _claim(job_id, root=JOBS_DIR):
+    """
+    Marks the job as taken by this process. Only one process can claim a job, so a queued job
+    is run once even with several workers looking for work, and never after being cancelled.
+    """
+    try:
+        descriptor = os.open(os.path.join(job_dir(job_id, root), 'claim'), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(descriptor, 'w') as file:
+        file.write(str(os.getpid()))
+    return True
+
+
+def _pid(job_id, root=JOBS_DIR):
+    """
+    Returns the PID of the process that claimed the job, or None while it is queued.
+    """
+    try:
+        with open(os.path.join(job_dir(job_id, root), 'claim')) as file:
+            return int(file.read())
+    except (OSError, ValueError):
+        return None
+
+
+def _process_alive(pid):
+    process = _workers.get(pid)
+    if process is not None:
+        # Also reaps the worker if it has exited
+        return process.poll() is None
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def submit(df, topic, detail='default', parameters=None, groups=None, root=JOBS_DIR):
+    """
+    Queues an analysis for the next free worker, starting workers if none are running. An
+    analysis identical to one already in the result cache is finished straight away, without
+    waiting for a worker.
+
+    Parameters:
+        df (pd.DataFrame): Prepared DataFrame with a 'responses' column, or with 'document' and 'text'
+                           columns for documents (see processing.documents).
+        topic (str): The overarching topic used for summarization.
+        detail (str): Clustering granularity.
+        parameters (dict, optional): Extra settings passed to the result cache, e.g. {'summary_mode': 'batched'},
+                                     or {'documents': True} to analyze documents.
+        groups (dict, optional): Maps group labels to row positions for a per-group analysis after the overall one.
+        root (str): Folder of the job store.
+
+    Returns:
+        str: The job ID.
+    """
+    gc_jobs(root=root)
+
+    job_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    folder = job_dir(job_id, root)
+    os.makedirs(folder)
+
+    df.to_parquet(os.path.join(folder, 'input.parquet'), index=False)
+    _write_json(os.path.join(folder, 'spec.json'), {
+        'topic': topic,
+        'detail': detail,
+        'parameters': parameters or {},
+        'groups': {str(label): [int(position) for position in positions] for label, positions in (groups or {}).items()},
+    })
+    status = {
+        'job_id': job_id,
+        'state': 'queued',
+        'created': time.time(),
+        'updated': time.time(),
+        'steps': 3 if groups else 2,
+        'step': 0,
+        'message': "Waiting to start...",
+        'rows': len(df),
+        'topic': topic,
+    }
+
+    # A repeated analysis is read from the run store, so it does not queue behind busy workers.
+    # Per-group analyses are not cached, so jobs with groups always go to a worker
+    run_id = None if groups else cache.find_cached(df, topic, detail, parameters)
+    if run_id:
+        status.update(state='done', finished=time.time(), message="Done.", run_id=run_id, cached=True, groups={})
+        _write_json(os.path.join(folder, STATUS_NAME), status)
+        return job_id
+
+    _write_json(os.path.join(folder, STATUS_NAME), status)
+    start_workers(root)
+    return job_id
+
+
+def read_status(job_id, root=JOBS_DIR):
+    """
+    Returns the job's status, marking it failed if its worker exited without finishing. While
+    the job is queued, workers that have died are replaced.
+
+    The status holds 'state' (queued, running, done, failed or cancelled), 'step' out of
+    'steps', a progress 'message', 'clusters_done' and 'clusters_total' while summarizing,
+    and 'run_id' once done or 'error' once failed.
+    """
+    path = os.path.join(job_dir(job_id, root), STATUS_NAME)
+    if not os.path.exists(path):
+        raise ValueError(f"Job '{job_id}' does not exist.")
+
+    with open(path) as file:
+        status = json.load(file)
+
+    if status['state'] in FINISHED_STATES:
+        return status
+
+    pid = _pid(job_id, root)
+    if pid is None:
+        start_workers(root)
+    elif not _process_alive(pid):
+        # Re-read in case the worker finished between the two reads
+        with open(path) as file:
+            status = json.load(file)
+        if status['state'] not in FINISHED_STATES and _cancel_requested(job_id, root):
+            # Stopped before it could record the cancellation itself
+            status = _update_status(job_id, root, state='cancelled', message="Cancelled.")
+        elif status['state'] not in FINISHED_STATES:
+            status = _update_status(job_id, root, state='failed', error="The worker process exited unexpectedly.")
+
+    return status
+
+
+def _cancel_requested(job_id, root=JOBS_DIR):
+    return os.path.exists(os.path.join(job_dir(job_id, root), 'cancel'))
+
+
+def cancel(job_id, root=JOBS_DIR):
+    """
+    Stops a queued or running job. The request is recorded first, so a job that a worker is
+    about to start is skipped instead. A running job stops at its next checkpoint, i.e. after
+    clustering or after its next cluster summary. A job that has already finished is left as it is.
+    """
+    with open(os.path.join(job_dir(job_id, root), STATUS_NAME)) as file:
+        if json.load(file)['state'] in FINISHED_STATES:
+            return
+
+    open(os.path.join(job_dir(job_id, root), 'cancel'), 'w').close()
+    if _claim(job_id, root):
+        _update_status(job_id, root, state='cancelled', finished=time.time(), message="Cancelled.")
+        return
+
+    pid = _pid(job_id, root)
+    if pid is not None and _process_alive(pid):
+        os.kill(pid, CANCEL_SIGNAL)
+
+
+def list_jobs(root=JOBS_DIR):
+    """
+    Returns the status of every job, newest first.
+    """
+    statuses = [read_status(job_id, root) for job_id in _job_ids(root)]
+    return sorted(statuses, key=lambda status: status['created'], reverse=True)
+
+
+def _job_ids(root=JOBS_DIR):
+    """
+    Returns the IDs of the jobs in the store, oldest first since IDs start with their creation time.
+    """
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root) if os.path.exists(os.path.join(root, name, STATUS_NAME)))
+
+
+def gc_jobs(max_age_days=7, root=JOBS_DIR):
+    """
+    Deletes finished jobs older than `max_age_days`. Their results stay in the run store.
+    """
+    cutoff = time.time() - max_age_days * 24 * 60 * 60
+    for status in list_jobs(root):
+        if status['state'] in FINISHED_STATES and status['updated'] < cutoff:
+            shutil.rmtree(job_dir(status['job_id'], root), ignore_errors=True)
+
+
+def load_progress(job_id, with_preview=True, root=JOBS_DIR):
+    """
+    Returns what a job has produced so far: the clustered responses, or None before
+    clustering has finished, and the cluster summaries streamed so far as {view: {cluster: result}}.
+
+    With with_preview, clusters whose summary has not arrived yet are given their keyword
+    label from the c-TF-IDF preview as a stand-in result marked with 'preview'.
+    """
+    folder = job_dir(job_id, root)
+    points_path = os.path.join(folder, 'points.parquet')
+    points = pd.read_parquet(points_path) if os.path.exists(points_path) else None
+
+    results = {}
+    preview_path = os.path.join(folder, 'preview.json')
+    if with_preview and os.path.exists(preview_path):
+        with open(preview_path) as file:
+            for view, titles in json.load(file).items():
+                results[view] = {
+                    int(label): {'cluster': int(label), 'title': title, 'summary': "", 'representatives': [], 'preview': True}
+                    for label, title in titles.items()
+                }
+
+    events_path = os.path.join(folder, 'events.jsonl')
+    if os.path.exists(events_path):
+        with open(events_path) as file:
+            for line in file:
+                # The last line may still be being written
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                results.setdefault(result.pop('view'), {})[result['cluster']] = result
+
+    return points, results
+
+
+def load_result(job_id, root=JOBS_DIR):
+    """
+    Loads the results of a finished job.
+
+    Returns:
+        tuple: (processed_dfs, summaries, group_results) where group_results maps each group label
+               to {'processed_dfs', 'summaries'} or {'error'} as in pipeline.run_group_pipeline.
+    """
+    status = read_status(job_id, root)
+    if status['state'] != 'done':
+        raise ValueError(f"Job '{job_id}' is {status['state']}, not done.")
+
+    processed_dfs, summaries, _ = runs.load_run(status['run_id'])
+
+    group_results = {}
+    groups_root = os.path.join(job_dir(job_id, root), 'groups')
+    for label, group in status.get('groups', {}).items():
+        if 'run_id' in group:
+            group_processed_dfs, group_summaries, _ = runs.load_run(group['run_id'], root=groups_root)
+            group_results[label] = {'processed_dfs': group_processed_dfs, 'summaries': group_summaries}
+        else:
+            group_results[label] = group
+
+    return processed_dfs, summaries, group_results
+
+
+
+
+class _HostSlot:
+    """
+    Holds one of MAX_CONCURRENT_JOBS lock files shared by every process on the host, for as long
+    as a worker runs. The operating system releases the lock if the worker dies, so slots are
+    never leaked.
+    """
+
+    def __init__(self, root):
+        self.folder = os.path.join(root, 'slots')
+        self.file = None
+        self.slot = None
+
+    def try_acquire(self):
+        os.makedirs(self.folder, exist_ok=True)
+        for slot in range(MAX_CONCURRENT_JOBS):
+            # Opened without truncating, as the file holds the PID of the worker that owns it
+            file = open(os.path.join(self.folder, f'slot-{slot}.lock'), 'a+')
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                file.close()
+                continue
+            file.seek(0)
+            file.truncate()
+            file.write(str(os.getpid()))
+            file.flush()
+            self.file, self.slot = file, slot
+            return True
+        return False
+
+    def release(self):
+        if self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+
+    @classmethod
+    def owners(cls, root):
+        """
+        Returns the PIDs of the workers holding a slot.
+        """
+        folder = os.path.join(root, 'slots')
+        pids = set()
+        for slot in range(MAX_CONCURRENT_JOBS):
+            path = os.path.join(folder, f'slot-{slot}.lock')
+            if not os.path.exists(path):
+                continue
+            with open(path) as file:
+                try:
+                    fcntl.flock(file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    try:
+                        pids.add(int(file.read()))
+                    except ValueError:
+                        pass
+                    continue
+                fcntl.flock(file, fcntl.LOCK_UN)
+        return pids
+
+
+def start_workers(root=JOBS_DIR):
+    """
+    Starts a worker process for every slot of the host that has none. Workers run in their
+    own session, so they outlive the app process and stay warm across app restarts.
+
+    Returns:
+        int: The number of workers started.
+    """
+    for pid, process in list(_workers.items()):
+        if process.poll() is not None:
+            del _workers[pid]
+
+    owners = _HostSlot.owners(root)
+    # Workers started by this process that have not taken their slot yet
+    starting = [pid for pid in _workers if pid not in owners]
+
+    missing = MAX_CONCURRENT_JOBS - len(owners) - len(starting)
+    if missing <= 0:
+        return 0
+
+    folder = os.path.join(root, 'workers')
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, 'worker.log'), 'a') as log:
+        for _ in range(missing):
+            process = subprocess.Popen(
+                [sys.executable, '-m', 'storage.jobs', '--worker', '--root', root],
+                cwd=ROOT_DIR, stdout=log, stderr=subprocess.STDOUT, start_new_session=True
+            )
+            _workers[process.pid] = process
+    return missing
+
+
+def list_workers(root=JOBS_DIR):
+    """
+    Returns the status of every running worker, in slot order.
+
+    A worker's status holds its 'slot' and 'pid', its 'state' (warming, idle or busy), the
+    'job_id' it is running, how many jobs it has run, its instrumentation timings, including
+    'warm_up' and each of its steps, and its gauges, including the 'threads' its current step
+    may use (see processing.resources).
+    """
+    folder = os.path.join(root, 'workers')
+    workers = []
+    for slot in range(MAX_CONCURRENT_JOBS):
+        path = os.path.join(folder, f'slot-{slot}.json')
+        if not os.path.exists(path):
+            continue
+        with open(path) as file:
+            worker = json.load(file)
+        if _process_alive(worker['pid']):
+            workers.append(worker)
+    return workers
+
+
+def running_jobs(root=JOBS_DIR):
+    """
+    Returns the number of workers warming up or running a job, which compete for the host's cores.
+    """
+    return sum(worker['state'] in ('warming', 'busy') for worker in list_workers(root))
+
+
+def runs_in_use(root=JOBS_DIR):
+    """
+    Returns the IDs of the runs holding the results of jobs still in the job store, which a
+    session, or a page reopened from its URL, may load at any time (see load_result).
+    """
+    run_ids = set()
+    for job_id in _job_ids(root):
+        # Read directly rather than with read_status, which may start workers; jobs can be
+        # collected meanwhile
+        try:
+            with open(os.path.join(job_dir(job_id, root), STATUS_NAME)) as file:
+                status = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            continue
+        if status.get('run_id'):
+            run_ids.add(status['run_id'])
+    return run_ids
+
+
+def _cancelled(signum, frame):
+    # Only noted here: raising from the handler could stop the job halfway through writing its
+    # status, its events or a run
+    _cancel_signalled.set()
+
+
+def _check_cancelled(job_id, root=JOBS_DIR):
+    """
+    Stops the job if it has been cancelled, at a point where none of its files are half-written.
+    A signal meant for a job that finished before it arrived does not stop the next one.
+    """
+    if _cancel_signalled.is_set() and _cancel_requested(job_id, root):
+        raise JobCancelled()
+
+
+def run_job(job_id, root=JOBS_DIR):
+    """
+    Runs a claimed job to completion in the current process, recording progress in its status.
+    """
+    # Imported here because scikit-learn is slow to import and only the worker needs it
+    from summary import ctfidf
+
+    folder = job_dir(job_id, root)
+    with open(os.path.join(folder, 'spec.json')) as file:
+        spec = json.load(file)
+    df = pd.read_parquet(os.path.join(folder, 'input.parquet'))
+    topic, detail, parameters = spec['topic'], spec['detail'], spec['parameters']
+    summary_mode = parameters.get('summary_mode', 'sequential')
+
+    def build_index(raw_embeddings):
+        with instrumentation.timed('job.indexing'):
+            return similarity.build_index(raw_embeddings)
+
+    def compute(df):
+        if parameters.get('incremental'):
+            base = incremental.find_base_run(df, topic, detail, parameters)
+            reason = incremental.refit_reason(base, len(df)) if base else "no earlier analysis of this survey was found"
+            if reason is None:
+                _update_status(job_id, root, step=1, message="Adding the new responses to the earlier analysis...")
+                with instrumentation.timed('job.incremental'):
+                    processed_dfs, summaries = incremental.update_run(df, base, topic, detail, summary_mode)
+                _check_cancelled(job_id, root)
+                processed_dfs['labels_df'].to_parquet(os.path.join(folder, 'points.parquet'), index=False)
+                _update_status(job_id, root, message="Indexing responses for search...")
+                processed_dfs['ann_index'] = build_index(processed_dfs['embeddings'])
+                return processed_dfs, summaries
+            print(f"Analyzing job {job_id} from scratch because {reason}.", flush=True)
+
+        _update_status(job_id, root, step=1, message="Processing and clustering data...")
+        with instrumentation.timed('job.clustering'):
+            if parameters.get('documents'):
+                # Documents are split into chunks, which are then clustered like responses
+                processed_dfs = documents.process_documents(df, detail=detail)
+                _update_status(job_id, root, throughput=processed_dfs['throughput'])
+            else:
+                processed_dfs = processor.feature_engineering(df, detail=detail)
+        _check_cancelled(job_id, root)
+
+        # Lets the app draw the clusters while their summaries are generated
+        processed_dfs['labels_df'].to_parquet(os.path.join(folder, 'points.parquet'), index=False)
+        try:
+            _write_json(os.path.join(folder, 'preview.json'), {
+                view: dict(zip(frame['cluster'].astype(str), frame['Title']))
+                for view, frame in ctfidf.SUMMARIZER(processed_dfs).items()
+            })
+        except Exception:
+            # The keyword titles are only shown until the summaries arrive, so the job carries on without them
+            traceback.print_exc()
+
+        total = sum(len(processed_dfs[centroids_key]) for centroids_key, _ in summary.VIEWS.values())
+        _update_status(job_id, root, step=2, message="Summarizing clusters...", clusters_done=0, clusters_total=total)
+
+        # The search index is built while the summaries are generated, as they mostly wait on the model API
+        results = {view: {} for view in summary.VIEWS}
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            indexing = executor.submit(build_index, processed_dfs['embeddings'])
+
+            with instrumentation.timed('job.summaries'), open(os.path.join(folder, 'events.jsonl'), 'a') as events:
+                for event in summary.stream_summaries(processed_dfs, topic=topic, mode=summary_mode):
+                    results[event['view']][event['cluster']] = event
+                    events.write(json.dumps({key: value for key, value in event.items() if key != 'exception'}, default=int) + '\n')
+                    events.flush()
+                    _update_status(job_id, root, clusters_done=sum(len(view_results) for view_results in results.values()))
+                    _check_cancelled(job_id, root)
+
+            errors = [result for view_results in results.values() for result in view_results.values() if 'exception' in result]
+            if errors:
+                raise RuntimeError(f"{len(errors)} of {total} clusters could not be summarized: {errors[0]['error']}")
+
+            _update_status(job_id, root, message="Indexing responses for search...")
+            processed_dfs['ann_index'] = indexing.result()
+
+        return processed_dfs, summary.assemble_summaries(processed_dfs, results)
+
+    try:
+        # Cancellations are only acted on at checkpoints (see _check_cancelled), between writes
+        _cancel_signalled.clear()
+        if _cancel_requested(job_id, root):
+            raise JobCancelled()
+
+        _update_status(job_id, root, state='running', started=time.time(), message="Starting...", worker=os.getpid())
+        with instrumentation.timed('job.total'):
+            result = cache.cached_pipeline(df, topic, detail, compute, parameters=parameters)
+
+            group_runs = {}
+            if spec['groups']:
+                _check_cancelled(job_id, root)
+                _update_status(job_id, root, step=3, message="Analyzing each group...")
+                group_results = pipeline.run_group_pipeline(
+                    df, spec['groups'], topic=topic, detail=detail,
+                    raw_embeddings=result['processed_dfs']['embeddings'], summary_mode=summary_mode
+                )
+                _check_cancelled(job_id, root)
+                for label, group in group_results.items():
+                    if 'error' in group:
+                        group_runs[label] = group
+                    else:
+                        group_runs[label] = {'run_id': runs.save_run(
+                            group['processed_dfs'], group['summaries'], fingerprint=runs.fingerprint_dataframe(df),
+                            parameters={'topic': topic, 'detail': detail, 'group': label, **parameters},
+                            root=os.path.join(folder, 'groups')
+                        )}
+
+        _update_status(
+            job_id, root, state='done', finished=time.time(), message="Done.",
+            run_id=result['run_id'], cached=result['cached'], groups=group_runs
+        )
+    except JobCancelled:
+        _update_status(job_id, root, state='cancelled', finished=time.time(), message="Cancelled.")
+    except Exception as e:
+        traceback.print_exc()
+        _update_status(job_id, root, state='failed', finished=time.time(), error=str(e))
+
+
+def _next_job(root=JOBS_DIR):
+    """
+    Claims the oldest queued job, returning its ID, or None if there is none.
+    """
+    for job_id in _job_ids(root):
+        if os.path.exists(os.path.join(job_dir(job_id, root), 'claim')):
+            continue
+        with open(os.path.join(job_dir(job_id, root), STATUS_NAME)) as file:
+            if json.load(file)['state'] != 'queued':
+                continue
+        if _claim(job_id, root):
+            return job_id
+    return None
+
+
+def run_worker(root=JOBS_DIR):
+    """
+    Takes a free slot of the host, warms up, then runs queued jobs one at a time until stopped.
+    Returns straight away if every slot already has a worker.
+    """
+    slot = _HostSlot(root)
+    if not slot.try_acquire():
+        print("Every slot already has a worker.")
+        return
+
+    signal.signal(CANCEL_SIGNAL, _cancelled)
+
+    folder = os.path.join(root, 'workers')
+    os.makedirs(folder, exist_ok=True)
+    worker = {'slot': slot.slot, 'pid': os.getpid(), 'started': time.time(), 'state': 'warming', 'job_id': None, 'jobs_run': 0}
+    # The job's steps, which may run in several threads, publish their thread allocation too
+    publish_lock = threading.Lock()
+
+    def publish(**fields):
+        with publish_lock:
+            worker.update(fields, updated=time.time(), timings=instrumentation.snapshot(), gauges=instrumentation.gauges())
+            _write_json(os.path.join(folder, f'slot-{slot.slot}.json'), worker)
+
+    # Jobs share the host's threads with the jobs of the other workers
+    resources.set_job_counter(lambda: max(1, running_jobs(root)))
+    # Evicting cached results spares the runs other sessions are still showing
+    cache.set_runs_in_use(lambda: runs_in_use(root))
+    instrumentation.add_listener(lambda name, value: publish())
+
+    publish()
+    print(f"Worker {os.getpid()} took slot {slot.slot}; warming up...", flush=True)
+    try:
+        seconds = warmup.warm_up()
+        print(f"Worker {os.getpid()} warmed up in {seconds['total']:.2f} s.", flush=True)
+    except Exception:
+        # A worker that could not warm up can still run jobs, only more slowly
+        traceback.print_exc()
+    publish(state='idle', ready=time.time())
+
+    try:
+        while True:
+            job_id = _next_job(root)
+            if job_id is None:
+                time.sleep(WORKER_POLL_SECONDS)
+                continue
+
+            publish(state='busy', job_id=job_id)
+            run_job(job_id, root)
+            publish(state='idle', job_id=None, jobs_run=worker['jobs_run'] + 1)
+    finally:
+        slot.release()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run analysis jobs from the job store.")
+    parser.add_argument('job_id', nargs='?', help="Run this queued job once in the current process.")
+    parser.add_argument('--worker', action='store_true', help="Run as a worker taking queued jobs until stopped.")
+    parser.add_argument('--root', default=JOBS_DIR, help="Folder of the job store.")
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(args.root)
+    elif args.job_id:
+        if not _claim(args.job_id, args.root):
+            parser.error(f"Job '{args.job_id}' has already been taken by a worker or cancelled.")
+        signal.signal(CANCEL_SIGNAL, _cancelled)
+        run_job(args.job_id, args.root)
+    else:
+        parser.error("Give a job ID or --worker.")
+
+
+if __name__ == '__main__':
+    main()
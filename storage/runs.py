@@ -0,0 +1,315 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from processing import cubes
+from processing import processor
+
+# Runs are stored next to the app unless SURVEY_RUN_STORE points elsewhere
+RUN_STORE_DIR = os.environ.get(
+    'SURVEY_RUN_STORE',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.runs')
+)
+
+MANIFEST_NAME = 'manifest.json'
+REDUCERS_NAME = 'reducers.joblib'
+INDEX_NAME = 'ann_index.joblib'
+CUBE_NAME = 'cube.parquet'
+
+# Runs created or reopened more recently than this are never collected, as sessions may still be reading them
+RUN_GRACE_SECONDS = float(os.environ.get('SURVEY_RUN_GRACE_HOURS', 24)) * 60 * 60
+
+SUMMARY_KEYS = ['cluster_summary', 'positive_cluster_summary', 'negative_cluster_summary']
+
+
+def fingerprint_dataframe(df):
+    """
+    Hashes the column names and cell values of a DataFrame, ignoring its index.
+
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([str(column) for column in df.columns]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def save_run(processed_dfs, summaries, fingerprint, parameters, cache_key=None, root=RUN_STORE_DIR):
+    """
+    Saves the artifacts of a completed analysis as a new run in the run store.
+
+    Responses with their sentiment, 2D coordinates and cluster labels are written to
+    points.parquet, the full embeddings to embeddings.npy, the fitted PCA and UMAP models, if
+    any, to reducers.joblib, the nearest neighbour index over the embeddings, if any, to
+    ann_index.joblib, their aggregation by cluster, sentiment and demographics to cube.parquet,
+    and the cluster summaries (centroids, counts, titles and summaries)
+    to one Parquet file per view. How an incrementally updated run was derived from an
+    earlier one is recorded from processed_dfs['incremental'] in the manifest.
+
+    Parameters:
+        processed_dfs (dict): Output of processor.feature_engineering.
+        summaries (dict): Output of summary.SUMMARIZER.
+        fingerprint (str): Fingerprint of the analyzed inputs (see fingerprint_dataframe).
+        parameters (dict): JSON-serializable settings the run was produced with.
+        cache_key (str, optional): Key under which the result cache can find this run.
+        root (str): Folder of the run store.
+
+    Returns:
+        str: The new run ID.
+    """
+    run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    os.makedirs(root, exist_ok=True)
+
+    # Write into a temporary folder first so a crash never leaves a half-written run behind
+    temporary_dir = os.path.join(root, f'.{run_id}.tmp')
+    os.makedirs(temporary_dir)
+
+    processed_dfs['labels_df'].to_parquet(os.path.join(temporary_dir, 'points.parquet'), index=False)
+    np.save(os.path.join(temporary_dir, 'embeddings.npy'), np.ascontiguousarray(processed_dfs['embeddings']))
+    if processed_dfs.get('reducers') is not None:
+        # joblib is only needed when saving or reopening reducers, so it stays off the app's import path
+        import joblib
+        joblib.dump(processed_dfs['reducers'], os.path.join(temporary_dir, REDUCERS_NAME))
+    if processed_dfs.get('ann_index') is not None:
+        import joblib
+        joblib.dump(processed_dfs['ann_index'], os.path.join(temporary_dir, INDEX_NAME))
+
+    if processed_dfs.get('cube') is not None:
+        processed_dfs['cube'].to_parquet(os.path.join(temporary_dir, CUBE_NAME), index=False)
+
+    for key in SUMMARY_KEYS:
+        summaries[key].to_parquet(os.path.join(temporary_dir, f'{key}.parquet'), index=False)
+
+    manifest = {
+        'run_id': run_id,
+        'created': time.time(),
+        'fingerprint': fingerprint,
+        'cache_key': cache_key,
+        'parameters': parameters,
+        'rows': len(processed_dfs['labels_df']),
+        'clusters': int(summaries['cluster_summary']['cluster'].nunique()),
+        'incremental': processed_dfs.get('incremental'),
+    }
+    with open(os.path.join(temporary_dir, MANIFEST_NAME), 'w') as file:
+        json.dump(manifest, file, indent=2)
+
+    os.replace(temporary_dir, os.path.join(root, run_id))
+
+    return run_id
+
+
+def load_run(run_id, root=RUN_STORE_DIR):
+    """
+    Reopens a saved run without recomputing anything.
+
+    Embeddings, the largest artifact, are memory-mapped rather than read into memory. The
+    Parquet tables are read through a memory map but converted to pandas, so they are copied
+    into memory; see benchmarks/run_store_profile.py for reload times and memory.
+
+    Returns:
+        tuple: (processed_dfs, summaries, manifest) in the same shape as a fresh analysis.
+    """
+    run_dir = os.path.join(root, run_id)
+    if not os.path.isdir(run_dir):
+        raise ValueError(f"Run '{run_id}' does not exist.")
+
+    manifest_path = os.path.join(run_dir, MANIFEST_NAME)
+    with open(manifest_path) as file:
+        manifest = json.load(file)
+    # Records when the run was last opened, which keeps it from being collected while in use
+    os.utime(manifest_path)
+
+    points = pq.read_table(os.path.join(run_dir, 'points.parquet'), memory_map=True).to_pandas()
+
+    processed_dfs = processor.build_views(points)
+    processed_dfs['labels_df'] = points
+    processed_dfs['embeddings'] = np.load(os.path.join(run_dir, 'embeddings.npy'), mmap_mode='r')
+    processed_dfs['reduced_embeddings_df'] = points.drop(columns=['cluster'])
+    processed_dfs['sentiment_analysis_df'] = points.drop(columns=['Umap_1', 'Umap_2', 'cluster'])
+
+    # Runs saved before demographic cubes existed get one built from their responses
+    cube_path = os.path.join(run_dir, CUBE_NAME)
+    if os.path.exists(cube_path):
+        processed_dfs['cube'] = pq.read_table(cube_path, memory_map=True).to_pandas()
+    else:
+        processed_dfs['cube'] = cubes.build_cube(points)
+
+    summaries = {
+        key: pq.read_table(os.path.join(run_dir, f'{key}.parquet'), memory_map=True).to_pandas()
+        for key in SUMMARY_KEYS
+    }
+
+    return processed_dfs, summaries, manifest
+
+
+def load_reducers(run_id, root=RUN_STORE_DIR):
+    """
+    Returns the PCA and UMAP models a run was reduced with as {'pca', 'umap'}, or None for runs
+    saved without them.
+    """
+    path = os.path.join(root, run_id, REDUCERS_NAME)
+    if not os.path.exists(path):
+        return None
+
+    import joblib
+    return joblib.load(path)
+
+
+def load_index(run_id, root=RUN_STORE_DIR):
+    """
+    Returns the nearest neighbour index over a run's embeddings (see processing.similarity),
+    or None for runs saved without one or deleted meanwhile.
+    """
+    import joblib
+
+    try:
+        return joblib.load(os.path.join(root, run_id, INDEX_NAME))
+    except FileNotFoundError:
+        return None
+
+
+def save_index(run_id, index, root=RUN_STORE_DIR):
+    """
+    Adds a nearest neighbour index to a run saved without one.
+
+    Returns:
+        bool: False if the run was deleted meanwhile, e.g. by gc_runs in another process, so
+              the index could not be saved.
+    """
+    import joblib
+
+    path = os.path.join(root, run_id, INDEX_NAME)
+    temporary_path = path + '.tmp'
+    try:
+        joblib.dump(index, temporary_path)
+        os.replace(temporary_path, path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def list_runs(root=RUN_STORE_DIR):
+    """
+    Returns the manifests of all saved runs, newest first.
+
+    """
+    if not os.path.isdir(root):
+        return []
+
+    manifests = []
+    for name in os.listdir(root):
+        if name.startswith('.'):
+            continue
+        # Another process may delete the run while it is listed, so it is read without checking first
+        try:
+            with open(os.path.join(root, name, MANIFEST_NAME)) as file:
+                manifests.append(json.load(file))
+        except (FileNotFoundError, NotADirectoryError, json.JSONDecodeError):
+            continue
+
+    return sorted(manifests, key=lambda manifest: manifest['created'], reverse=True)
+
+
+def find_run(cache_key, root=RUN_STORE_DIR):
+    """
+    Returns the ID of the newest run saved under the given cache key, or None.
+
+    """
+    for manifest in list_runs(root):
+        if manifest.get('cache_key') == cache_key:
+            return manifest['run_id']
+    return None
+
+
+def run_size(run_id, root=RUN_STORE_DIR):
+    """
+    Returns the total size in bytes of a run's artifacts.
+
+    """
+    run_dir = os.path.join(root, run_id)
+    total = 0
+    try:
+        names = os.listdir(run_dir)
+    except FileNotFoundError:
+        return 0
+    for name in names:
+        # Files disappear if another process deletes the run meanwhile
+        try:
+            total += os.path.getsize(os.path.join(run_dir, name))
+        except FileNotFoundError:
+            continue
+    return total
+
+
+def delete_run(run_id, root=RUN_STORE_DIR):
+    """
+    Removes a run and all of its artifacts.
+
+    """
+    shutil.rmtree(os.path.join(root, run_id), ignore_errors=True)
+
+
+def last_used(run_id, root=RUN_STORE_DIR):
+    """
+    Returns when a run was last saved or opened, as a timestamp, or None if it no longer exists.
+    """
+    try:
+        return os.path.getmtime(os.path.join(root, run_id, MANIFEST_NAME))
+    except FileNotFoundError:
+        return None
+
+
+def gc_runs(keep=20, max_age_days=30, max_bytes=None, root=RUN_STORE_DIR, in_use=(), grace_seconds=RUN_GRACE_SECONDS):
+    """
+    Deletes runs beyond the newest `keep`, any run older than `max_age_days`, and the oldest
+    runs once the store holds more than `max_bytes`.
+
+    Runs listed in `in_use`, e.g. the results of jobs sessions are still attached to, and runs
+    saved or opened within the last `grace_seconds` are kept regardless, as other sessions may
+    be reading them.
+
+    Returns:
+        list: IDs of the deleted runs.
+    """
+    now = time.time()
+    cutoff = now - max_age_days * 24 * 60 * 60
+
+    removed = []
+    total_bytes = 0
+    for position, manifest in enumerate(list_runs(root)):
+        run_id = manifest['run_id']
+        size = run_size(run_id, root)
+        used = last_used(run_id, root)
+        if run_id in in_use or (used is not None and used > now - grace_seconds):
+            total_bytes += size
+            continue
+
+        # The newest run is always kept, even if it alone exceeds the budget
+        over_budget = max_bytes is not None and position > 0 and total_bytes + size > max_bytes
+        if position >= keep or manifest['created'] < cutoff or over_budget:
+            delete_run(run_id, root)
+            removed.append(run_id)
+        else:
+            total_bytes += size
+
+    # Clean up temporary folders left behind by interrupted saves
+    if os.path.isdir(root):
+        for name in os.listdir(root):
+            if not (name.startswith('.') and name.endswith('.tmp')):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stale = os.path.getmtime(path) < time.time() - 60 * 60
+            except FileNotFoundError:
+                # Renamed into place or removed by another process meanwhile
+                continue
+            if stale:
+                shutil.rmtree(path, ignore_errors=True)
+
+    return removed
@@ -0,0 +1,42 @@
+import importlib
+
+# Summarizer backends by name. Each module provides summarize_clusters, asummarize_clusters,
+# asummarizer and SUMMARIZER with the signatures of summary.summary, and is imported only when
+# first used, so local backends work without an API key or network access.
+BACKENDS = {
+    'gemini': 'summary.summary',
+    'ctfidf': 'summary.ctfidf',
+}
+
+DEFAULT_BACKEND = 'gemini'
+
+
+def register_backend(name, module_name):
+    """
+    Makes a summarizer module available under the given backend name.
+    """
+    BACKENDS[name] = module_name
+
+
+def get_backend(name=DEFAULT_BACKEND):
+    """
+    Returns the module implementing the named summarizer backend.
+
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown summarizer backend '{name}'. Available backends: {', '.join(BACKENDS)}")
+    return importlib.import_module(BACKENDS[name])
+
+
+def summarize_clusters(centroids, processed_df, topic, backend=DEFAULT_BACKEND, **options):
+    """
+    Summarizes one view's clusters with the named backend.
+    """
+    return get_backend(backend).summarize_clusters(centroids, processed_df, topic, **options)
+
+
+def SUMMARIZER(dataframes, topic, backend=DEFAULT_BACKEND, **options):
+    """
+    Summarizes clusters for positive, negative, and overall datasets with the named backend.
+    """
+    return get_backend(backend).SUMMARIZER(dataframes, topic=topic, **options)
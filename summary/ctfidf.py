@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.preprocessing import normalize
+
+
+def class_tfidf(processed_df, ngram_range=(1, 2), min_df=2):
+    """
+    Computes class-based TF-IDF (c-TF-IDF) weights, treating all responses in a cluster as one document.
+
+    A term's weight in a cluster is its frequency within the cluster, normalized by the cluster's
+    size in words, multiplied by log(1 + A / f), where A is the average number of words per
+    cluster and f is the term's frequency over all clusters.
+
+    Parameters:
+        processed_df (pd.DataFrame): Responses with a 'cluster' column, noise removed.
+        ngram_range (tuple): Range of n-gram sizes used as terms.
+        min_df (int): Minimum number of responses a term must appear in.
+
+    Returns:
+        tuple: (labels, terms, weights, counts, idf) where weights is a sparse (clusters x terms)
+               matrix in the order of labels and counts is the sparse (responses x terms) matrix.
+
+    Raises:
+        ValueError: If the responses contain no term other than stop words.
+    """
+    labels, codes = np.unique(processed_df['cluster'].to_numpy(), return_inverse=True)
+
+    responses = processed_df['responses'].astype(str)
+    vectorizer = CountVectorizer(stop_words='english', ngram_range=ngram_range, min_df=min(min_df, len(processed_df)))
+    try:
+        counts = vectorizer.fit_transform(responses)
+    except ValueError:
+        # Small views may not have any term repeated across responses, so every term is kept
+        vectorizer.set_params(min_df=1)
+        counts = vectorizer.fit_transform(responses)
+
+    # Sum the term counts of each cluster's responses with one sparse product
+    membership = sparse.csr_matrix(
+        (np.ones(len(codes)), (codes, np.arange(len(codes)))), shape=(len(labels), len(codes))
+    )
+    class_counts = membership @ counts
+
+    term_frequency = np.asarray(class_counts.sum(axis=0)).ravel()
+    average_words = class_counts.sum() / len(labels)
+    idf = np.log(1 + average_words / np.maximum(term_frequency, 1))
+
+    weights = normalize(class_counts, norm='l1') @ sparse.diags(idf)
+
+    return labels, vectorizer.get_feature_names_out(), weights.tocsr(), counts, idf
+
+
+def top_terms(weights, terms, n_terms):
+    """
+    Returns the n_terms highest weighted terms of every row of a sparse weight matrix.
+    """
+    keywords = []
+    for row in range(weights.shape[0]):
+        start, end = weights.indptr[row], weights.indptr[row + 1]
+        data = weights.data[start:end]
+        order = np.argsort(-data)[:n_terms]
+        keywords.append([terms[weights.indices[start + position]] for position in order])
+    return keywords
+
+
+def summarize_clusters(centroids, processed_df, topic=None, mode=None, embeddings=None, n_keywords=5):
+    """
+    Labels every cluster locally from its most distinctive terms, without calling a language model.
+
+    The title lists the top c-TF-IDF keywords of the cluster and the summary quotes its most
+    representative response, i.e. the one whose TF-IDF vector is closest to the cluster's.
+    All clusters are labelled in a single pass over sparse matrices, so this runs in milliseconds
+    and works offline. topic, mode and embeddings are accepted for compatibility with the
+    language model backend and ignored.
+
+    Returns:
+        pd.DataFrame: centroids with 'Summary', 'Title', 'Polarity', 'Keywords' and 'Representatives' columns.
+    """
+    centroids = centroids.copy()
+
+    if processed_df.empty or centroids.empty:
+        for column in ['Summary', 'Title', 'Polarity', 'Keywords', 'Representatives']:
+            centroids[column] = pd.Series(dtype=object)
+        return centroids
+
+    try:
+        labels, terms, weights, counts, idf = class_tfidf(processed_df)
+    except ValueError:
+        # Responses made only of stop words have no keywords, so the clusters get placeholder
+        # titles and quote their first response
+        keywords = {}
+        representatives = pd.Series(processed_df.index, index=processed_df['cluster'].to_numpy()).groupby(level=0).first()
+    else:
+        keywords = dict(zip(labels, top_terms(weights, terms, n_keywords)))
+
+        # Score each response against its own cluster's term weights
+        codes = np.searchsorted(labels, processed_df['cluster'].to_numpy())
+        response_vectors = normalize(counts @ sparse.diags(idf))
+        cluster_vectors = normalize(weights)
+        scores = np.asarray(response_vectors.multiply(cluster_vectors[codes]).sum(axis=1)).ravel()
+        representatives = pd.Series(scores, index=processed_df.index).groupby(processed_df['cluster'].to_numpy()).idxmax()
+
+    polarities = processed_df.groupby('cluster')['polarity'].mean()
+
+    def title(label):
+        words = keywords.get(label) or ['Miscellaneous']
+        return ", ".join(words[:3]).capitalize()
+
+    def describe(label):
+        response = processed_df.at[representatives[label], 'responses']
+        key_terms = f"Key terms: {', '.join(keywords[label])}. " if keywords.get(label) else ""
+        return f"{key_terms}Representative response: \"{response}\""
+
+    centroids['Summary'] = centroids['cluster'].map(describe)
+    centroids['Title'] = centroids['cluster'].map(title)
+    centroids['Polarity'] = centroids['cluster'].map(polarities)
+    centroids['Keywords'] = centroids['cluster'].map(keywords)
+    centroids['Representatives'] = centroids['cluster'].map(lambda label: [representatives[label]])
+
+    return centroids
+
+
+async def asummarize_clusters(centroids, processed_df, topic=None, mode=None, embeddings=None, n_keywords=5):
+    """
+    Asynchronous version of summarize_clusters, for callers that await every backend.
+    """
+    return summarize_clusters(centroids, processed_df, topic, mode, embeddings, n_keywords)
+
+
+async def asummarizer(dataframes, topic=None, mode=None):
+    """
+    Labels the positive, negative and overall views.
+    """
+    return SUMMARIZER(dataframes, topic, mode)
+
+
+def SUMMARIZER(dataframes, topic=None, mode=None):
+    """
+    Labels clusters for positive, negative, and overall datasets using c-TF-IDF keywords.
+
+    Returns:
+        dict: The same keys as the language model SUMMARIZER.
+    """
+    return {
+        'positive_cluster_summary': summarize_clusters(dataframes['positive_centroids'], dataframes['positive_processed_df']),
+        'negative_cluster_summary': summarize_clusters(dataframes['negative_centroids'], dataframes['negative_processed_df']),
+        'cluster_summary': summarize_clusters(dataframes['centroids'], dataframes['processed_df'])
+    }
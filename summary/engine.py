@@ -0,0 +1,126 @@
+import asyncio
+import os
+import random
+import threading
+import time
+
+from summary.ratelimit import RateLimiter, estimate_tokens
+
+# Free-tier Gemini quotas; override through the environment for paid keys
+REQUESTS_PER_MINUTE = int(os.environ.get('GEMINI_REQUESTS_PER_MINUTE', 15))
+TOKENS_PER_MINUTE = int(os.environ.get('GEMINI_TOKENS_PER_MINUTE', 1_000_000))
+MAX_CONCURRENCY = int(os.environ.get('GEMINI_MAX_CONCURRENCY', 4))
+MAX_RETRIES = int(os.environ.get('GEMINI_MAX_RETRIES', 5))
+
+# Lets the engine talk to a local stub server instead of the Gemini API
+API_ENDPOINT = os.environ.get('GEMINI_API_ENDPOINT')
+
+rate_limiter = RateLimiter(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
+
+# Bounds the number of requests in flight across every thread and event loop in the process
+_concurrency = threading.BoundedSemaphore(MAX_CONCURRENCY)
+
+_models = {}
+_models_lock = threading.Lock()
+_api_key = None
+
+
+def configure(api_key, requests_per_minute=None, tokens_per_minute=None, max_concurrency=None):
+    """
+    Sets the API key and, optionally, replaces the rate limits and concurrency bound.
+
+    The key may be given as a callable, which is only called when the first model is created.
+
+    """
+    global _api_key, rate_limiter, _concurrency
+
+    with _models_lock:
+        _api_key = api_key
+        _models.clear()
+
+    if requests_per_minute or tokens_per_minute:
+        rate_limiter = RateLimiter(
+            requests_per_minute or rate_limiter.requests_per_minute,
+            tokens_per_minute or rate_limiter.tokens_per_minute
+        )
+    if max_concurrency:
+        _concurrency = threading.BoundedSemaphore(max_concurrency)
+
+
+def retryable_errors():
+    """
+    Returns the API errors worth retrying: rate limits and transient server errors.
+
+    """
+    from google.api_core import exceptions as api_exceptions
+
+    return (
+        api_exceptions.ResourceExhausted,
+        api_exceptions.TooManyRequests,
+        api_exceptions.ServiceUnavailable,
+        api_exceptions.InternalServerError,
+        api_exceptions.DeadlineExceeded,
+    )
+
+
+def get_model(model_name):
+    """
+    Returns a GenerativeModel for the given name, configuring the client only once per process.
+
+    """
+    # The client library takes about a second to import and is only needed once a request is sent
+    import google.generativeai as genai
+
+    with _models_lock:
+        if model_name not in _models:
+            api_key = _api_key() if callable(_api_key) else _api_key
+            if API_ENDPOINT:
+                genai.configure(api_key=api_key, transport='rest', client_options={'api_endpoint': API_ENDPOINT})
+            else:
+                genai.configure(api_key=api_key)
+            _models[model_name] = genai.GenerativeModel(model_name)
+        return _models[model_name]
+
+
+def _backoff(attempt):
+    """
+    Exponential backoff with full jitter, capped at one minute.
+    """
+    return random.uniform(0, min(60, 2 ** attempt))
+
+
+def _call(model_name, prompt):
+    with _concurrency:
+        return get_model(model_name).generate_content(prompt).text
+
+
+def generate(prompt, model_name):
+    """
+    Sends a prompt to the model, waiting for the rate limiter and retrying rate-limit
+    and transient server errors with jittered backoff.
+
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        rate_limiter.acquire_sync(estimate_tokens(prompt))
+        try:
+            return _call(model_name, prompt)
+        except retryable_errors():
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(_backoff(attempt))
+
+
+async def agenerate(prompt, model_name):
+    """
+    Asynchronous version of generate. The blocking client call runs in a worker thread,
+    so many prompts can be awaited concurrently from one event loop.
+
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        await rate_limiter.acquire(estimate_tokens(prompt))
+        try:
+            return await asyncio.to_thread(_call, model_name, prompt)
+        except retryable_errors():
+            if attempt == MAX_RETRIES:
+                raise
+            await asyncio.sleep(_backoff(attempt))
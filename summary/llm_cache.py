@@ -0,0 +1,196 @@
+import atexit
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_PATH = os.environ.get(
+    'SURVEY_LLM_CACHE',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache', 'llm_cache.sqlite3')
+)
+
+
+class LLMCache:
+    """
+    Disk-backed cache of model responses stored in SQLite.
+
+    Entries are keyed by a hash of the model name and prompt, expire after `ttl_seconds`,
+    and the least recently used entries are evicted once the cache holds more than
+    `max_entries` responses or `max_bytes` of text. The database runs in WAL mode with a
+    connection per thread, so several Streamlit sessions and worker processes can share it.
+    Hit and miss counts are stored in the database as well and cover every user of the file.
+
+    Lookups are reads only, so they do not queue behind SQLite's single writer: an entry's
+    last access time is only refreshed once it is `access_interval` seconds old, which is
+    precise enough to evict the least recently used entries, and the counters are kept in
+    memory and added to the database every `flush_interval` seconds, by stats() and at exit.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_entries=10_000, max_bytes=200 * 1024 ** 2, ttl_seconds=30 * 24 * 60 * 60,
+                 access_interval=60 * 60, flush_interval=30):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.access_interval = access_interval
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+
+        # Counts not yet added to the database
+        self._pending = {'hits': 0, 'misses': 0}
+        self._pending_lock = threading.Lock()
+        self._flushed = time.time()
+        atexit.register(self.flush)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        connection = self._connection()
+        connection.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        ''')
+        connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        connection.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        connection.execute("INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0)")
+
+    def _connection(self):
+        """
+        Returns this thread's connection, opening it on first use.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def key(prompt, model_name):
+        return hashlib.sha256(f"{model_name}\0{prompt}".encode()).hexdigest()
+
+    def _count(self, name):
+        with self._pending_lock:
+            self._pending[name] += 1
+            due = time.time() - self._flushed >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+        Adds the hit and miss counts of this process to the database.
+        """
+        with self._pending_lock:
+            pending, self._pending = self._pending, {'hits': 0, 'misses': 0}
+            self._flushed = time.time()
+        if not any(pending.values()):
+            return
+        try:
+            self._connection().executemany(
+                'UPDATE counters SET value = value + ? WHERE name = ?', [(count, name) for name, count in pending.items()]
+            )
+        except sqlite3.Error:
+            # Counts are only statistics, so losing some, e.g. at exit, is not worth failing for
+            pass
+
+    def get(self, prompt, model_name):
+        """
+        Returns the cached response for the prompt, or None if it is missing or expired.
+        """
+        connection = self._connection()
+        key = self.key(prompt, model_name)
+        now = time.time()
+
+        row = connection.execute('SELECT response, created, accessed FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None or row[1] < now - self.ttl_seconds:
+            if row is not None:
+                connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._count('misses')
+            return None
+
+        if row[2] < now - self.access_interval:
+            connection.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+        self._count('hits')
+        return row[0]
+
+    def set(self, prompt, model_name, response):
+        """
+        Stores a response and evicts the least recently used entries if the cache is over its limits.
+        """
+        connection = self._connection()
+        now = time.time()
+        connection.execute(
+            'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+            (self.key(prompt, model_name), model_name, response, len(response.encode()), now, now)
+        )
+        self.evict()
+
+    def discard(self, prompt, model_name):
+        """
+        Removes a cached response, e.g. one that turned out to be unusable.
+        """
+        self._connection().execute('DELETE FROM responses WHERE key = ?', (self.key(prompt, model_name),))
+
+    def evict(self):
+        """
+        Removes expired entries and the least recently used ones beyond the entry and size limits.
+        """
+        connection = self._connection()
+        entries, total_bytes = connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        if entries <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('DELETE FROM responses WHERE created < ?', (time.time() - self.ttl_seconds,))
+            connection.execute('''
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key,
+                               ROW_NUMBER() OVER (ORDER BY accessed DESC) AS position,
+                               SUM(size) OVER (ORDER BY accessed DESC) AS running_bytes
+                        FROM responses
+                    )
+                    WHERE position > ? OR running_bytes > ?
+                )
+            ''', (self.max_entries, self.max_bytes))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def stats(self):
+        """
+        Returns the hit and miss counters together with the current number and size of entries.
+        """
+        self.flush()
+        connection = self._connection()
+        counters = dict(connection.execute('SELECT name, value FROM counters').fetchall())
+        entries, total_bytes = connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        lookups = counters['hits'] + counters['misses']
+        return {
+            'hits': counters['hits'],
+            'misses': counters['misses'],
+            'hit_rate': counters['hits'] / lookups if lookups else 0.0,
+            'entries': entries,
+            'bytes': total_bytes,
+        }
+
+    def clear(self):
+        """
+        Deletes every cached response and resets the counters.
+        """
+        with self._pending_lock:
+            self._pending = {'hits': 0, 'misses': 0}
+        connection = self._connection()
+        connection.execute('DELETE FROM responses')
+        connection.execute('UPDATE counters SET value = 0')
@@ -0,0 +1,69 @@
+import asyncio
+import threading
+import time
+
+
+def estimate_tokens(text):
+    """
+    Estimates the number of tokens in a text locally, at roughly four characters per token.
+
+    """
+    return max(1, len(text) // 4)
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter for requests per minute and, optionally, tokens per minute.
+
+    Each call reserves its share of both buckets up front and is told how long to wait
+    until that reservation is covered, so callers are served in arrival order. The
+    buckets are guarded by a thread lock, so a single limiter can be shared by event
+    loops running in different threads (e.g. several Streamlit sessions).
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+
+        # Both buckets start full so a short burst up to the per-minute quota goes out immediately
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute) if tokens_per_minute else None
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens):
+        """
+        Takes one request and `tokens` tokens from the buckets and returns the seconds to wait.
+        """
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._updated
+            self._updated = now
+
+            # Refill both buckets for the time passed, never beyond one minute of quota
+            self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+            self._requests -= 1
+            wait = max(0.0, -self._requests * 60 / self.requests_per_minute)
+
+            if self._tokens is not None:
+                self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+                self._tokens -= tokens
+                wait = max(wait, -self._tokens * 60 / self.tokens_per_minute)
+
+            return wait
+
+    async def acquire(self, tokens=1):
+        """
+        Waits without blocking the event loop until a request of `tokens` tokens may be sent.
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self, tokens=1):
+        """
+        Blocking version of acquire for synchronous callers.
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
@@ -0,0 +1,54 @@
+import numpy as np
+
+from summary.ratelimit import estimate_tokens
+
+
+def select_representatives(embeddings, texts, token_budget, diversity=0.3):
+    """
+    Picks responses that represent a cluster well within a token budget, using maximal
+    marginal relevance (MMR) over the response embeddings.
+
+    The first pick is the response closest to the cluster centroid. Each following pick
+    maximizes (1 - diversity) * similarity to the centroid - diversity * similarity to the
+    closest response already picked, so the selection covers the cluster instead of
+    repeating near-duplicates. Responses that no longer fit in the budget are skipped.
+
+    Parameters:
+        embeddings (np.ndarray): Embeddings of the cluster's responses, one row per response.
+        texts (list): The responses, in the same order as embeddings.
+        token_budget (int): Maximum estimated tokens for the selected responses together.
+        diversity (float): Weight of the redundancy penalty, between 0 and 1.
+
+    Returns:
+        list: Positions of the selected responses, in the order they were picked.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    costs = np.array([estimate_tokens(text) + 1 for text in texts])
+
+    # Cosine similarities reduce to dot products on normalized vectors
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    normalized = embeddings / np.where(norms == 0, 1, norms)
+    centroid = normalized.mean(axis=0)
+    centroid /= np.linalg.norm(centroid) or 1
+    relevance = normalized @ centroid
+
+    redundancy = np.full(len(texts), -1.0, dtype=np.float32)
+    available = np.ones(len(texts), dtype=bool)
+    remaining = token_budget
+    selected = []
+
+    while True:
+        available &= costs <= remaining
+        if not available.any():
+            break
+
+        scores = (1 - diversity) * relevance - diversity * np.maximum(redundancy, 0)
+        scores[~available] = -np.inf
+        position = int(scores.argmax())
+
+        selected.append(position)
+        available[position] = False
+        remaining -= costs[position]
+        redundancy = np.maximum(redundancy, normalized @ normalized[position])
+
+    return selected
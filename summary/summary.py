@@ -1,43 +1,93 @@
-import google.generativeai as genai
+import asyncio
+import contextlib
 import json 
-import time
+import os
+import queue
+import threading
+import jsonschema
 import streamlit as st
+from summary import engine
+from summary import sampling
+from summary.llm_cache import LLMCache
+from summary.ratelimit import estimate_tokens
 
-GEMINI_API_KEY = st.secrets["api_key"]
-
-llm_cache = {} 
-
-def generate_content_cached(prompt, model_name="gemini-1.5-flash"):
+def get_api_key():
+    """
+    Reads the Gemini API key when the first request is sent rather than at import, so pages that
+    never summarize do not need the secrets. The environment variable lets headless runs work
+    without a Streamlit secrets file.
+    """
+    return os.environ.get("GEMINI_API_KEY") or st.secrets["api_key"]
+
+MODEL_NAME = "gemini-1.5-flash"
+
+# Upper bound on the estimated tokens of cluster responses placed in a single prompt
+PROMPT_TOKEN_BUDGET = int(os.environ.get('SURVEY_PROMPT_TOKEN_BUDGET', 8000))
+
+# Upper bound on the estimated tokens of responses packed into one batched prompt
+BATCH_TOKEN_BUDGET = int(os.environ.get('SURVEY_BATCH_TOKEN_BUDGET', 24000))
+
+# Expected shape of a batched response: one title and summary per cluster
+BATCH_SCHEMA = {
+    'type': 'array',
+    'items': {
+        'type': 'object',
+        'properties': {
+            'cluster': {'type': ['string', 'integer']},
+            'title': {'type': 'string', 'minLength': 1},
+            'summary': {'type': 'string', 'minLength': 1},
+        },
+        'required': ['cluster', 'title', 'summary'],
+    },
+}
+
+# Expected shape of a one-cluster response
+SUMMARY_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'title': {'type': 'string', 'minLength': 1},
+        'summary': {'type': 'string', 'minLength': 1},
+    },
+    'required': ['title', 'summary'],
+}
+
+engine.configure(get_api_key)
+
+# Responses are cached on disk and shared by every session and worker process
+llm_cache = LLMCache()
+
+def generate_content_cached(prompt, model_name=MODEL_NAME):
     """
     Generates content using a generative model with caching to avoid redundant calls.
 
     """
-
-    genai.configure(api_key=GEMINI_API_KEY)
     
     # Check if the prompt is already cached
-    if prompt in llm_cache:
-        # If found, retrieve the cached output to save computation time
-        output = llm_cache[prompt]
-    else:
-        # If not cached, wait for 6 seconds (e.g., to adhere to rate limits or for model readiness)
-        time.sleep(6)
-        
-        # Initialize the generative model using the specified model name
-        gemini_model = genai.GenerativeModel(model_name)
-        
-        # Generate content based on the prompt and extract the text output
-        output = gemini_model.generate_content(prompt).text
+    output = llm_cache.get(prompt, model_name)
+    if output is None:
+        # If not cached, send it through the engine, which handles rate limits and retries
+        output = engine.generate(prompt, model_name)
         
         # Store the generated output in the cache for future use
-        llm_cache[prompt] = output
+        llm_cache.set(prompt, model_name, output)
     
     # Return the generated output
     return output
 
-def summarize_text(topic, text, cached_topics):
+async def agenerate_content_cached(prompt, model_name=MODEL_NAME):
     """
-    Generates a title and summary for a cluster of survey responses based on the input text and topic.
+    Asynchronous version of generate_content_cached.
+
+    """
+    output = llm_cache.get(prompt, model_name)
+    if output is None:
+        output = await engine.agenerate(prompt, model_name)
+        llm_cache.set(prompt, model_name, output)
+    return output
+
+def build_prompt(topic, text, cached_topics):
+    """
+    Formats the summarization prompt for a cluster of survey responses.
     """
     
     template = """
@@ -80,101 +130,732 @@ def summarize_text(topic, text, cached_topics):
     except KeyError as e:
         raise ValueError(f"Error formatting template: {e}")
 
+    return prompt
+
+def summarize_text(topic, text, cached_topics):
+    """
+    Generates a title and summary for a cluster of survey responses based on the input text and topic.
+    """
+    prompt = build_prompt(topic, text, cached_topics)
+
     # Generate the content using the cached function
     output = generate_content_cached(prompt)
 
+    # Keep an unusable response out of the cache so the cluster is retried next time
+    if not _usable(output):
+        llm_cache.discard(prompt, MODEL_NAME)
+
     return output
 
-def summarize_clusters(centroids, processed_df, topic):
+async def asummarize_text(topic, text, cached_topics):
+    """
+    Asynchronous version of summarize_text.
+    """
+    prompt = build_prompt(topic, text, cached_topics)
+    output = await agenerate_content_cached(prompt)
+    if not _usable(output):
+        llm_cache.discard(prompt, MODEL_NAME)
+    return output
 
+def parse_summary(output):
     """
-    Summarizes clusters based on the provided centroids and processed DataFrame.
+    Cleans a raw model response and parses it as JSON.
+    """
+    # Enhanced cleaning to remove artifacts
+    if isinstance(output, str):
+        output = output.strip()  # Remove leading/trailing whitespace
+        output = output.lstrip('```json').rstrip('```')  # Remove backticks and json marker
+        output = output.strip()  # Strip again after cleaning
+
+    return json.loads(output)
 
+def parse_cluster_summary(output):
     """
+    Parses and validates a one-cluster response, requiring a title and a summary.
 
+    Raises json.JSONDecodeError or jsonschema.ValidationError if the response is unusable.
+    """
+    result = parse_summary(output)
+    jsonschema.validate(result, SUMMARY_SCHEMA)
+    return result
 
-    polarities = []
+def _usable(output):
+    """
+    Tells whether a one-cluster response parses to a title and summary.
+    """
+    try:
+        parse_cluster_summary(output)
+    except (json.JSONDecodeError, jsonschema.ValidationError):
+        return False
+    return True
 
-    summaries = []
+def cluster_text(cluster, embeddings=None, token_budget=PROMPT_TOKEN_BUDGET):
+    """
+    Builds the response text sent to the model for one cluster, bounded by a token budget.
 
-    cached_topics = []
+    Small clusters are sent whole. Larger ones are reduced to representative responses
+    selected by centroid proximity and diversity over their embeddings, or to the first
+    responses that fit when no embeddings are available.
 
-    for cluster_label in centroids['cluster'].unique():
-            # Filter data points for the current cluster
-            cluster = processed_df[processed_df['cluster'] == cluster_label]
+    Parameters:
+        cluster (pd.DataFrame): The cluster's rows of the processed DataFrame.
+        embeddings (np.ndarray, optional): Embeddings indexed by the processed DataFrame's index.
+        token_budget (int): Maximum estimated tokens of response text.
 
-            # Extract relevant text based on the data_type
+    Returns:
+        tuple: (text, used) where used lists the index labels of the responses included.
+    """
+    responses = cluster['responses'].tolist()
+    index = cluster.index.tolist()
 
-            polarity = cluster['polarity'].mean()
-            
-            text = " ".join(cluster['responses'])
+    if sum(estimate_tokens(response) + 1 for response in responses) <= token_budget:
+        return " ".join(responses), index
 
-            # Generate a summary and title for the current cluster
-            cluster_summary_with_title = summarize_text(topic,text, cached_topics)
+    if embeddings is not None:
+        positions = sampling.select_representatives(embeddings[cluster.index.to_numpy()], responses, token_budget)
+    else:
+        positions = []
+        remaining = token_budget
+        for position, response in enumerate(responses):
+            cost = estimate_tokens(response) + 1
+            if cost > remaining:
+                continue
+            positions.append(position)
+            remaining -= cost
 
-            # # Debugging: Log the raw output
-            # print(f"Raw Output for Cluster {cluster_label}:\n{cluster_summary_with_title}")
+    return " ".join(responses[position] for position in positions), [index[position] for position in positions]
 
-            # Enhanced cleaning to remove artifacts
-            if isinstance(cluster_summary_with_title, str):
-                cluster_summary_with_title = cluster_summary_with_title.strip()  # Remove leading/trailing whitespace
-                cluster_summary_with_title = cluster_summary_with_title.lstrip('```json').rstrip('```')  # Remove backticks and json marker
-                cluster_summary_with_title = cluster_summary_with_title.strip()  # Strip again after cleaning
+async def arefine_titles(topic, drafts):
+    """
+    Rewrites draft cluster titles in a single call so that no two clusters share the same theme.
 
-            # # Debugging: Log the cleaned output
-            # print(f"Cleaned Output for Cluster {cluster_label}:\n{cluster_summary_with_title}")
+    Parameters:
+        topic (str): The overarching topic of the dataset.
+        drafts (dict): Maps cluster labels to their draft {'title', 'summary'}.
 
-            # Parse the cleaned JSON string
-            try:
-                cluster_summary_with_title = json.loads(cluster_summary_with_title)
-                cached_topics.append(cluster_summary_with_title['title'])
-            except json.JSONDecodeError as e:
-                print(f"Error processing cluster {cluster_label}: {e}")
-                continue
+    Returns:
+        dict: Maps cluster labels to refined titles; clusters the model did not return keep their draft title.
+    """
+    template = """
+        You are reviewing the topic titles generated independently for clusters of open-ended survey responses.
+        Because each title was written without seeing the others, some may overlap or repeat the same theme.
 
-            summaries.append(cluster_summary_with_title)
-            polarities.append(polarity)
+        The dataset's broader topic is: {topic}
 
+        Here are the clusters with their draft titles and summaries:
+        {drafts}
 
-    # Add summaries and titles to the centroids DataFrame
-    centroids['Summary'] = [summary['summary'] for summary in summaries]
-    centroids['Title'] = [summary['title'] for summary in summaries]
-    centroids['Polarity'] = polarities
+        Rewrite the titles so that each one clearly captures what is **distinct** about its cluster compared to all the others.
+        Keep titles that are already distinct unchanged, and keep every title concise.
 
-    # # Calculate the percentage of points in each cluster
-    # total_points = processed_df.shape[0]
-    # centroids['Percentage'] = ((centroids['count'] / total_points) * 100).round()
+        Your output must strictly be a valid JSON object without any additional formatting, backticks, or newlines, mapping
+        each cluster id to its final title, for example:
+        {{"0": "<title for cluster 0>", "1": "<title for cluster 1>"}}
+    """
 
-    # Return the centroids DataFrame with added summaries and titles
-    return centroids
+    listing = "\n".join(
+        f"Cluster {label}: {draft['title']} - {draft['summary']}" for label, draft in drafts.items()
+    )
+    prompt = template.format(topic=topic, drafts=listing)
+
+    titles = {label: draft['title'] for label, draft in drafts.items()}
+    try:
+        refined = parse_summary(await agenerate_content_cached(prompt))
+    except json.JSONDecodeError as e:
+        print(f"Error refining titles, keeping draft titles: {e}")
+        llm_cache.discard(prompt, MODEL_NAME)
+        return titles
 
-def SUMMARIZER(dataframes, topic = 'Thoughts about an AI advertsiment about climate change'):
+    for label in titles:
+        title = refined.get(str(label)) if isinstance(refined, dict) else None
+        if isinstance(title, str) and title.strip():
+            titles[label] = title.strip()
 
+    return titles
+
+def build_batch_prompt(topic, batch):
     """
-    Summarizes clusters for positive, negative, and overall datasets.
+    Formats a prompt asking for the titles and summaries of several clusters at once.
 
-    Args:
-        dataframes (dict): A dictionary containing processed DataFrames and centroids for positive, negative, and overall data.
-        topic (str): The overarching topic to guide summarization.
+    Parameters:
+        topic (str): The overarching topic of the dataset.
+        batch (list): (cluster label, response text) pairs.
+    """
+    template = """
+        You are an advanced AI system designed to analyze and summarize clusters of open-ended survey responses.
+        These clusters are semantically similar groups derived from a broader dataset. Below are several clusters,
+        each introduced by its cluster id. Summarize every cluster separately.
+
+        For each cluster, write:
+        1. A **descriptive topic title** that clearly captures the primary theme of the cluster and distinguishes
+        it from the other clusters listed here.
+        2. A **summary** that explains the central themes, patterns, or ideas expressed in the cluster, identifies
+        commonalities in opinions, emotions, or feedback, and highlights any unique or surprising insights.
+
+        The dataset's broader topic is: {topic}
+
+        {clusters}
+
+        Your output must strictly be a valid JSON array without any additional formatting, backticks, or newlines,
+        with exactly one object per cluster above, following this exact structure:
+        [{{"cluster": "<cluster id>", "title": "<Your descriptive title here>", "summary": "<Your detailed and actionable summary here>"}}]
+    """
+
+    listing = "\n\n".join(f"Cluster {label}:\n{text}" for label, text in batch)
+
+    return template.format(topic=topic, clusters=listing)
+
+def parse_batch(output, labels):
+    """
+    Parses and validates a batched response, returning {cluster label: {'title', 'summary'}}.
+
+    Raises json.JSONDecodeError or jsonschema.ValidationError if the response is malformed
+    or does not cover every cluster in the batch.
+    """
+    items = parse_summary(output)
+    jsonschema.validate(items, BATCH_SCHEMA)
+
+    by_id = {str(item['cluster']): item for item in items}
+    missing = [label for label in labels if str(label) not in by_id]
+    if missing:
+        raise jsonschema.ValidationError(f"Missing clusters in batched response: {missing}")
+
+    return {label: {'title': by_id[str(label)]['title'], 'summary': by_id[str(label)]['summary']} for label in labels}
+
+def pack_batches(texts, budget=BATCH_TOKEN_BUDGET):
+    """
+    Groups (cluster label, response text) pairs into batches of at most `budget` estimated tokens.
+    """
+    batches = []
+    current = []
+    used = 0
+    for label, text in texts:
+        tokens = estimate_tokens(text)
+        if current and used + tokens > budget:
+            batches.append(current)
+            current = []
+            used = 0
+        current.append((label, text))
+        used += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+async def asummarize_batch(topic, batch):
+    """
+    Summarizes a batch of clusters in one call, splitting the batch in half and retrying
+    each half whenever the response fails validation. A single cluster that still fails
+    falls back to the one-cluster prompt.
 
     Returns:
-        dict: A dictionary with summaries for positive, negative, and overall clusters.
+        dict: Maps cluster labels to {'title', 'summary'}; clusters that could not be summarized are left out.
     """
+    labels = [label for label, _ in batch]
+
+    if len(batch) == 1:
+        label, text = batch[0]
+        try:
+            return {label: parse_cluster_summary(await asummarize_text(topic, text, []))}
+        except (json.JSONDecodeError, jsonschema.ValidationError) as e:
+            print(f"Error processing cluster {label}: {e}")
+            return {}
+
+    prompt = build_batch_prompt(topic, batch)
+    output = await agenerate_content_cached(prompt)
+    try:
+        return parse_batch(output, labels)
+    except (json.JSONDecodeError, jsonschema.ValidationError) as e:
+        print(f"Invalid batched response for clusters {', '.join(map(str, labels))}, splitting: {str(e).splitlines()[0]}")
+        # Keep the unusable response out of the cache so the same batch is not replayed next time
+        llm_cache.discard(prompt, MODEL_NAME)
+
+    middle = len(batch) // 2
+    first, second = await asyncio.gather(
+        asummarize_batch(topic, batch[:middle]),
+        asummarize_batch(topic, batch[middle:]),
+    )
+    return {**first, **second}
+
+def build_summary_frame(centroids, processed_df, results, placeholder=None):
+    """
+    Adds the 'Summary', 'Title', 'Polarity' and 'Representatives' columns to a view's centroids
+    from per-cluster results as yielded by astream_clusters.
+
+    Clusters without a successful result are dropped, or kept with `placeholder` as their
+    title when one is given (e.g. while the remaining summaries are still being generated).
+    """
+    completed = {label: result for label, result in results.items() if 'error' not in result}
+    polarities = processed_df.groupby('cluster')['polarity'].mean()
+
+    if placeholder is None:
+        centroids = centroids[centroids['cluster'].isin(list(completed))]
+    centroids = centroids.copy()
 
-    positive_processed_df = dataframes['positive_processed_df']
-    negative_processed_df = dataframes['negative_processed_df']
-    processed_df = dataframes['processed_df']
+    centroids['Summary'] = centroids['cluster'].map(lambda label: completed[label]['summary'] if label in completed else "")
+    centroids['Title'] = centroids['cluster'].map(lambda label: completed[label]['title'] if label in completed else placeholder)
+    centroids['Polarity'] = centroids['cluster'].map(polarities)
+    centroids['Representatives'] = centroids['cluster'].map(lambda label: completed[label]['representatives'] if label in completed else [])
 
-    positive_centroids = dataframes['positive_centroids']
-    negative_centroids = dataframes['negative_centroids']
-    centroids = dataframes['centroids']
+    return centroids
 
-    positive_cluster_summary = summarize_clusters( positive_centroids,positive_processed_df, topic=topic)
-    negative_cluster_summary = summarize_clusters( negative_centroids,negative_processed_df, topic=topic)
-    cluster_summary = summarize_clusters( centroids, processed_df, topic=topic)
+def _completed(cluster_label, draft, used):
+    return {'cluster': cluster_label, 'title': draft['title'], 'summary': draft['summary'], 'representatives': used}
+
+def _failed(cluster_label, error):
+    """
+    Result for a cluster that could not be summarized. Errors other than an unparseable
+    response are kept under 'exception' so non-streaming callers can re-raise them.
+    """
+    # A validation error's text lists the whole schema, so only its message is kept
+    message = error.message if isinstance(error, jsonschema.ValidationError) else str(error)
+    print(f"Error processing cluster {cluster_label}: {message}")
+    result = {'cluster': cluster_label, 'error': message}
+    if not isinstance(error, (json.JSONDecodeError, jsonschema.ValidationError)):
+        result['exception'] = error
+    return result
+
+async def _refined(topic, drafts):
+    """
+    Yields updated results for the clusters whose title changed in the deduplication pass.
+    """
+    try:
+        titles = await arefine_titles(topic, {label: {'title': draft['title'], 'summary': draft['summary']} for label, draft in drafts.items()})
+    except Exception as e:
+        print(f"Error refining titles, keeping draft titles: {e}")
+        return
+
+    for label, title in titles.items():
+        if title != drafts[label]['title']:
+            yield {**drafts[label], 'title': title}
+
+async def _astream_sequential(clusters, topic, embeddings, token_budget):
+    cached_topics = []
+
+    for cluster_label, cluster in clusters.items():
+        text, used = cluster_text(cluster, embeddings, token_budget)
+
+        # Each prompt lists the titles of the clusters summarized before it
+        try:
+            draft = parse_cluster_summary(await asummarize_text(topic, text, cached_topics))
+        except Exception as e:
+            yield _failed(cluster_label, e)
+            continue
+
+        cached_topics.append(draft['title'])
+        yield _completed(cluster_label, draft, used)
+
+async def _astream_parallel(clusters, topic, embeddings, token_budget):
+    async def draft(cluster_label, cluster):
+        text, used = cluster_text(cluster, embeddings, token_budget)
+        try:
+            return _completed(cluster_label, parse_cluster_summary(await asummarize_text(topic, text, [])), used)
+        except Exception as e:
+            return _failed(cluster_label, e)
+
+    # Phase one: independent drafts, sent as a single concurrent wave and yielded as they arrive
+    tasks = [asyncio.ensure_future(draft(cluster_label, cluster)) for cluster_label, cluster in clusters.items()]
+    drafts = {}
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            result = await next_result
+            if 'error' not in result:
+                drafts[result['cluster']] = result
+            yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    # Phase two: make the titles distinct across clusters
+    if len(drafts) > 1:
+        async for result in _refined(topic, drafts):
+            yield result
+
+async def _astream_batched(clusters, topic, embeddings, token_budget):
+    texts = {
+        cluster_label: cluster_text(cluster, embeddings, min(token_budget, BATCH_TOKEN_BUDGET))
+        for cluster_label, cluster in clusters.items()
+    }
+    batches = pack_batches([(cluster_label, text) for cluster_label, (text, _) in texts.items()])
+
+    async def summarize(batch):
+        try:
+            return batch, await asummarize_batch(topic, batch), None
+        except Exception as e:
+            return batch, {}, e
+
+    tasks = [asyncio.ensure_future(summarize(batch)) for batch in batches]
+    drafts = {}
+    try:
+        for next_batch in asyncio.as_completed(tasks):
+            batch, results, error = await next_batch
+            for cluster_label, _ in batch:
+                if cluster_label in results:
+                    drafts[cluster_label] = _completed(cluster_label, results[cluster_label], texts[cluster_label][1])
+                    yield drafts[cluster_label]
+                elif error is not None:
+                    yield _failed(cluster_label, error)
+                else:
+                    # asummarize_batch has already reported why the cluster's response was unusable
+                    yield {'cluster': cluster_label, 'error': "No valid summary was returned."}
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    # Titles are only written side by side within a batch
+    if len(batches) > 1 and len(drafts) > 1:
+        async for result in _refined(topic, drafts):
+            yield result
+
+async def astream_clusters(centroids, processed_df, topic, mode='sequential', embeddings=None, token_budget=PROMPT_TOKEN_BUDGET):
+    """
+    Summarizes a view's clusters, yielding each cluster's result as soon as it is available.
+
+    Results are dicts with 'cluster', 'title', 'summary' and 'representatives', or 'cluster'
+    and 'error' for a cluster that could not be summarized. In 'parallel' and 'batched' mode
+    a cluster is yielded again with its final title after the title deduplication pass.
+    """
+    if mode not in ['sequential', 'parallel', 'batched']:
+        raise ValueError("Mode must be 'sequential', 'parallel' or 'batched'.")
+
+    clusters = {
+        cluster_label: processed_df[processed_df['cluster'] == cluster_label]
+        for cluster_label in centroids['cluster'].unique()
+    }
+
+    stream = {
+        'sequential': _astream_sequential,
+        'parallel': _astream_parallel,
+        'batched': _astream_batched,
+    }[mode](clusters, topic, embeddings, token_budget)
+
+    async with contextlib.aclosing(stream):
+        async for result in stream:
+            yield result
+
+async def asummarize_clusters(centroids, processed_df, topic, mode='sequential', embeddings=None, token_budget=PROMPT_TOKEN_BUDGET):
+
+    """
+    Summarizes clusters based on the provided centroids and processed DataFrame.
+
+    In 'sequential' mode clusters are summarized one after another, because each prompt
+    lists the titles of the clusters processed before it. In 'parallel' mode all clusters
+    are drafted concurrently and their titles are then made distinct in one extra call.
+    In 'batched' mode several clusters share each prompt, which returns a validated JSON
+    array of titles and summaries.
+
+    Each prompt holds at most token_budget tokens of responses (see cluster_text); the
+    index labels of the responses used are returned in the 'Representatives' column.
+    Clusters whose response could not be parsed are left out; any other error is raised.
+
+    """
+    results = {}
+    async with contextlib.aclosing(astream_clusters(centroids, processed_df, topic, mode, embeddings, token_budget)) as stream:
+        async for result in stream:
+            if 'exception' in result:
+                raise result['exception']
+            results[result['cluster']] = result
+
+    # Return the centroids DataFrame with added summaries and titles
+    return build_summary_frame(centroids, processed_df, results)
+
+def summarize_clusters(centroids, processed_df, topic, mode='sequential', embeddings=None, token_budget=PROMPT_TOKEN_BUDGET):
+
+    """
+    Summarizes clusters based on the provided centroids and processed DataFrame.
+
+    """
+    return asyncio.run(asummarize_clusters(
+        centroids, processed_df, topic, mode=mode, embeddings=embeddings, token_budget=token_budget
+    ))
+
+# Summary keys with the centroids and processed DataFrame each view is built from
+VIEWS = {
+    'positive_cluster_summary': ('positive_centroids', 'positive_processed_df'),
+    'negative_cluster_summary': ('negative_centroids', 'negative_processed_df'),
+    'cluster_summary': ('centroids', 'processed_df'),
+}
+
+# Expected shape of a facets response: the overall title and summary, plus one per sentiment present
+FACET_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'title': {'type': 'string', 'minLength': 1},
+        'summary': {'type': 'string', 'minLength': 1},
+    },
+    'required': ['title', 'summary'],
+}
+FACETS_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'title': {'type': 'string', 'minLength': 1},
+        'summary': {'type': 'string', 'minLength': 1},
+        'positive': {'anyOf': [FACET_SCHEMA, {'type': 'null'}]},
+        'negative': {'anyOf': [FACET_SCHEMA, {'type': 'null'}]},
+    },
+    'required': ['title', 'summary'],
+}
+
+# Sentiment views derived from the overall clusters in 'facets' mode
+FACET_VIEWS = {
+    'positive': 'positive_cluster_summary',
+    'negative': 'negative_cluster_summary',
+}
+
+def build_facets_prompt(topic, sections):
+    """
+    Formats a prompt asking for a cluster's overall title and summary together with one
+    for each of its positive and negative responses.
+
+    Parameters:
+        topic (str): The overarching topic of the dataset.
+        sections (dict): Maps 'positive', 'negative' and 'neutral' to the cluster's responses with that sentiment.
+    """
+    template = """
+        You are an advanced AI system designed to analyze and summarize clusters of open-ended survey responses.
+        These clusters are semantically similar groups derived from a broader dataset. The responses of the
+        current cluster are listed below, grouped by their sentiment.
+
+        Your output should include:
+        1. A **descriptive topic title** and a **summary** of the whole cluster that capture its primary theme and
+        explain the central themes, patterns, or ideas expressed, highlighting any unique or surprising insights.
+        2. {facets}
+
+        The dataset's broader topic is: {topic}
+
+        Here are the responses from the current cluster:
+        {text}
+
+        Your output must strictly be a valid JSON object without any additional formatting, backticks, or newlines. Ensure it follows this exact structure:
+        {{
+        "title": "<Your descriptive title here>",
+        "summary": "<Your detailed and actionable summary here>",
+        "positive": {{"title": "<title of the positive responses>", "summary": "<summary of the positive responses>"}} or null,
+        "negative": {{"title": "<title of the negative responses>", "summary": "<summary of the negative responses>"}} or null
+        }}
+    """
+
+    requested = [facet for facet in FACET_VIEWS if sections.get(facet)]
+    if requested:
+        facets = (f"For the {' and the '.join(requested)} responses, a separate title and summary describing what "
+                  f"those responses in particular express. Use null for a sentiment with no responses.")
+    else:
+        facets = "null for both the positive and the negative facets, as the cluster has no such responses."
+
+    text = "\n\n".join(f"{facet.capitalize()} responses:\n{sections[facet]}" for facet in ['positive', 'negative', 'neutral'] if sections.get(facet))
+
+    return template.format(topic=topic, facets=facets, text=text)
+
+def parse_facets(output, facets):
+    """
+    Parses and validates a facets response, requiring a title and summary for each listed facet.
+    """
+    result = parse_summary(output)
+    jsonschema.validate(result, FACETS_SCHEMA)
+
+    missing = [facet for facet in facets if not result.get(facet)]
+    if missing:
+        raise jsonschema.ValidationError(f"Missing facets in response: {missing}")
+
+    return result
+
+async def _astream_facets(dataframes, topic, embeddings, token_budget):
+    """
+    Summarizes each overall cluster once, deriving the positive and negative views from the
+    same call, and yields results for every view the cluster appears in.
+    """
+    centroids, processed_df = dataframes['centroids'], dataframes['processed_df']
+
+    async def summarize(cluster_label):
+        cluster = processed_df[processed_df['cluster'] == cluster_label]
+
+        # Clusters that fit the budget are sent whole. Otherwise the budget is split between the
+        # sentiments in proportion to their number of responses, giving each at least enough for
+        # its shortest response so a small minority still gets a representative
+        fits = sum(estimate_tokens(response) + 1 for response in cluster['responses']) <= token_budget
+        sections = {}
+        used = {}
+        for sentiment, responses in cluster.groupby('polarity_categorical', sort=False):
+            if fits:
+                share = token_budget
+            else:
+                cheapest = min(estimate_tokens(response) + 1 for response in responses['responses'])
+                share = max(cheapest, token_budget * len(responses) // len(cluster))
+            sections[sentiment], used[sentiment] = cluster_text(responses, embeddings, share)
+
+        # Only facets with responses in the prompt are asked for, so only those are required
+        facets = [facet for facet in FACET_VIEWS if sections.get(facet)]
+
+        prompt = build_facets_prompt(topic, sections)
+        try:
+            result = parse_facets(await agenerate_content_cached(prompt), facets)
+        except Exception as e:
+            if isinstance(e, (json.JSONDecodeError, jsonschema.ValidationError)):
+                # Keep the unusable response out of the cache so the cluster is retried next time
+                llm_cache.discard(prompt, MODEL_NAME)
+            failed = _failed(cluster_label, e)
+            return [{'view': view, **failed} for view in ['cluster_summary'] + [FACET_VIEWS[facet] for facet in facets]]
+
+        representatives = [index for sentiment_used in used.values() for index in sentiment_used]
+        return [{'view': 'cluster_summary', **_completed(cluster_label, result, representatives)}] + [
+            {'view': FACET_VIEWS[facet], **_completed(cluster_label, result[facet], used[facet])} for facet in facets
+        ]
+
+    tasks = [asyncio.ensure_future(summarize(cluster_label)) for cluster_label in centroids['cluster'].unique()]
+    drafts = {view: {} for view in VIEWS}
+    try:
+        for next_results in asyncio.as_completed(tasks):
+            for result in await next_results:
+                if 'error' not in result:
+                    drafts[result['view']][result['cluster']] = result
+                yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    # Make the titles distinct within each view, with one call per view
+    async def refine(view):
+        if len(drafts[view]) < 2:
+            return []
+        return [result async for result in _refined(topic, drafts[view])]
+
+    for results in await asyncio.gather(*[refine(view) for view in VIEWS]):
+        for result in results:
+            yield result
+
+async def asummarizer(dataframes, topic, mode='sequential'):
+
+    """
+    Summarizes the positive, negative and overall views concurrently.
+
+    In 'facets' mode each overall cluster is summarized once, in a call that also returns the
+    summaries of its positive and negative responses, instead of summarizing each view separately.
+
+    """
+    if mode == 'facets':
+        results = {view: {} for view in VIEWS}
+        async with contextlib.aclosing(astream_summaries(dataframes, topic, mode)) as stream:
+            async for result in stream:
+                if 'exception' in result:
+                    raise result['exception']
+                results[result['view']][result['cluster']] = result
+        return assemble_summaries(dataframes, results)
+
+    embeddings = dataframes.get('embeddings')
+
+    positive_cluster_summary, negative_cluster_summary, cluster_summary = await asyncio.gather(
+        asummarize_clusters(dataframes['positive_centroids'], dataframes['positive_processed_df'], topic=topic, mode=mode, embeddings=embeddings),
+        asummarize_clusters(dataframes['negative_centroids'], dataframes['negative_processed_df'], topic=topic, mode=mode, embeddings=embeddings),
+        asummarize_clusters(dataframes['centroids'], dataframes['processed_df'], topic=topic, mode=mode, embeddings=embeddings),
+    )
 
     return {
         'positive_cluster_summary': positive_cluster_summary,
         'negative_cluster_summary': negative_cluster_summary,
         'cluster_summary': cluster_summary
-    }
\ No newline at end of file
+    }
+
+async def astream_summaries(dataframes, topic, mode='sequential'):
+    """
+    Summarizes the positive, negative and overall views concurrently, yielding each cluster's
+    result with a 'view' key (a key of VIEWS) as soon as it completes. See astream_clusters.
+
+    """
+    embeddings = dataframes.get('embeddings')
+
+    if mode == 'facets':
+        async with contextlib.aclosing(_astream_facets(dataframes, topic, embeddings, PROMPT_TOKEN_BUDGET)) as stream:
+            async for result in stream:
+                yield result
+        return
+
+    events = asyncio.Queue()
+
+    async def pump(view, centroids_key, processed_key):
+        try:
+            async for result in astream_clusters(dataframes[centroids_key], dataframes[processed_key], topic, mode, embeddings):
+                await events.put({'view': view, **result})
+        finally:
+            await events.put(None)
+
+    tasks = [asyncio.ensure_future(pump(view, *keys)) for view, keys in VIEWS.items()]
+    try:
+        running = len(tasks)
+        while running:
+            event = await events.get()
+            if event is None:
+                running -= 1
+                continue
+            yield event
+
+        # Surface unexpected errors from any view
+        for task in tasks:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def stream_summaries(dataframes, topic, mode='sequential'):
+    """
+    Synchronous version of astream_summaries for scripts such as Streamlit pages.
+
+    The summaries are generated on an event loop in a background thread and handed over
+    through a queue, so the caller can render each result while the others are pending.
+    """
+    events = queue.Queue()
+    stop = threading.Event()
+    finished = object()
+
+    async def pump():
+        async with contextlib.aclosing(astream_summaries(dataframes, topic, mode)) as stream:
+            async for event in stream:
+                events.put(event)
+                if stop.is_set():
+                    break
+
+    def run():
+        try:
+            asyncio.run(pump())
+        except Exception as e:
+            events.put(e)
+        finally:
+            events.put(finished)
+
+    threading.Thread(target=run, daemon=True).start()
+
+    try:
+        while True:
+            event = events.get()
+            if event is finished:
+                return
+            if isinstance(event, Exception):
+                raise event
+            yield event
+    finally:
+        # Stops generating summaries if the caller abandons the stream
+        stop.set()
+
+def assemble_summaries(dataframes, results, placeholder=None):
+    """
+    Builds the SUMMARIZER output from streamed results collected as {view: {cluster: result}}.
+    See build_summary_frame for placeholder.
+    """
+    return {
+        view: build_summary_frame(dataframes[centroids_key], dataframes[processed_key], results.get(view, {}), placeholder)
+        for view, (centroids_key, processed_key) in VIEWS.items()
+    }
+
+def SUMMARIZER(dataframes, topic = 'Thoughts about an AI advertsiment about climate change', mode='sequential'):
+
+    """
+    Summarizes clusters for positive, negative, and overall datasets.
+
+    Args:
+        dataframes (dict): A dictionary containing processed DataFrames and centroids for positive, negative, and overall data.
+        topic (str): The overarching topic to guide summarization.
+        mode (str): 'sequential', 'parallel' or 'batched', see asummarize_clusters, or 'facets', see asummarizer.
+
+    Returns:
+        dict: A dictionary with summaries for positive, negative, and overall clusters.
+    """
+
+    return asyncio.run(asummarizer(dataframes, topic, mode=mode))
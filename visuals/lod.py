@@ -0,0 +1,65 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+
+def downsample(df, max_points, by='cluster', seed=0):
+    """
+    Keeps at most max_points rows, sampling each group in proportion to its size.
+
+    Every group keeps at least one row, so small clusters stay visible, and the same rows are
+    kept on every call for the same data and seed, so the plot does not change between reruns.
+
+    Parameters:
+        df (pd.DataFrame): Points to sample.
+        max_points (int): Target number of rows.
+        by (str): Column whose groups are sampled separately.
+        seed (int): Seed of the random sample.
+
+    Returns:
+        pd.DataFrame: The sampled rows, in their original order.
+    """
+    if len(df) <= max_points:
+        return df
+
+    groups = df[by]
+    quotas = (groups.value_counts() * (max_points / len(df))).round().clip(lower=1)
+
+    # Ranking random keys within each group picks a uniform sample of every group in one pass
+    keys = pd.Series(np.random.default_rng(seed).random(len(df)), index=df.index)
+    ranks = keys.groupby(groups).rank(method='first')
+    return df[ranks <= groups.map(quotas)]
+
+
+def hexbin(df, value, gridsize=60, x='Umap_1', y='Umap_2'):
+    """
+    Aggregates points into a grid of hexagons, with gridsize hexagons across the x range.
+
+    Each point goes to the hexagon with the nearest centre, using the two offset rectangular
+    grids whose union is a hexagonal grid, as in matplotlib's hexbin.
+
+    Returns:
+        pd.DataFrame: One row per non-empty hexagon with its centre ('x', 'y'), the number of
+                      points ('count') and the mean of the value column ('value').
+    """
+    if df.empty:
+        return pd.DataFrame({'x': [], 'y': [], 'count': [], 'value': []})
+
+    xs, ys = df[x].to_numpy(dtype=float), df[y].to_numpy(dtype=float)
+    x_min, y_min = xs.min(), ys.min()
+    # A regular hexagon is sqrt(3) times taller per row pair than it is wide
+    x_step = max(xs.max() - x_min, 1e-9) / gridsize
+    y_step = x_step * math.sqrt(3)
+
+    scaled_x, scaled_y = (xs - x_min) / x_step, (ys - y_min) / y_step
+    x1, y1 = np.round(scaled_x), np.round(scaled_y)
+    x2, y2 = np.floor(scaled_x) + 0.5, np.floor(scaled_y) + 0.5
+    on_first_grid = (scaled_x - x1) ** 2 + 3 * (scaled_y - y1) ** 2 <= (scaled_x - x2) ** 2 + 3 * (scaled_y - y2) ** 2
+
+    bins = pd.DataFrame({
+        'x': np.where(on_first_grid, x1, x2) * x_step + x_min,
+        'y': np.where(on_first_grid, y1, y2) * y_step + y_min,
+        'value': df[value].to_numpy(dtype=float),
+    })
+    return bins.groupby(['x', 'y'], sort=False).agg(count=('value', 'size'), value=('value', 'mean')).reset_index()
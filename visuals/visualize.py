@@ -1,13 +1,141 @@
+import os
+
+import numpy as np
 import plotly.graph_objects as go
 import streamlit as st
 
-def VISUALIZE(summaries, dfs):
+from visuals import lod
+
+# Response layers with more points than this are drawn at a lower level of detail in 'auto' mode
+LOD_MAX_POINTS = int(os.environ.get('SURVEY_LOD_MAX_POINTS', 20000))
+
+# Hexagons across the x range of a hex-binned layer, and their marker size in pixels
+HEXBIN_GRIDSIZE = 60
+HEXBIN_MARKER_SIZE = 16
+
+LOD_MODES = ('auto', 'full', 'sample', 'hexbin')
+
+# Decimals kept in per-response coordinates and colors; a thousandth of the UMAP range is well
+# below a pixel, and short numbers make the figure several times smaller
+POINT_DECIMALS = 3
+
+# Figures kept for reruns, e.g. the current run at two levels of detail and a reopened saved run
+FIGURE_CACHE_ENTRIES = 8
+
+
+def resolve_lod(n_points, mode='auto', max_points=LOD_MAX_POINTS):
+    """
+    Returns the level of detail used for a layer of n_points responses: 'full', 'sample' or 'hexbin'.
+    'auto' draws every response up to max_points and a sample of them beyond.
+    """
+    if mode not in LOD_MODES:
+        raise ValueError(f"Level of detail must be one of {', '.join(LOD_MODES)}.")
+    if mode == 'auto':
+        return 'sample' if n_points > max_points else 'full'
+    return mode
+
+
+def compact(values, decimals=POINT_DECIMALS):
+    """
+    Returns values as a rounded float64 array, which serializes to short JSON numbers. float32
+    is avoided because Plotly's JSON encoder writes it with long reprs unless orjson is installed.
+    """
+    return np.round(np.asarray(values, dtype=float), decimals)
+
+
+def points_trace(df, name, colorscale, mode='auto', max_points=LOD_MAX_POINTS, gridsize=HEXBIN_GRIDSIZE):
+    """
+    Builds the WebGL layer of individual responses for one view, downsampled or hex-binned
+    according to the level of detail. Colors use the 'Normalized_Polarity' of the full data,
+    so they do not shift when only part of it is drawn.
+    """
+    mode = resolve_lod(len(df), mode, max_points)
+
+    if mode == 'hexbin':
+        bins = lod.hexbin(df, 'Normalized_Polarity', gridsize=gridsize)
+        return go.Scattergl(
+            x=compact(bins['x']),
+            y=compact(bins['y']),
+            mode='markers',
+            marker=dict(
+                symbol='hexagon',
+                size=HEXBIN_MARKER_SIZE,
+                color=compact(bins['value']),
+                colorscale=colorscale,
+                opacity=0.8,
+            ),
+            name=name,
+            visible=False,
+            hovertext="<b>Responses:</b> " + bins['count'].astype(str),
+            hoverinfo="text"
+        )
+
+    if mode == 'sample':
+        df = lod.downsample(df, max_points)
+
+    # The hover label is added by the browser, so each response is sent without it
+    return go.Scattergl(
+        x=compact(df['Umap_1']),
+        y=compact(df['Umap_2']),
+        mode='markers',
+        marker=dict(
+            size=5,
+            color=compact(df['Normalized_Polarity']),  # Color scale based on polarity
+            colorscale=colorscale,
+            opacity=0.8,
+        ),
+        name=name,
+        visible=False,
+        text=df['responses'],
+        hovertemplate="<b>Response:</b> %{text}<extra></extra>"
+    )
+
+
+@st.cache_resource(show_spinner=False, max_entries=FIGURE_CACHE_ENTRIES)
+def cached_figure(run_key, lod_mode, _summaries, _dfs):
+    """
+    Builds the figure of a saved run once per level of detail. The run key identifies the data,
+    which is not hashed, so widget reruns only send the cached figure again. The figure is
+    shared by every session and must not be modified.
+    """
+    return build_figure(_summaries, _dfs, lod_mode)
+
+
+def VISUALIZE(summaries, dfs, lod_mode='auto', run_key=None):
     """
     Visualizes processed data, clusters, and their summaries using Plotly.
 
     Parameters:
         summaries (dict): Contains summary information for positive, negative, and all topic clusters.
         dataframes (dict): Contains processed DataFrames, including positive, negative, and overall clusters.
+        lod_mode (str): Level of detail of the response layers, see resolve_lod.
+        run_key (str, optional): ID of the saved run the data comes from, to reuse its figure across reruns.
+                                 Without it, e.g. for partial results, the figure is rebuilt every time.
+    """
+    if run_key is None:
+        fig = build_figure(summaries, dfs, lod_mode)
+    else:
+        fig = cached_figure(run_key, lod_mode, summaries, dfs)
+
+    # Say when the response layers do not show every response
+    largest = max(len(dfs['positive_processed_df']), len(dfs['negative_processed_df']))
+    mode = resolve_lod(largest, lod_mode)
+    if mode == 'sample':
+        st.caption(f"Large views show a sample of {LOD_MAX_POINTS:,} responses; cluster markers use all of them.")
+    elif mode == 'hexbin':
+        st.caption("Responses are grouped into hexagons; hover over one to see how many it holds.")
+
+    # Show the plot
+    st.plotly_chart(fig, use_container_width=True)
+
+
+def build_figure(summaries, dfs, lod_mode='auto'):
+    """
+    Builds the Plotly figure of the clusters and their summaries. Response layers are drawn with
+    WebGL and reduced according to lod_mode; cluster markers are always exact.
+
+    Every response is sent once, in the layer of its sentiment, and the menu switches between
+    views in the browser by toggling which layers are visible.
     """
 
     if not summaries or not dfs:
@@ -19,60 +147,49 @@ def VISUALIZE(summaries, dfs):
     if not all(key in dfs for key in ['positive_processed_df', 'negative_processed_df', 'processed_df']):
         raise ValueError("Dataframes must contain keys for positive, negative, and overall processed DataFrames.")
 
-    # Extract processed DataFrames
-    positive_processed_df = dfs['positive_processed_df']
-    negative_processed_df = dfs['negative_processed_df']
+    # The inputs are shared with the session and the figure cache, so derived columns are
+    # added to copies with assign rather than to the DataFrames themselves
     processed_df = dfs['processed_df']
-
-    # Extract cluster summaries
-    positive_cluster_summary = summaries['positive_cluster_summary']
-    negative_cluster_summary = summaries['negative_cluster_summary']
     cluster_summary = summaries['cluster_summary']
+    total_points = processed_df.shape[0]
 
     # Calculate sizes for cluster centroids
     num_total_clusters = cluster_summary['cluster'].nunique()
     base_size_factor = max(1000, num_total_clusters* 75 )  
-    positive_cluster_summary['Size'] = (positive_cluster_summary['count'] ** 0.5) / (cluster_summary['count'].max() ** 0.5) * base_size_factor / num_total_clusters
-    negative_cluster_summary['Size'] = (negative_cluster_summary['count'] ** 0.5) / (cluster_summary['count'].max() ** 0.5) * base_size_factor / num_total_clusters
-    cluster_summary['Size'] = (cluster_summary['count'] ** 0.5) / (cluster_summary['count'].max() ** 0.5) * base_size_factor / num_total_clusters
+
+    def size(summary):
+        return (summary['count'] ** 0.5) / (cluster_summary['count'].max() ** 0.5) * base_size_factor / num_total_clusters
 
     # Calculate percentage of points in each cluster
-    total_points = processed_df.shape[0]
-    positive_cluster_summary['Percentage'] = ((positive_cluster_summary['count'] / total_points) * 100).round()
-    negative_cluster_summary['Percentage'] = ((negative_cluster_summary['count'] / total_points) * 100).round()
-    cluster_summary['Percentage'] = ((cluster_summary['count'] / total_points) * 100).round()
+    def percentage(summary):
+        return ((summary['count'] / total_points) * 100).round()
 
     # Normalize polarity values for coloring
-    positive_processed_df['Normalized_Polarity'] = (positive_processed_df['polarity'] - positive_processed_df['polarity'].min()) / (positive_processed_df['polarity'].max() - positive_processed_df['polarity'].min())
-    negative_processed_df['Normalized_Polarity'] = ((negative_processed_df['polarity'] - negative_processed_df['polarity'].min()) / (negative_processed_df['polarity'].max() - negative_processed_df['polarity'].min())) * -1
-    processed_df['Normalized_Polarity'] = (processed_df['polarity'] - processed_df['polarity'].min()) / (processed_df['polarity'].max() - processed_df['polarity'].min())
-    
-    positive_cluster_summary['Normalized_Polarity'] = (positive_cluster_summary['Polarity'] - positive_cluster_summary['Polarity'].min()) / (positive_cluster_summary['Polarity'].max() - positive_cluster_summary['Polarity'].min())
-    negative_cluster_summary['Normalized_Polarity'] = ((negative_cluster_summary['Polarity'] - negative_cluster_summary['Polarity'].min()) / (negative_cluster_summary['Polarity'].max() - negative_cluster_summary['Polarity'].min())) * -1
-    cluster_summary['Normalized_Polarity'] = 2 * ((cluster_summary['Polarity'] - cluster_summary['Polarity'].min()) /
-                                              (cluster_summary['Polarity'].max() - cluster_summary['Polarity'].min())) - 1
+    def normalized(values):
+        return (values - values.min()) / (values.max() - values.min())
 
+    positive_processed_df = dfs['positive_processed_df'][['Umap_1', 'Umap_2', 'cluster', 'responses']].assign(
+        Normalized_Polarity=normalized(dfs['positive_processed_df']['polarity'])
+    )
+    negative_processed_df = dfs['negative_processed_df'][['Umap_1', 'Umap_2', 'cluster', 'responses']].assign(
+        Normalized_Polarity=normalized(dfs['negative_processed_df']['polarity']) * -1
+    )
 
+    positive_cluster_summary = summaries['positive_cluster_summary'].assign(
+        Size=size, Percentage=percentage, Normalized_Polarity=lambda summary: normalized(summary['Polarity'])
+    )
+    negative_cluster_summary = summaries['negative_cluster_summary'].assign(
+        Size=size, Percentage=percentage, Normalized_Polarity=lambda summary: normalized(summary['Polarity']) * -1
+    )
+    cluster_summary = cluster_summary.assign(
+        Size=size, Percentage=percentage, Normalized_Polarity=lambda summary: 2 * normalized(summary['Polarity']) - 1
+    )
 
     # Initialize a Plotly figure
     fig = go.Figure()
 
-    # Add positive responses (individual points)
-    fig.add_trace(go.Scatter(
-        x=positive_processed_df['Umap_1'],
-        y=positive_processed_df['Umap_2'],
-        mode='markers',
-        marker=dict(
-            size=5,
-            color=positive_processed_df['Normalized_Polarity'],  # Color scale based on polarity
-            colorscale='Blues',  # Blue color scale for positive responses
-            opacity=0.8,
-        ),
-        name='Positive Responses',
-        visible=False,
-        hovertext=positive_processed_df['responses'].apply(lambda x: f"<b>Response:</b> {x}"),
-        hoverinfo="text"
-    ))
+    # Add positive responses (individual points), with a blue color scale
+    fig.add_trace(points_trace(positive_processed_df, 'Positive Responses', 'Blues', lod_mode))
 
     # Add positive cluster centroids
     fig.add_trace(go.Scatter(
@@ -97,22 +214,8 @@ def VISUALIZE(summaries, dfs):
         visible=False
     ))
 
-    # Add negative responses (individual points)
-    fig.add_trace(go.Scatter(
-        x=negative_processed_df['Umap_1'],
-        y=negative_processed_df['Umap_2'],
-        mode='markers',
-        marker=dict(
-            size=5,
-            color=negative_processed_df['Normalized_Polarity'],  # Color scale based on polarity
-            colorscale='Reds',  # Red color scale for negative responses
-            opacity=0.8,
-        ),
-        name='Negative Responses',
-        visible=False,
-        hovertext=negative_processed_df['responses'].apply(lambda x: f"<b>Response:</b> {x}"),
-        hoverinfo="text"
-    ))
+    # Add negative responses (individual points), with a red color scale
+    fig.add_trace(points_trace(negative_processed_df, 'Negative Responses', 'Reds', lod_mode))
 
     # Add negative cluster centroids
     fig.add_trace(go.Scatter(
@@ -170,7 +273,7 @@ def VISUALIZE(summaries, dfs):
                         label="Topic Clusters",
                         method="update",
                         args=[
-                            {"visible": [False, False, False, False, True, True]},
+                            {"visible": [False, False, False, False, True]},
                             {"title": "All Topic Clusters"}
                         ]
                     ),
@@ -178,7 +281,7 @@ def VISUALIZE(summaries, dfs):
                         label="Positive Topic Clusters",
                         method="update",
                         args=[
-                            {"visible": [True, True, False, False, False, False]},
+                            {"visible": [True, True, False, False, False]},
                             {"title": "Positive Topic Clusters"}
                         ]
                     ),
@@ -186,7 +289,7 @@ def VISUALIZE(summaries, dfs):
                         label="Negative Topic Clusters",
                         method="update",
                         args=[
-                            {"visible": [False, False, True, True, False, False]},
+                            {"visible": [False, False, True, True, False]},
                             {"title": "Negative Topic Clusters"}
                         ]
                     )
@@ -224,5 +327,4 @@ def VISUALIZE(summaries, dfs):
         title="Topic Clusters"
     )
 
-    # Show the plot
-    st.plotly_chart(fig, use_container_width=True)
\ No newline at end of file
+    return fig